@@ -3,12 +3,11 @@
 import { useState, useEffect } from 'react'
 import { useRouter } from 'next/navigation'
 import Link from 'next/link'
-import { apiService, DashboardStats, Patient } from '../../../services/api'
+import { apiService, DashboardStats } from '../../../services/api'
 import AdminNavigation from '../../../components/AdminNavigation'
 
 export default function AdminDashboard() {
   const [stats, setStats] = useState<DashboardStats | null>(null)
-  const [patients, setPatients] = useState<Patient[]>([])
   const [loading, setLoading] = useState(true)
   const [activeTab, setActiveTab] = useState('dashboard')
   const [error, setError] = useState('')
@@ -38,14 +37,9 @@ export default function AdminDashboard() {
       setLoading(true)
       setError('')
 
-      // Load stats and patients in parallel
-      const [statsData, patientsData] = await Promise.all([
-        apiService.getDashboardStats(),
-        apiService.getPatients()
-      ])
-
+      // The totals come from the stats counters; the patient list lives on its own paged page
+      const statsData = await apiService.getDashboardStats()
       setStats(statsData)
-      setPatients(patientsData)
     } catch (error) {
       console.error('Error loading dashboard data:', error)
       setError('Failed to load dashboard data. Please try again.')
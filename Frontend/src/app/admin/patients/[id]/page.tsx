@@ -54,8 +54,14 @@ export default function PatientDetailPage() {
   const generateReport = async () => {
     try {
       const response = await apiService.generateReport({ patient_id: patientId })
-      if (response.success) {
-        alert('Report generated successfully!')
+      if (response.success && response.data) {
+        // The PDF is built in the background; wait for it before reloading the list
+        const statusResp = await apiService.waitForReport(response.data.report_id)
+        if (statusResp.success && statusResp.data?.status === 'ready') {
+          alert('Report generated successfully!')
+        } else {
+          alert('Failed to generate report: ' + (statusResp.data?.error || statusResp.error || 'report is still pending'))
+        }
         loadPatientData() // Reload to get updated reports
       } else {
         alert('Failed to generate report: ' + response.error)
@@ -414,56 +420,62 @@ export default function PatientDetailPage() {
                               <h4 className="font-medium text-gray-900">Report {report.report_id}</h4>
                               <p className="text-sm text-gray-500">Generated: {formatDate(report.created_at)}</p>
                             </div>
-                            <a
-                              href="#"
-                              onClick={async (e) => {
-                                e.preventDefault();
-                                let baseUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000';
-                                if (baseUrl.endsWith('/api/')) baseUrl = baseUrl.slice(0, -4);
-                                else if (baseUrl.endsWith('/api')) baseUrl = baseUrl.slice(0, -3);
-                                if (baseUrl.endsWith('/')) baseUrl = baseUrl.slice(0, -1);
-                                const filename = report.report_path.split('/').pop();
-                                const apiUrl = `${baseUrl}/api/report/download-by-filename/${filename}`;
-                                const response = await fetch(apiUrl);
-                                const data = await response.json();
-                                if (data.success && data.download_url) {
-                                  if (data.download_url.startsWith('http')) {
-                                    const a = document.createElement('a');
-                                    a.href = data.download_url;
-                                    a.target = '_blank';
-                                    a.rel = 'noopener noreferrer';
-                                    a.download = filename;
-                                    document.body.appendChild(a);
-                                    a.click();
-                                    document.body.removeChild(a);
-                                  } else {
-                                    let fileUrl = `${baseUrl}${data.download_url}`;
-                                    fileUrl = fileUrl.replace(/([^:]\/)\/+/, '$1');
-                                    const fileResponse = await fetch(fileUrl);
-                                    if (fileResponse.ok) {
-                                      const blob = await fileResponse.blob();
-                                      const url = window.URL.createObjectURL(blob);
+                            {report.report_path ? (
+                              <a
+                                href="#"
+                                onClick={async (e) => {
+                                  e.preventDefault();
+                                  let baseUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000';
+                                  if (baseUrl.endsWith('/api/')) baseUrl = baseUrl.slice(0, -4);
+                                  else if (baseUrl.endsWith('/api')) baseUrl = baseUrl.slice(0, -3);
+                                  if (baseUrl.endsWith('/')) baseUrl = baseUrl.slice(0, -1);
+                                  const filename = (report.report_path || '').split('/').pop();
+                                  const apiUrl = `${baseUrl}/api/report/download-by-filename/${filename}`;
+                                  const response = await fetch(apiUrl);
+                                  const data = await response.json();
+                                  if (data.success && data.download_url) {
+                                    if (data.download_url.startsWith('http')) {
                                       const a = document.createElement('a');
-                                      a.href = url;
+                                      a.href = data.download_url;
+                                      a.target = '_blank';
+                                      a.rel = 'noopener noreferrer';
                                       a.download = filename;
                                       document.body.appendChild(a);
                                       a.click();
-                                      window.URL.revokeObjectURL(url);
                                       document.body.removeChild(a);
                                     } else {
-                                      alert('Failed to download report file');
+                                      let fileUrl = `${baseUrl}${data.download_url}`;
+                                      fileUrl = fileUrl.replace(/([^:]\/)\/+/, '$1');
+                                      const fileResponse = await fetch(fileUrl);
+                                      if (fileResponse.ok) {
+                                        const blob = await fileResponse.blob();
+                                        const url = window.URL.createObjectURL(blob);
+                                        const a = document.createElement('a');
+                                        a.href = url;
+                                        a.download = filename;
+                                        document.body.appendChild(a);
+                                        a.click();
+                                        window.URL.revokeObjectURL(url);
+                                        document.body.removeChild(a);
+                                      } else {
+                                        alert('Failed to download report file');
+                                      }
                                     }
+                                  } else {
+                                    alert('Report not found');
                                   }
-                                } else {
-                                  alert('Report not found');
-                                }
-                              }}
-                              target="_blank"
-                              rel="noopener noreferrer"
-                              className="bg-indigo-600 text-white px-3 py-1 rounded-md hover:bg-indigo-700 text-sm"
-                            >
-                              Download PDF
-                            </a>
+                                }}
+                                target="_blank"
+                                rel="noopener noreferrer"
+                                className="bg-indigo-600 text-white px-3 py-1 rounded-md hover:bg-indigo-700 text-sm"
+                              >
+                                Download PDF
+                              </a>
+                            ) : (
+                              <span className={`text-sm ${report.status === 'failed' ? 'text-red-600' : 'text-gray-500'}`}>
+                                {report.status === 'failed' ? 'Generation failed' : 'Generating PDF...'}
+                              </span>
+                            )}
                           </div>
                           
                           <div className="mt-3 grid grid-cols-3 gap-4 text-sm">
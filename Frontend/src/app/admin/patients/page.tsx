@@ -1,18 +1,23 @@
 'use client'
 
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import Link from 'next/link'
 import { apiService, Patient } from '../../../services/api'
 import AdminNavigation from '../../../components/AdminNavigation'
 
+const PAGE_SIZE = 50
+
 export default function PatientsPage() {
   const [patients, setPatients] = useState<Patient[]>([])
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [error, setError] = useState('')
   const [selectedPatient, setSelectedPatient] = useState<Patient | null>(null)
   const [showDetails, setShowDetails] = useState(false)
   const [searchTerm, setSearchTerm] = useState('')
   const [mounted, setMounted] = useState(false)
+  const latestRequest = useRef(0)
 
   useEffect(() => {
     setMounted(true)
@@ -31,15 +36,28 @@ export default function PatientsPage() {
     loadPatients()
   }, [mounted])
 
-  const loadPatients = async () => {
+  // Search runs on the server, so a new term starts again from the first page
+  useEffect(() => {
+    if (!mounted) return
+    const timer = setTimeout(() => loadPatients(), 300)
+    return () => clearTimeout(timer)
+  }, [searchTerm])
+
+  // Without a cursor the list is replaced, with one the next page is appended
+  const loadPatients = async (cursor?: string) => {
+    const request = ++latestRequest.current
     try {
-      setLoading(true)
-      const data = await apiService.getPatients()
-      setPatients(data)
+      if (cursor) setLoadingMore(true)
+      const page = await apiService.getPatientsPage({ limit: PAGE_SIZE, cursor, search: searchTerm.trim() })
+      if (request !== latestRequest.current) return
+      const data = page.data || []
+      setPatients(previous => cursor ? [...previous, ...data] : data)
+      setNextCursor(page.next_cursor || null)
     } catch (err: any) {
       setError(apiService.handleApiError(err))
     } finally {
       setLoading(false)
+      setLoadingMore(false)
     }
   }
 
@@ -57,12 +75,6 @@ export default function PatientsPage() {
     return new Date(dateString).toLocaleDateString()
   }
 
-  const filteredPatients = patients.filter(patient =>
-    patient.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    patient.email.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    patient.patient_id.toLowerCase().includes(searchTerm.toLowerCase())
-  )
-
   if (!mounted || loading) {
     return (
       <div className="min-h-screen bg-gradient-to-br from-blue-50 via-indigo-50 to-purple-50 flex items-center justify-center">
@@ -139,11 +151,11 @@ export default function PatientsPage() {
                   />
                 </div>
                 <div className="text-sm text-gray-600">
-                  {filteredPatients.length} of {patients.length} patients
+                  {patients.length} patients{nextCursor ? ' loaded, more available' : ''}
                 </div>
               </div>
               <button
-                onClick={loadPatients}
+                onClick={() => loadPatients()}
                 className="inline-flex items-center space-x-2 text-indigo-600 hover:text-indigo-700 font-medium transition-colors"
               >
                 <svg className="h-4 w-4" fill="none" viewBox="0 0 24 24" stroke="currentColor">
@@ -156,7 +168,7 @@ export default function PatientsPage() {
 
           {/* Patients List */}
           <div className="bg-white/80 backdrop-blur-sm rounded-2xl shadow-lg border border-gray-200/50 overflow-hidden">
-            {filteredPatients.length === 0 ? (
+            {patients.length === 0 ? (
               <div className="text-center py-16">
                 <div className="mx-auto h-16 w-16 bg-gradient-to-r from-indigo-100 to-purple-100 rounded-full flex items-center justify-center mb-4">
                   <svg className="h-8 w-8 text-indigo-600" fill="none" viewBox="0 0 24 24" stroke="currentColor">
@@ -207,7 +219,7 @@ export default function PatientsPage() {
                     </tr>
                   </thead>
                   <tbody className="bg-white/50 divide-y divide-gray-200/50">
-                    {filteredPatients.map((patient) => (
+                    {patients.map((patient) => (
                       <tr key={patient.id} className="hover:bg-gray-50/50 transition-colors duration-200">
                         <td className="px-6 py-4 whitespace-nowrap">
                           <div className="flex items-center">
@@ -269,6 +281,17 @@ export default function PatientsPage() {
                     ))}
                   </tbody>
                 </table>
+                {nextCursor && (
+                  <div className="px-6 py-4 border-t border-gray-200/50 text-center">
+                    <button
+                      onClick={() => loadPatients(nextCursor)}
+                      disabled={loadingMore}
+                      className="inline-flex items-center space-x-2 text-indigo-600 hover:text-indigo-700 font-medium transition-colors disabled:opacity-50 disabled:cursor-not-allowed"
+                    >
+                      <span>{loadingMore ? 'Loading...' : 'Load more patients'}</span>
+                    </button>
+                  </div>
+                )}
               </div>
             )}
           </div>
@@ -1,11 +1,13 @@
 'use client'
 
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { useRouter } from 'next/navigation'
 import Link from 'next/link'
-import { apiService, Patient, UploadScanResponse } from '@/services/api'
+import { apiService, Patient, Study, UploadScanResponse } from '@/services/api'
 import AdminNavigation from '@/components/AdminNavigation'
 
+const PATIENT_PAGE_SIZE = 50
+
 interface ScanResult {
   success: boolean
   filename: string
@@ -22,11 +24,18 @@ interface ScanResult {
 export default function UploadScansPage() {
   const [patients, setPatients] = useState<Patient[]>([])
   const [selectedPatient, setSelectedPatient] = useState<number | string>('')
+  const [patientSearch, setPatientSearch] = useState('')
+  const [patientsCursor, setPatientsCursor] = useState<string | null>(null)
+  const [loadingPatients, setLoadingPatients] = useState(false)
+  const [chosenPatient, setChosenPatient] = useState<Patient | null>(null)
+  const latestPatientsRequest = useRef(0)
   const [selectedFiles, setSelectedFiles] = useState<File[]>([])
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState('')
   const [results, setResults] = useState<ScanResult[]>([])
   const [showResults, setShowResults] = useState(false)
+  const [studyMode, setStudyMode] = useState(false)
+  const [study, setStudy] = useState<Study | null>(null)
   const [reportGenerated, setReportGenerated] = useState(false)
   const [reportData, setReportData] = useState<any>(null)
   const [generatingReport, setGeneratingReport] = useState(false)
@@ -50,15 +59,40 @@ export default function UploadScansPage() {
     loadPatients()
   }, [mounted])
 
-  const loadPatients = async () => {
+  // The picker searches on the server rather than loading every patient up front
+  useEffect(() => {
+    if (!mounted) return
+    const timer = setTimeout(() => loadPatients(), 300)
+    return () => clearTimeout(timer)
+  }, [patientSearch])
+
+  // Without a cursor the options are replaced, with one the next page is appended
+  const loadPatients = async (cursor?: string) => {
+    const request = ++latestPatientsRequest.current
     try {
-      const data = await apiService.getPatients()
-      setPatients(data)
+      setLoadingPatients(true)
+      const page = await apiService.getPatientsPage({ limit: PATIENT_PAGE_SIZE, cursor, search: patientSearch.trim() })
+      if (request !== latestPatientsRequest.current) return
+      const data = page.data || []
+      setPatients(previous => cursor ? [...previous, ...data] : data)
+      setPatientsCursor(page.next_cursor || null)
     } catch (err: any) {
       setError(apiService.handleApiError(err))
+    } finally {
+      setLoadingPatients(false)
     }
   }
 
+  const handlePatientSelect = (value: string) => {
+    setSelectedPatient(value)
+    setChosenPatient(patients.find((patient) => String(patient.id) === value) || null)
+  }
+
+  // Keep the chosen patient in the list when a later search leaves it out
+  const patientOptions = chosenPatient && !patients.some((patient) => patient.id === chosenPatient.id)
+    ? [chosenPatient, ...patients]
+    : patients
+
   const handleFileSelect = (e: React.ChangeEvent<HTMLInputElement>) => {
     if (e.target.files) {
       const files = Array.from(e.target.files)
@@ -66,6 +100,25 @@ export default function UploadScansPage() {
     }
   }
 
+  const trackReport = async (queuedReport: NonNullable<UploadScanResponse['report_data']>) => {
+    setGeneratingReport(true)
+    try {
+      const statusResp = await apiService.waitForReport(queuedReport.report_id)
+      if (statusResp.success && statusResp.data?.status === 'ready') {
+        setReportGenerated(true)
+        setReportData({ ...queuedReport, status: 'ready', report_url: statusResp.data.report_path })
+      } else {
+        setReportGenerated(false)
+        setReportData(null)
+        setError('Failed to generate report: ' + (statusResp.data?.error || statusResp.error || 'report is still pending'))
+      }
+    } catch (err: any) {
+      setError(apiService.handleApiError(err))
+    } finally {
+      setGeneratingReport(false)
+    }
+  }
+
   const handleUpload = async () => {
     if (!selectedPatient || selectedFiles.length === 0) {
       setError('Please select a patient and files')
@@ -74,37 +127,53 @@ export default function UploadScansPage() {
 
     setLoading(true)
     setError('')
+    setStudy(null)
 
     try {
-      const response: UploadScanResponse = await apiService.uploadScans(Number(selectedPatient), selectedFiles)
+      if (studyMode) {
+        // One study score for the series; only its most suspicious slices come back as results
+        const studyResponse = await apiService.uploadStudy(Number(selectedPatient), selectedFiles)
+        if (studyResponse.success && studyResponse.data && studyResponse.results) {
+          setStudy(studyResponse.data)
+          setResults(studyResponse.results)
+          setShowResults(true)
+          if (studyResponse.report_queued && studyResponse.report_data) {
+            trackReport(studyResponse.report_data)
+          }
+        } else {
+          setError(studyResponse.error || 'Upload failed')
+        }
+        return
+      }
+
+      // Show each scan as soon as it is analysed instead of after the whole batch
+      const response: UploadScanResponse = await apiService.uploadScansStream(
+        Number(selectedPatient),
+        selectedFiles,
+        (index, result) => {
+          setResults((previous) => {
+            const next = [...previous]
+            next[index] = result
+            return next
+          })
+          setShowResults(true)
+        }
+      )
       
       if (response.success && response.results) {
         setResults(response.results)
         setShowResults(true)
         
-        // If report was generated in upload response, use it
-        if (response.report_generated && response.report_data) {
-          setReportGenerated(true)
-          setReportData(response.report_data)
+        // The PDF report is generated in the background; show the scans now and poll for it
+        if (response.report_queued && response.report_data) {
+          trackReport(response.report_data)
         } else {
-          // Otherwise, trigger report generation now
-          setGeneratingReport(true)
-          const reportResp = await apiService.generateReport({ patient_id: selectedPatient, scan_ids: response.scan_ids })
-          setGeneratingReport(false)
-          if (reportResp.success && reportResp.data) {
-            setReportGenerated(true)
-            setReportData({
-              report_id: reportResp.data.report_id,
-              report_url: reportResp.data.report_path,
-            })
-          } else {
-            setReportGenerated(false)
-            setReportData(null)
-            setError('Failed to generate report after scan upload.')
-          }
+          setReportGenerated(false)
+          setReportData(null)
+          setError('Failed to queue report after scan upload.')
         }
       } else {
-        setError('Upload failed')
+        setError(response.error || 'Upload failed')
       }
     } catch (err: any) {
       setError(apiService.handleApiError(err))
@@ -115,9 +184,11 @@ export default function UploadScansPage() {
 
   const resetForm = () => {
     setSelectedPatient('')
+    setChosenPatient(null)
     setSelectedFiles([])
     setResults([])
     setShowResults(false)
+    setStudy(null)
     setReportGenerated(false)
     setReportData(null)
     setError('')
@@ -213,19 +284,36 @@ export default function UploadScansPage() {
                     <label className="block text-sm font-medium text-gray-700 mb-2">
                       Select Patient *
                     </label>
+                    <input
+                      type="text"
+                      placeholder="Search by name, email or patient ID..."
+                      value={patientSearch}
+                      onChange={(e) => setPatientSearch(e.target.value)}
+                      className="w-full mb-3 px-4 py-2 border border-gray-300 rounded-xl text-gray-900 placeholder-gray-500 focus:outline-none focus:ring-2 focus:ring-indigo-500 focus:border-indigo-500 transition-all duration-200"
+                    />
                     <select
                       value={selectedPatient}
-                      onChange={(e) => setSelectedPatient(e.target.value)}
+                      onChange={(e) => handlePatientSelect(e.target.value)}
                       className="w-full px-4 py-3 border border-gray-300 rounded-xl text-gray-900 focus:outline-none focus:ring-2 focus:ring-indigo-500 focus:border-indigo-500 transition-all duration-200"
                       required
                     >
                       <option value="">Choose a patient...</option>
-                      {patients.map((patient) => (
+                      {patientOptions.map((patient) => (
                         <option key={patient.id} value={patient.id}>
                           {patient.name} ({patient.patient_id})
                         </option>
                       ))}
                     </select>
+                    {patientsCursor && (
+                      <button
+                        type="button"
+                        onClick={() => loadPatients(patientsCursor)}
+                        disabled={loadingPatients}
+                        className="mt-2 text-sm text-indigo-600 hover:text-indigo-700 font-medium transition-colors disabled:opacity-50 disabled:cursor-not-allowed"
+                      >
+                        {loadingPatients ? 'Loading...' : 'Load more patients'}
+                      </button>
+                    )}
                   </div>
 
                   {/* File Upload */}
@@ -269,6 +357,23 @@ export default function UploadScansPage() {
                     </div>
                   )}
 
+                  {/* Study Mode */}
+                  <div className="flex items-start space-x-3">
+                    <input
+                      type="checkbox"
+                      id="studyMode"
+                      checked={studyMode}
+                      onChange={(e) => setStudyMode(e.target.checked)}
+                      className="mt-1 h-4 w-4 text-indigo-600 border-gray-300 rounded focus:ring-indigo-500"
+                    />
+                    <label htmlFor="studyMode" className="text-sm text-gray-700">
+                      <span className="font-medium">Analyze as one series</span>
+                      <span className="block text-gray-500">
+                        Scores the files as slices of a single study and shows heatmaps for the most suspicious slices only
+                      </span>
+                    </label>
+                  </div>
+
                   {/* Upload Button */}
                   <div className="flex justify-end space-x-4">
                     <button
@@ -305,6 +410,14 @@ export default function UploadScansPage() {
             </div>
           ) : (
             <div className="space-y-6">
+              {loading && (
+                <div className="bg-indigo-50 border border-indigo-200 rounded-xl p-6 text-center">
+                  <div className="text-indigo-800">
+                    Analyzing... {results.filter(Boolean).length} of {selectedFiles.length} files done
+                  </div>
+                </div>
+              )}
+
               {/* Report Download Section */}
               {generatingReport && (
                 <div className="bg-yellow-50 border border-yellow-200 rounded-xl p-6 text-center">
@@ -389,12 +502,26 @@ export default function UploadScansPage() {
                 </div>
               )}
 
+              {/* Study Summary */}
+              {study && (
+                <div className={`rounded-xl p-6 border ${study.prediction === 'Tumor' ? 'bg-red-50 border-red-200' : 'bg-green-50 border-green-200'}`}>
+                  <h3 className={`text-lg font-medium ${study.prediction === 'Tumor' ? 'text-red-800' : 'text-green-800'}`}>
+                    Study {study.study_id}: {study.prediction}
+                  </h3>
+                  <p className="text-gray-700 mt-1">
+                    Study score {(study.probability * 100).toFixed(1)}% ({study.aggregation}) over {study.analysed_slices} of {study.slice_count} slices.
+                    Showing the {results.length} most suspicious slices.
+                  </p>
+                </div>
+              )}
+
               {/* Results Header */}
               <div className="bg-white/80 backdrop-blur-sm rounded-2xl shadow-lg border border-gray-200/50 p-6">
                 <div className="flex justify-between items-center">
                   <h2 className="text-xl font-semibold text-gray-900">Analysis Results</h2>
                   <button
                     onClick={resetForm}
+                    disabled={loading}
                     className="inline-flex items-center space-x-2 bg-gradient-to-r from-indigo-600 to-purple-600 text-white px-4 py-2 rounded-xl hover:from-indigo-700 hover:to-purple-700 transition-all duration-200"
                   >
                     <svg className="h-4 w-4" fill="none" viewBox="0 0 24 24" stroke="currentColor">
@@ -406,7 +533,7 @@ export default function UploadScansPage() {
               </div>
 
               {/* Results */}
-              {results.map((result, index) => (
+              {results.map((result, index) => result && (
                 <div key={index} className="bg-white/80 backdrop-blur-sm rounded-2xl shadow-lg border border-gray-200/50 overflow-hidden">
                   {result.success ? (
                     <div className="p-8">
@@ -72,7 +72,12 @@ export default function PatientDashboard() {
     )
   }
 
-  const handleReportDownload = async (report: any) => {
+  // Pending and failed reports have no PDF yet; rows from before report statuses have none set
+  const isReportReady = (report: Report) =>
+    (report.status ?? 'ready') === 'ready' && !!report.report_path
+
+  const handleReportDownload = async (report: Report) => {
+    if (!isReportReady(report)) return
     try {
       let baseUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000';
       // Remove trailing /api or /api/ if present
@@ -80,7 +85,7 @@ export default function PatientDashboard() {
       else if (baseUrl.endsWith('/api')) baseUrl = baseUrl.slice(0, -3);
       // Remove trailing slash if present
       if (baseUrl.endsWith('/')) baseUrl = baseUrl.slice(0, -1);
-      const filename = report.report_path.split('/').pop();
+      const filename = report.report_path!.split('/').pop();
       // Always ensure exactly one slash between baseUrl and endpoint
       const apiUrl = `${baseUrl}/api/report/download-by-filename/${filename}`;
       const response = await fetch(apiUrl);
@@ -474,15 +479,21 @@ export default function PatientDashboard() {
                                 Generated on {new Date(report.created_at).toLocaleDateString()}
                               </p>
                             </div>
-                            <button
-                              onClick={() => handleReportDownload(report)}
-                              className="inline-flex items-center space-x-2 bg-gradient-to-r from-blue-600 to-cyan-600 text-white px-4 py-2 rounded-xl hover:from-blue-700 hover:to-cyan-700 transition-all duration-200 shadow-lg hover:shadow-xl"
-                            >
-                              <svg className="h-4 w-4" fill="none" viewBox="0 0 24 24" stroke="currentColor">
-                                <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M12 10v6m0 0l-3-3m3 3l3-3m2 8H7a2 2 0 01-2-2V5a2 2 0 012-2h5.586a1 1 0 01.707.293l5.414 5.414a1 1 0 01.293.707V19a2 2 0 01-2 2z" />
-                              </svg>
-                              <span>Download PDF</span>
-                            </button>
+                            {isReportReady(report) ? (
+                              <button
+                                onClick={() => handleReportDownload(report)}
+                                className="inline-flex items-center space-x-2 bg-gradient-to-r from-blue-600 to-cyan-600 text-white px-4 py-2 rounded-xl hover:from-blue-700 hover:to-cyan-700 transition-all duration-200 shadow-lg hover:shadow-xl"
+                              >
+                                <svg className="h-4 w-4" fill="none" viewBox="0 0 24 24" stroke="currentColor">
+                                  <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M12 10v6m0 0l-3-3m3 3l3-3m2 8H7a2 2 0 01-2-2V5a2 2 0 012-2h5.586a1 1 0 01.707.293l5.414 5.414a1 1 0 01.293.707V19a2 2 0 01-2 2z" />
+                                </svg>
+                                <span>Download PDF</span>
+                              </button>
+                            ) : (
+                              <span className={`text-sm ${report.status === 'failed' ? 'text-red-600' : 'text-gray-500'}`}>
+                                {report.status === 'failed' ? 'Generation failed' : 'Generating PDF...'}
+                              </span>
+                            )}
                           </div>
                         </div>
                       ))}
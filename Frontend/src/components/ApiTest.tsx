@@ -48,8 +48,8 @@ export default function ApiTest() {
 
       // Test 4: Get Patients
       try {
-        const patients = await apiService.getPatients()
-        addResult('Get Patients', true, { count: patients.length, patients })
+        const page = await apiService.getPatientsPage({ limit: 10 })
+        addResult('Get Patients', true, { count: page.data?.length || 0, patients: page.data, next_cursor: page.next_cursor })
       } catch (error: any) {
         addResult('Get Patients', false, null, apiService.handleApiError(error))
       }
@@ -72,16 +72,16 @@ export default function ApiTest() {
 
       // Test 6: Get Scans
       try {
-        const scans = await apiService.getScans()
-        addResult('Get Scans', true, { count: scans.length, scans })
+        const page = await apiService.getScansPage({ limit: 10 })
+        addResult('Get Scans', true, { count: page.data?.length || 0, scans: page.data, next_cursor: page.next_cursor })
       } catch (error: any) {
         addResult('Get Scans', false, null, apiService.handleApiError(error))
       }
 
       // Test 7: Get Reports
       try {
-        const reports = await apiService.getReports()
-        addResult('Get Reports', true, { count: reports.length, reports })
+        const page = await apiService.getReportsPage({ limit: 10 })
+        addResult('Get Reports', true, { count: page.data?.length || 0, reports: page.data, next_cursor: page.next_cursor })
       } catch (error: any) {
         addResult('Get Reports', false, null, apiService.handleApiError(error))
       }
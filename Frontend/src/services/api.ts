@@ -41,11 +41,14 @@ export interface Scan {
   created_at: string
 }
 
+export type ReportStatus = 'pending' | 'ready' | 'failed'
+
 export interface Report {
   id: number
   patient_id: number
   report_id: string
-  report_path: string
+  report_path: string | null
+  status?: ReportStatus
   scan_count: number
   tumor_count: number
   no_tumor_count: number
@@ -121,10 +124,11 @@ export interface AddPatientResponse {
 export interface UploadScanResponse {
   success: boolean
   scan_ids: string[]
-  report_generated?: boolean
+  report_queued?: boolean
   report_data?: {
     report_id: string
-    report_url: string
+    status: ReportStatus
+    report_url: string | null
     scan_count: number
     tumor_count: number
     no_tumor_count: number
@@ -139,8 +143,37 @@ export interface UploadScanResponse {
     original_image: string
     heatmap: string
     overlay: string
+    deduplicated?: boolean
     error?: string
   }[]
+  error?: string
+}
+
+export type UploadScanResult = NonNullable<UploadScanResponse['results']>[number]
+
+// Lines of a streamed (NDJSON) upload response: one 'file' per scan, then 'complete' or 'error'
+export type UploadScanEvent =
+  | { type: 'file'; index: number; result: UploadScanResult }
+  | { type: 'complete'; success: true; total_files: number; scan_ids: string[]; report_queued: boolean; report_data: UploadScanResponse['report_data'] | null }
+  // A streaming upload whose body broke off also reports the scans stored before that
+  | { type: 'error'; success: false; error: string; total_files?: number; scan_ids?: string[]; report_queued?: boolean; report_data?: UploadScanResponse['report_data'] | null }
+
+export interface Study {
+  study_id: string
+  slice_count: number
+  analysed_slices: number
+  aggregation: 'max' | 'mean' | 'topk_mean' | 'noisy_or'
+  top_k: number
+  prediction: string
+  confidence: number
+  probability: number
+  created_at: string
+}
+
+// Key slices of a study, most suspicious first
+export interface UploadStudyResponse extends UploadScanResponse {
+  data?: Study
+  results?: (UploadScanResult & { slice_index: number })[]
 }
 
 export interface GenerateReportRequest {
@@ -152,11 +185,45 @@ export interface GenerateReportResponse {
   success: boolean
   data?: {
     report_id: string
-    report_path: string
+    status: ReportStatus
+    scan_count: number
+    tumor_count: number
+    no_tumor_count: number
+  }
+  error?: string
+}
+
+export interface ReportStatusResponse {
+  success: boolean
+  data?: {
+    report_id: string
+    status: ReportStatus
+    report_path: string | null
+    scan_count: number
+    tumor_count: number
+    no_tumor_count: number
+    error?: string | null
   }
   error?: string
 }
 
+export interface ListParams {
+  limit?: number
+  cursor?: string
+  created_from?: string
+  created_to?: string
+  patient_id?: number
+  prediction?: string
+  search?: string
+}
+
+export interface PageResponse<T> {
+  success: boolean
+  data?: T[]
+  next_cursor?: string | null
+  error?: string
+}
+
 export interface HealthCheckResponse {
   status: string
   message: string
@@ -189,6 +256,17 @@ class ApiService {
     }
   }
 
+  private buildQuery(params: ListParams = {}): string {
+    const query = new URLSearchParams()
+    Object.entries(params).forEach(([key, value]) => {
+      if (value !== undefined && value !== null && value !== '') {
+        query.append(key, String(value))
+      }
+    })
+    const queryString = query.toString()
+    return queryString ? `?${queryString}` : ''
+  }
+
   // Health Check
   async healthCheck(): Promise<HealthCheckResponse> {
     return this.request('/health')
@@ -216,9 +294,9 @@ class ApiService {
     }
   }
 
-  async getPatients(): Promise<Patient[]> {
-    const response = await this.request<ApiResponse<Patient[]>>('/admin/patients')
-    return response.data || []
+  // List endpoints are paged; pass next_cursor back as cursor to fetch the following page
+  async getPatientsPage(params: ListParams = {}): Promise<PageResponse<Patient>> {
+    return this.request(`/admin/patients${this.buildQuery(params)}`)
   }
 
   async getAdminPatientById(patientId: number): Promise<Patient> {
@@ -243,9 +321,8 @@ class ApiService {
     })
   }
 
-  async getScans(): Promise<Scan[]> {
-    const response = await this.request<ApiResponse<Scan[]>>('/admin/scans')
-    return response.data || []
+  async getScansPage(params: ListParams = {}): Promise<PageResponse<Scan>> {
+    return this.request(`/admin/scans${this.buildQuery(params)}`)
   }
 
   async uploadScans(patientId: number, files: File[]): Promise<UploadScanResponse> {
@@ -263,9 +340,101 @@ class ApiService {
     })
   }
 
-  async getReports(): Promise<Report[]> {
-    const response = await this.request<ApiResponse<Report[]>>('/admin/reports')
-    return response.data || []
+  // Same upload, but onResult is called for each scan as soon as the server has analysed it
+  async uploadScansStream(
+    patientId: number,
+    files: File[],
+    onResult: (index: number, result: UploadScanResult) => void
+  ): Promise<UploadScanResponse> {
+    const formData = new FormData()
+    formData.append('patient_id', patientId.toString())
+
+    files.forEach((file) => {
+      formData.append('files', file)
+    })
+
+    const response = await fetch(`${API_BASE_URL}/admin/scans/upload?stream=ndjson`, {
+      method: 'POST',
+      body: formData,
+      credentials: 'include',
+    })
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+    // Requests rejected before any scan is read are answered with plain JSON
+    if (!response.body || !response.headers.get('Content-Type')?.includes('application/x-ndjson')) {
+      return response.json()
+    }
+
+    const results: UploadScanResult[] = []
+    let complete: Extract<UploadScanEvent, { type: 'complete' }> | null = null
+    const handleLine = (line: string) => {
+      const event: UploadScanEvent = JSON.parse(line)
+      if (event.type === 'file') {
+        results[event.index] = event.result
+        onResult(event.index, event.result)
+      } else if (event.type === 'complete') {
+        complete = event
+      } else {
+        throw new Error(event.error)
+      }
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffered = ''
+    while (true) {
+      const { done, value } = await reader.read()
+      buffered += decoder.decode(value, { stream: !done })
+      const lines = buffered.split('\n')
+      buffered = lines.pop() ?? ''
+      lines.filter((line) => line.trim()).forEach(handleLine)
+      if (done) break
+    }
+    if (buffered.trim()) {
+      handleLine(buffered)
+    }
+
+    const finished = complete as Extract<UploadScanEvent, { type: 'complete' }> | null
+    if (!finished) {
+      throw new Error('Upload ended before all scans were analysed')
+    }
+    return {
+      success: true,
+      scan_ids: finished.scan_ids,
+      results,
+      report_queued: finished.report_queued,
+      report_data: finished.report_data ?? undefined,
+    }
+  }
+
+  // Analyse all files as one series: a study score plus Grad-CAM for the top_k most suspicious slices
+  async uploadStudy(
+    patientId: number,
+    files: File[],
+    options: { aggregation?: Study['aggregation']; top_k?: number } = {}
+  ): Promise<UploadStudyResponse> {
+    const formData = new FormData()
+    formData.append('patient_id', patientId.toString())
+    Object.entries(options).forEach(([key, value]) => {
+      if (value !== undefined) {
+        formData.append(key, String(value))
+      }
+    })
+
+    files.forEach((file) => {
+      formData.append('files', file)
+    })
+
+    return this.request('/admin/studies/upload', {
+      method: 'POST',
+      body: formData,
+      headers: {}, // Let browser set Content-Type for FormData
+    })
+  }
+
+  async getReportsPage(params: ListParams = {}): Promise<PageResponse<Report>> {
+    return this.request(`/admin/reports${this.buildQuery(params)}`)
   }
 
   // Patient Endpoints
@@ -299,6 +468,22 @@ class ApiService {
     })
   }
 
+  async getReportStatus(reportId: string): Promise<ReportStatusResponse> {
+    return this.request(`/report/status/${reportId}`)
+  }
+
+  // Reports are generated in the background; poll until the PDF is ready or has failed
+  async waitForReport(reportId: string, intervalMs = 2000, timeoutMs = 120000): Promise<ReportStatusResponse> {
+    const deadline = Date.now() + timeoutMs
+    while (true) {
+      const response = await this.getReportStatus(reportId)
+      if (!response.success || response.data?.status !== 'pending' || Date.now() >= deadline) {
+        return response
+      }
+      await new Promise((resolve) => setTimeout(resolve, intervalMs))
+    }
+  }
+
   async downloadReport(reportId: string): Promise<{ success: boolean; download_url: string }> {
     const response = await this.request<{ success: boolean; download_url: string }>(`/report/download/${reportId}`)
     return response
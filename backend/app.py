@@ -1,5 +1,6 @@
 from flask import Flask
 from flask_cors import CORS
+from werkzeug.serving import is_running_from_reloader
 import os
 from dotenv import load_dotenv
 
@@ -40,4 +41,11 @@ app.register_blueprint(options_bp)
 app.register_blueprint(health_bp)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    app.debug = True
+    # The model loads on first use; the development server can pay for it up front instead.
+    # Importing the app never does, and under gunicorn each worker warms up in post_fork.
+    # The debugger's reloader serves from a child process, so only that one warms up
+    if os.getenv('WARM_UP_MODEL', 'false').lower() == 'true' and is_running_from_reloader():
+        from utils import warm_up_model
+        app.logger.info("Model %s loaded", warm_up_model())
+    app.run(host='0.0.0.0', port=5000) 
\ No newline at end of file
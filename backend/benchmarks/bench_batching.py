@@ -0,0 +1,71 @@
+"""Throughput and latency of concurrent single-image Grad-CAM requests, with and without micro-batching.
+
+Each client thread sends one-image requests back to back for --duration seconds. Without
+batching every request runs its own forward pass on its own thread, as Flask request
+threads did; with batching they go through an InferenceBatcher.
+
+Run from the backend directory:
+    python benchmarks/bench_batching.py --clients 1 4 8 16 --duration 5
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import torch
+from inference_batcher import InferenceBatcher
+from models.brain_tumor_model import MAX_BATCH_SIZE
+from utils import run_gradcam_batch
+
+
+def load(run, clients, duration):
+    """Drive `run` from `clients` threads; returns (requests/s, per-request latencies in ms)"""
+    image = torch.randn(3, 224, 224)
+    latencies = [[] for _ in range(clients)]
+    stop = time.perf_counter() + duration
+
+    def client(samples):
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            run([image])
+            samples.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=client, args=(samples,)) for samples in latencies]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies = np.array([latency for samples in latencies for latency in samples])
+    return len(latencies) / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    run_gradcam_batch([torch.randn(3, 224, 224)])
+    print(f"{'clients':>7}  {'mode':<9}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'mean batch':>12}")
+    for clients in args.clients:
+        for mode in ('direct', 'batched'):
+            if mode == 'batched':
+                batcher = InferenceBatcher(run_gradcam_batch, MAX_BATCH_SIZE, args.max_wait_ms / 1000)
+                run = batcher.run
+            else:
+                run = run_gradcam_batch
+            throughput, latencies = load(run, clients, args.duration)
+            mean_batch = batcher.stats()['mean_batch_size'] if mode == 'batched' else 1
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            print(f"{clients:>7}  {mode:<9}{throughput:>8.1f}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}{mean_batch:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
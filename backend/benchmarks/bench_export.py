@@ -0,0 +1,85 @@
+"""Cold start and latency of the eager checkpoint vs the exported TorchScript model.
+
+Each variant loads in a fresh process, so the startup time is what a new server worker
+pays. The exported model must have been built first with export_model.py.
+
+Run from the backend directory:
+    python benchmarks/bench_export.py --batch-size 8 --iterations 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_per_image(fn, batch, iterations, warmup=3):
+    # TorchScript's profiling executor specializes the graph over the first few calls
+    for _ in range(warmup):
+        fn(batch)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(batch)
+    return (time.perf_counter() - start) / (iterations * batch.shape[0]) * 1000
+
+
+def run(variant, batch_size, iterations, threads):
+    """Measure one variant in this process and print the numbers as JSON"""
+    os.environ['INFERENCE_PRECISION'] = 'fp32'
+    os.environ['USE_EXPORTED_MODEL'] = 'true' if variant == 'exported' else 'false'
+    sys.path.insert(0, BACKEND_DIR)
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+    start = time.perf_counter()
+    from models.brain_tumor_model import gradcam, predict_probabilities, MODEL_VERSION
+    startup = time.perf_counter() - start
+
+    torch.manual_seed(0)
+    batch = torch.randn(batch_size, 3, 224, 224)
+    print(json.dumps({
+        'variant': variant,
+        'loaded': type(gradcam).__name__,
+        'model_version': MODEL_VERSION,
+        'startup_s': startup,
+        'predict_ms': time_per_image(lambda b: predict_probabilities(list(b)), batch, iterations),
+        'gradcam_ms': time_per_image(gradcam.generate_cams, batch, iterations)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=0, help='torch intra-op threads (0 = default)')
+    parser.add_argument('--run', choices=['checkpoint', 'exported'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.batch_size, args.iterations, args.threads)
+        return
+
+    rows = []
+    for variant in ('checkpoint', 'exported'):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run', variant, '--batch-size', str(args.batch_size),
+             '--iterations', str(args.iterations), '--threads', str(args.threads)],
+            check=True, capture_output=True, text=True, cwd=BACKEND_DIR
+        ).stdout
+        rows.append(json.loads(output.strip().splitlines()[-1]))
+
+    if rows[1]['loaded'] == rows[0]['loaded']:
+        print("warning: exported model not loaded (run export_model.py first); both rows use the checkpoint")
+    print(f"{'model':<12}{'startup s':>11}{'predict ms/img':>16}{'grad-cam ms/img':>17}")
+    for row in rows:
+        print(f"{row['variant']:<12}{row['startup_s']:>11.2f}{row['predict_ms']:>16.2f}{row['gradcam_ms']:>17.2f}")
+    print(f"speedup: startup {rows[0]['startup_s'] / rows[1]['startup_s']:.2f}x, "
+          f"predict {rows[0]['predict_ms'] / rows[1]['predict_ms']:.2f}x, "
+          f"grad-cam {rows[0]['gradcam_ms'] / rows[1]['gradcam_ms']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Throughput and peak memory of a multi-file upload through iter_predictions_with_gradcam.
+
+Runs the same synthetic upload with decoding on the request thread (PREPROCESS_WORKERS=0)
+and with 1..N decode processes, each in a fresh interpreter because the pool sizes are
+read at import. Uploads go to the local stub uploader, so the numbers cover decoding,
+inference, rendering and PNG encoding. Peak RSS should stay flat as --files grows.
+
+Run from the backend directory:
+    python benchmarks/bench_pipeline.py --files 64 --size 1024 --decode-workers 0 1 2
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_upload(count, size, image_format):
+    """Encoded bytes of `count` distinct synthetic scans"""
+    from io import BytesIO
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[:size, :size] / size - 0.5
+    files = []
+    for _ in range(count):
+        scan = np.exp(-((x - rng.uniform(-0.2, 0.2)) ** 2 + y ** 2) * 8) * 200 + rng.normal(0, 10, (size, size))
+        buffer = BytesIO()
+        Image.fromarray(np.clip(scan, 0, 255).astype(np.uint8), 'L').convert('RGB').save(buffer, image_format)
+        files.append(buffer.getvalue())
+    return files
+
+
+def run(files, size, image_format):
+    sys.path.insert(0, BACKEND_DIR)
+    from io import BytesIO
+    from utils import iter_predictions_with_gradcam, warm_up_model
+    warm_up_model()
+    upload = synthetic_upload(files, size, image_format)
+    # Start the decode pool outside the timed region, as an earlier upload would have
+    list(iter_predictions_with_gradcam([BytesIO(upload[0])]))
+    start = time.perf_counter()
+    succeeded = sum(result['success'] for _, result in iter_predictions_with_gradcam([BytesIO(data) for data in upload]))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'images_per_s': files / elapsed,
+        'succeeded': succeeded,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=64)
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--format', default='PNG', choices=['PNG', 'JPEG', 'BMP', 'TIFF'])
+    parser.add_argument('--decode-workers', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.files, args.size, args.format)
+        return
+
+    print(f"{'decode workers':>14}{'images/s':>10}{'speedup':>9}{'peak RSS MB':>13}{'ok':>6}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as stub_dir:
+        for workers in args.decode_workers:
+            env = dict(os.environ, PREPROCESS_WORKERS=str(workers), CLOUDINARY_UPLOADER='stub', CLOUDINARY_STUB_DIR=stub_dir)
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run', '--files', str(args.files),
+                 '--size', str(args.size), '--format', args.format],
+                check=True, capture_output=True, text=True, cwd=BACKEND_DIR, env=env
+            ).stdout
+            row = json.loads(output.strip().splitlines()[-1])
+            baseline = baseline or row['images_per_s']
+            print(f"{workers:>14}{row['images_per_s']:>10.1f}{row['images_per_s'] / baseline:>8.2f}x"
+                  f"{row['peak_rss_mb']:>13.1f}{row['succeeded']:>6}")
+    print(f"{os.cpu_count()} CPU(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Micro-benchmark for per-scan Grad-CAM post-processing.
+
+Compares the original implementation (per-channel Python loop over numpy copies, cv2
+resize and matplotlib float64 colormap) with the vectorized CAM contraction and the
+uint8 jet lookup table.
+
+Run from the backend directory:
+    python benchmarks/bench_postprocess.py --iterations 200 --batch-size 8
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import matplotlib.cm as cm
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.brain_tumor_model import GradCAM
+from visualization import colorize_cam
+
+
+def postprocess_before(gradients, activations):
+    """Original per-scan path from GradCAM.generate_cam and predict_with_gradcam"""
+    heatmaps = []
+    for n in range(gradients.shape[0]):
+        grads = gradients[n].cpu().data.numpy()
+        acts = activations[n].cpu().data.numpy()
+        weights = np.mean(grads, axis=(1, 2))
+        cam = np.zeros(acts.shape[1:], dtype=np.float32)
+        for i, w in enumerate(weights):
+            cam += w * acts[i]
+        cam = np.maximum(cam, 0)
+        cam = cv2.resize(cam, (224, 224))
+        if cam.max() > 0:
+            cam = cam / cam.max()
+        heatmap = cm.jet(cam)[:, :, :3]
+        heatmaps.append((heatmap * 255).astype(np.uint8))
+    return heatmaps
+
+
+def postprocess_after(gradients, activations):
+    """Vectorized CAM contraction plus LUT colorization"""
+    cams = GradCAM.compute_cams(gradients, activations)
+    return [colorize_cam(cam) for cam in cams]
+
+
+def time_per_scan(fn, gradients, activations, iterations):
+    fn(gradients, activations)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(gradients, activations)
+    elapsed = time.perf_counter() - start
+    return elapsed / (iterations * gradients.shape[0]) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    # ResNet18 layer4 output for a 224x224 input is 512x7x7
+    gradients = torch.randn(args.batch_size, 512, 7, 7)
+    activations = torch.relu(torch.randn(args.batch_size, 512, 7, 7))
+
+    before = postprocess_before(gradients, activations)
+    after = postprocess_after(gradients, activations)
+    max_diff = max(int(np.abs(b.astype(np.int16) - a.astype(np.int16)).max()) for b, a in zip(before, after))
+
+    before_ms = time_per_scan(postprocess_before, gradients, activations, args.iterations)
+    after_ms = time_per_scan(postprocess_after, gradients, activations, args.iterations)
+    print(f"before: {before_ms:.3f} ms/scan")
+    print(f"after:  {after_ms:.3f} ms/scan")
+    print(f"speedup: {before_ms / after_ms:.1f}x")
+    print(f"max heatmap difference: {max_diff} (uint8 levels)")
+
+
+if __name__ == '__main__':
+    main()
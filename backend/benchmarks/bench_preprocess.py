@@ -0,0 +1,79 @@
+"""Decode + preprocessing time per scan: torchvision transform chain vs preprocessing.py.
+
+The old path decoded the full image, converted it to RGB, ran Resize/ToTensor/Normalize
+for the model and resized the decoded image again for the visualizations. The new path
+decodes once (at reduced scale for JPEGs) and derives both from one 224x224 array.
+Synthetic scans are written in several formats and sizes; the max abs difference of the
+model tensors between the two paths is reported alongside the timings.
+
+Run from the backend directory:
+    python benchmarks/bench_preprocess.py --sizes 512 1024 2048 --repeats 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+from torchvision import transforms
+from preprocessing import preprocess
+
+FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'BMP': '.bmp', 'TIFF': '.tiff'}
+
+transform = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+])
+
+
+def baseline(path):
+    image = Image.open(path).convert('RGB')
+    tensor = transform(image)
+    array = np.array(image.resize((224, 224)))
+    return array, tensor
+
+
+def synthetic_scan(size, mode):
+    """Smooth grayscale blob with noise, roughly the statistics of an MRI slice"""
+    y, x = np.mgrid[:size, :size] / size - 0.5
+    scan = np.exp(-(x ** 2 + y ** 2) * 8) * 200 + np.random.default_rng(0).normal(0, 10, (size, size))
+    image = Image.fromarray(np.clip(scan, 0, 255).astype(np.uint8), 'L')
+    return image.convert(mode)
+
+
+def time_per_image(run, path, repeats):
+    run(path)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        run(path)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[512, 1024, 2048])
+    parser.add_argument('--formats', nargs='+', choices=list(FORMATS), default=list(FORMATS))
+    parser.add_argument('--modes', nargs='+', choices=['L', 'RGB'], default=['L', 'RGB'])
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'format':<6}{'mode':>5}{'size':>6}{'old ms':>9}{'new ms':>9}{'speedup':>9}{'max diff':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for image_format in args.formats:
+            for mode in args.modes:
+                for size in args.sizes:
+                    path = os.path.join(directory, f"scan_{mode}_{size}{FORMATS[image_format]}")
+                    synthetic_scan(size, mode).save(path, image_format)
+                    old = time_per_image(baseline, path, args.repeats)
+                    new = time_per_image(preprocess, path, args.repeats)
+                    diff = (baseline(path)[1] - preprocess(path)[1]).abs().max().item()
+                    print(f"{image_format:<6}{mode:>5}{size:>6}{old:>9.2f}{new:>9.2f}{old / new:>8.2f}x{diff:>10.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Latency and memory of fp32 vs INT8 inference.
+
+Each precision runs in its own process so resident memory is measured independently.
+The INT8 model must have been built first with quantize_model.py calibrate.
+
+Run from the backend directory:
+    python benchmarks/bench_quantized.py --batch-size 8 --iterations 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_mb():
+    """Current resident set size of this process in MB (Linux)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def serialized_mb(module):
+    """Size of a module's weights as saved; TorchScript parts include their packed INT8 weights"""
+    import io
+    import torch
+    if isinstance(module, torch.jit.ScriptModule):
+        buffer = io.BytesIO()
+        torch.jit.save(module, buffer)
+        return len(buffer.getvalue()) / 1e6
+    children = list(module.children())
+    if any(isinstance(child, torch.jit.ScriptModule) for child in children):
+        return sum(serialized_mb(child) for child in children)
+    return sum(t.numel() * t.element_size() for t in module.state_dict().values()) / 1e6
+
+
+def time_per_image(fn, batch, iterations):
+    fn(batch)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(batch)
+    return (time.perf_counter() - start) / (iterations * batch.shape[0]) * 1000
+
+
+def run(precision, batch_size, iterations, threads):
+    """Measure one precision in this process and print the numbers as JSON"""
+    os.environ['INFERENCE_PRECISION'] = precision
+    sys.path.insert(0, BACKEND_DIR)
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+    baseline = rss_mb()
+    from models.brain_tumor_model import gradcam, inference_model, predict_probabilities, MODEL_VERSION
+    loaded = rss_mb()
+
+    torch.manual_seed(0)
+    batch = torch.randn(batch_size, 3, 224, 224)
+    weights_mb = serialized_mb(inference_model)
+    print(json.dumps({
+        'precision': precision,
+        'model_version': MODEL_VERSION,
+        'predict_ms': time_per_image(lambda b: predict_probabilities(list(b)), batch, iterations),
+        'gradcam_ms': time_per_image(gradcam.generate_cams, batch, iterations),
+        'model_rss_mb': loaded - baseline,
+        'peak_rss_mb': rss_mb(),
+        'weights_mb': weights_mb
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=0, help='torch intra-op threads (0 = default)')
+    parser.add_argument('--run', choices=['fp32', 'int8'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.batch_size, args.iterations, args.threads)
+        return
+
+    rows = []
+    for precision in ('fp32', 'int8'):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run', precision, '--batch-size', str(args.batch_size),
+             '--iterations', str(args.iterations), '--threads', str(args.threads)],
+            check=True, capture_output=True, text=True, cwd=BACKEND_DIR
+        ).stdout
+        rows.append(json.loads(output.strip().splitlines()[-1]))
+
+    if rows[1]['model_version'] == rows[0]['model_version']:
+        print("warning: INT8 model not loaded (run quantize_model.py calibrate first); both rows are fp32")
+    print(f"{'precision':<10}{'predict ms/img':>16}{'grad-cam ms/img':>17}{'weights MB':>12}{'model RSS MB':>14}")
+    for row in rows:
+        print(f"{row['precision']:<10}{row['predict_ms']:>16.2f}{row['gradcam_ms']:>17.2f}"
+              f"{row['weights_mb']:>12.1f}{row['model_rss_mb']:>14.1f}")
+    print(f"speedup: predict {rows[0]['predict_ms'] / rows[1]['predict_ms']:.2f}x, "
+          f"grad-cam {rows[0]['gradcam_ms'] / rows[1]['gradcam_ms']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
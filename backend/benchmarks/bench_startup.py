@@ -0,0 +1,80 @@
+"""API process startup time with lazy model loading vs warming the model up at startup.
+
+Each mode starts a fresh interpreter and measures how long `import app` takes, how long
+the first /api/health request takes, and how long the first inference takes after that.
+"warm" also runs warm_up_model right after the import, which is what gunicorn and scan
+workers pay before serving.
+
+Run from the backend directory:
+    python benchmarks/bench_startup.py --repeat 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('torch', 'torchvision', 'cv2', 'matplotlib', 'reportlab', 'boto3', 'cloudinary')
+
+
+def run(mode):
+    """Measure one cold start in this process and print the numbers as JSON"""
+    sys.path.insert(0, BACKEND_DIR)
+    start = time.perf_counter()
+    import app
+    from utils import warm_up_model
+    if mode == 'warm':
+        warm_up_model()
+    startup = time.perf_counter() - start
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    client = app.app.test_client()
+    start = time.perf_counter()
+    client.get('/api/health')
+    health = time.perf_counter() - start
+
+    start = time.perf_counter()
+    warm_up_model()
+    first_inference = time.perf_counter() - start
+    print(json.dumps({
+        'mode': mode,
+        'startup_s': startup,
+        'health_ms': health * 1000,
+        'first_inference_s': first_inference,
+        'heavy_modules': loaded
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='cold starts per mode; the median is reported')
+    parser.add_argument('--run', choices=['lazy', 'warm'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run)
+        return
+
+    rows = []
+    for mode in ('lazy', 'warm'):
+        samples = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run', mode],
+                check=True, capture_output=True, text=True, cwd=BACKEND_DIR
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        samples.sort(key=lambda sample: sample['startup_s'])
+        rows.append(samples[len(samples) // 2])
+
+    print(f"{'mode':<6}{'import app s':>14}{'health ms':>11}{'first inference s':>19}  heavy modules after import")
+    for row in rows:
+        print(f"{row['mode']:<6}{row['startup_s']:>14.2f}{row['health_ms']:>11.1f}{row['first_inference_s']:>19.2f}"
+              f"  {', '.join(row['heavy_modules']) or '-'}")
+    print(f"lazy startup is {rows[1]['startup_s'] / rows[0]['startup_s']:.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
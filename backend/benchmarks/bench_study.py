@@ -0,0 +1,55 @@
+"""Time to analyse a whole series slice by slice versus as one study.
+
+Per-slice mode runs Grad-CAM, visualization and uploads for every slice, as
+process_scan_files does. Study mode classifies every slice with probability-only
+inference (rank_slices) and runs the Grad-CAM path for the top-k slices only. Uploads
+go to the local stub uploader and nothing is stored in the database.
+
+Run from the backend directory:
+    python benchmarks/bench_study.py --slices 150 --top-k 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--slices', type=int, default=150)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--top-k', type=int, default=5)
+    args = parser.parse_args()
+
+    stub_dir = tempfile.mkdtemp()
+    os.environ.update(CLOUDINARY_UPLOADER='stub', CLOUDINARY_STUB_DIR=stub_dir)
+    sys.path.insert(0, BACKEND_DIR)
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+    from io import BytesIO
+    from bench_pipeline import synthetic_upload
+    from study_processing import rank_slices
+    from utils import iter_predictions_with_gradcam, warm_up_model
+    warm_up_model()
+    series = synthetic_upload(args.slices, args.size, 'PNG')
+    list(iter_predictions_with_gradcam([BytesIO(series[0])]))
+
+    start = time.perf_counter()
+    list(iter_predictions_with_gradcam([BytesIO(data) for data in series]))
+    per_slice = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, key_slices = rank_slices([(f'slice{i}.png', BytesIO(data)) for i, data in enumerate(series)], args.top_k)
+    list(iter_predictions_with_gradcam([BytesIO(data) for _, _, _, data, _ in key_slices]))
+    study = time.perf_counter() - start
+
+    print(f"{'mode':>10}{'seconds':>9}{'Grad-CAMs':>11}")
+    print(f"{'per-slice':>10}{per_slice:>9.2f}{args.slices:>11}")
+    print(f"{'study':>10}{study:>9.2f}{len(key_slices):>11}")
+    print(f"speedup {per_slice / study:.2f}x, {os.cpu_count()} CPU(s)")
+
+
+if __name__ == '__main__':
+    main()
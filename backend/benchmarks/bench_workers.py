@@ -0,0 +1,134 @@
+"""Inference throughput and memory with 1..N forked worker processes on one machine.
+
+For every worker count, workers are forked the way gunicorn.conf.py forks them and each
+keeps running Grad-CAM batches for --duration seconds. In "shared" mode the master loads
+the model before forking (serving.preload_model); in "separate" mode each worker loads
+its own copy after forking. PSS counts shared pages once across the processes that map
+them, so the total is the memory the whole group really uses.
+
+The scaling column only means something when every worker has a core of its own: with
+fewer cores than workers the processes time-share them and aggregate throughput cannot
+grow. Such runs are reported as unverified.
+
+Run from the backend directory:
+    python benchmarks/bench_workers.py --workers 1 2 4 --duration 10
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory_mb():
+    """Proportional (PSS) and private (USS) memory of this process in MB (Linux)"""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return values.get('Pss', 0), values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+
+
+def worker(workers, batch_size, duration, start_barrier, stop_barrier, results, done):
+    import torch
+    from serving import init_worker
+    init_worker(workers)
+    from models.brain_tumor_model import gradcam
+    batch = torch.randn(batch_size, 3, 224, 224)
+    start_barrier.wait()
+    images = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        gradcam.generate_cams(batch)
+        images += batch_size
+    elapsed = time.perf_counter() - start
+    # Measure memory while every process of the group is still alive
+    stop_barrier.wait()
+    pss, uss = memory_mb()
+    results.put({'images': images, 'seconds': elapsed, 'pss_mb': pss, 'uss_mb': uss})
+    done.wait()
+
+
+def run(mode, workers, batch_size, duration):
+    """Fork `workers` processes from this one, drive them and print the numbers as JSON"""
+    sys.path.insert(0, BACKEND_DIR)
+    from serving import preload_model, threads_per_worker
+    if mode == 'shared':
+        preload_model()
+
+    context = multiprocessing.get_context('fork')
+    start_barrier = context.Barrier(workers)
+    stop_barrier = context.Barrier(workers + 1)
+    results = context.Queue()
+    done = context.Event()
+    processes = [
+        context.Process(target=worker, args=(workers, batch_size, duration, start_barrier, stop_barrier, results, done))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    stop_barrier.wait()
+    master_pss, _ = memory_mb()
+    rows = [results.get() for _ in processes]
+    done.set()
+    for process in processes:
+        process.join()
+
+    print(json.dumps({
+        'mode': mode,
+        'workers': workers,
+        'threads_per_worker': threads_per_worker(workers),
+        'images_per_s': sum(row['images'] / row['seconds'] for row in rows),
+        'worker_uss_mb': sum(row['uss_mb'] for row in rows) / workers,
+        'total_pss_mb': master_pss + sum(row['pss_mb'] for row in rows)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per run')
+    parser.add_argument('--modes', nargs='+', choices=['shared', 'separate'], default=['shared', 'separate'])
+    parser.add_argument('--run', choices=['shared', 'separate'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.workers[0], args.batch_size, args.duration)
+        return
+
+    sys.path.insert(0, BACKEND_DIR)
+    from serving import available_cpus
+    cpus = available_cpus()
+
+    rows = []
+    for mode in args.modes:
+        for workers in args.workers:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run', mode, '--workers', str(workers),
+                 '--batch-size', str(args.batch_size), '--duration', str(args.duration)],
+                check=True, capture_output=True, text=True, cwd=BACKEND_DIR
+            ).stdout
+            rows.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'mode':<10}{'workers':>8}{'threads':>9}{'images/s':>10}{'scaling':>9}"
+          f"{'private MB/worker':>19}{'total PSS MB':>14}")
+    for row in rows:
+        single = next(r for r in rows if r['mode'] == row['mode'] and r['workers'] == min(args.workers))
+        print(f"{row['mode']:<10}{row['workers']:>8}{row['threads_per_worker']:>9}{row['images_per_s']:>10.1f}"
+              f"{row['images_per_s'] / single['images_per_s']:>8.2f}x{row['worker_uss_mb']:>19.1f}"
+              f"{row['total_pss_mb']:>14.1f}{'  (unverified)' if row['workers'] > cpus else ''}")
+    print(f"{cpus} CPU(s); INFERENCE_THREADS splits the cores between workers")
+    if max(args.workers) > cpus:
+        print(f"Runs with more than {cpus} worker(s) share cores, so their scaling is not a measurement "
+              f"of multi-process throughput; re-run on a host with at least {max(args.workers)} cores")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,114 @@
 import os
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
+import threading
 from dotenv import load_dotenv
 import base64
 from io import BytesIO
 from PIL import Image
 import uuid
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, CancelledError, TimeoutError as FuturesTimeoutError
 
 load_dotenv('config.env')
 
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-)
+class LocalStubUploader:
+    """Offline stand-in for cloudinary.uploader.upload that writes files to a local directory.
 
-class CloudinaryService:
+    Optional latency and failure rate make it possible to exercise the concurrent upload
+    path, timeouts and retries without network access.
+    """
+    def __init__(self, root="stub_uploads", latency=0.0, failure_rate=0.0):
+        self.root = root
+        self.latency = latency
+        self.failure_rate = failure_rate
+    
+    def __call__(self, file, public_id=None, folder=None, resource_type="image", timeout=None, **options):
+        if self.latency:
+            # Like the SDK's HTTP timeout, a call never takes longer than timeout
+            if timeout is not None and self.latency > timeout:
+                time.sleep(timeout)
+                raise TimeoutError(f"Upload timed out after {timeout} seconds")
+            time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise IOError("Simulated upload failure")
+        if hasattr(file, 'read'):
+            data = file.read()
+        else:
+            with open(file, 'rb') as f:
+                data = f.read()
+        public_id = public_id or f"{folder}/{uuid.uuid4()}"
+        extension = ".pdf" if resource_type == "raw" else ".png"
+        local_path = os.path.abspath(os.path.join(self.root, public_id + extension))
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, 'wb') as f:
+            f.write(data)
+        return {
+            'secure_url': f"file://{local_path}",
+            'public_id': public_id,
+            'asset_id': uuid.uuid4().hex
+        }
+
+class UploadStart:
+    """Marked by the upload worker when a queued upload starts, or when its future is done"""
     def __init__(self):
+        self.event = threading.Event()
+        self.at = None
+    
+    def mark(self):
+        if self.at is None:
+            self.at = time.monotonic()
+        self.event.set()
+
+class CloudinaryService:
+    def __init__(self, uploader=None):
         self.cloud_name = os.getenv('CLOUDINARY_CLOUD_NAME')
         self.api_key = os.getenv('CLOUDINARY_API_KEY')
         self.api_secret = os.getenv('CLOUDINARY_API_SECRET')
         
-        if not all([self.cloud_name, self.api_key, self.api_secret]):
-            raise ValueError("Cloudinary credentials not found in environment variables")
+        # Concurrent upload settings
+        self.upload_workers = int(os.getenv('CLOUDINARY_UPLOAD_WORKERS', 6))
+        self.upload_timeout = float(os.getenv('CLOUDINARY_UPLOAD_TIMEOUT', 30))
+        self.upload_retries = int(os.getenv('CLOUDINARY_UPLOAD_RETRIES', 2))
+        self.retry_backoff = float(os.getenv('CLOUDINARY_RETRY_BACKOFF', 0.5))
+        self.executor = ThreadPoolExecutor(max_workers=self.upload_workers, thread_name_prefix="cloudinary-upload")
+        
+        # The SDK is imported and configured on first use so importing this module stays cheap
+        self._uploader = uploader
+        self._cloudinary = None
+        self._lock = threading.Lock()
+    
+    @property
+    def cloudinary(self):
+        """The configured cloudinary SDK module"""
+        if self._cloudinary is None:
+            with self._lock:
+                if self._cloudinary is None:
+                    import cloudinary
+                    import cloudinary.uploader
+                    import cloudinary.api
+                    cloudinary.config(
+                        cloud_name=self.cloud_name,
+                        api_key=self.api_key,
+                        api_secret=self.api_secret
+                    )
+                    self._cloudinary = cloudinary
+        return self._cloudinary
+    
+    @property
+    def uploader(self):
+        """Upload function: the local stub if configured, else cloudinary.uploader.upload"""
+        if self._uploader is None:
+            if os.getenv('CLOUDINARY_UPLOADER') == 'stub':
+                self._uploader = LocalStubUploader(
+                    root=os.getenv('CLOUDINARY_STUB_DIR', 'stub_uploads'),
+                    latency=float(os.getenv('CLOUDINARY_STUB_LATENCY', 0)),
+                    failure_rate=float(os.getenv('CLOUDINARY_STUB_FAILURE_RATE', 0))
+                )
+            else:
+                if not all([self.cloud_name, self.api_key, self.api_secret]):
+                    raise ValueError("Cloudinary credentials not found in environment variables")
+                self._uploader = self.cloudinary.uploader.upload
+        return self._uploader
     
     def upload_image(self, image_path, folder="brain_tumor_scans", public_id=None):
         """Upload an image to Cloudinary"""
@@ -32,12 +116,13 @@ class CloudinaryService:
             if not public_id:
                 public_id = f"{folder}/{uuid.uuid4()}"
             
-            result = cloudinary.uploader.upload(
+            result = self.uploader(
                 image_path,
                 public_id=public_id,
                 folder=folder,
                 resource_type="image",
-                overwrite=True
+                overwrite=True,
+                timeout=self.upload_timeout
             )
             
             return {
@@ -98,12 +183,13 @@ class CloudinaryService:
             else:
                 resource_type = "image"
             
-            result = cloudinary.uploader.upload(
+            result = self.uploader(
                 file_data,
                 public_id=public_id,
                 folder=folder,
                 resource_type=resource_type,
-                overwrite=True
+                overwrite=True,
+                timeout=self.upload_timeout
             )
             
             return {
@@ -120,10 +206,76 @@ class CloudinaryService:
                 'error': str(e)
             }
     
+    def submit_upload(self, file_data, folder="brain_tumor_scans", public_id=None):
+        """Queue an in-memory image upload on the shared worker pool and return its Future"""
+        start = UploadStart()
+        future = self.executor.submit(self._upload_with_retry, file_data, folder, public_id, start)
+        future.upload_start = start
+        # A future cancelled or failed before it ran has no start to wait for
+        future.add_done_callback(lambda _: start.event.set())
+        return future
+    
+    def wait_for_upload(self, future):
+        """Wait for a queued upload and return its result dict.
+
+        Each attempt is limited to upload_timeout by the uploader itself. The deadline here
+        is only a backstop for an uploader that ignores it: every attempt's timeout plus
+        the backoff between attempts, counted from when the upload started, so time spent
+        queued behind other uploads does not count against it.
+        """
+        attempts = self.upload_retries + 1
+        deadline = self.upload_timeout * attempts + self.retry_backoff * (2 ** attempts)
+        start = getattr(future, 'upload_start', None)
+        try:
+            if start is not None:
+                start.event.wait()
+                if start.at is not None:
+                    return future.result(timeout=max(deadline - (time.monotonic() - start.at), 0))
+            return future.result(timeout=deadline)
+        except FuturesTimeoutError:
+            future.cancel()
+            return {
+                'success': False,
+                'error': f"Upload did not finish within {deadline:.1f} seconds"
+            }
+        except CancelledError:
+            return {
+                'success': False,
+                'error': 'Upload was cancelled'
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def upload_batch(self, uploads):
+        """Upload several (file_data, folder) pairs concurrently, returning results in order"""
+        futures = [self.submit_upload(file_data, folder=folder) for file_data, folder in uploads]
+        return [self.wait_for_upload(future) for future in futures]
+    
+    def _upload_with_retry(self, file_data, folder, public_id, start=None):
+        """Upload with up to upload_retries retries and exponential backoff between attempts.
+
+        Every attempt is given upload_timeout (the SDK's HTTP timeout), so a slow attempt
+        fails and is retried instead of holding the worker.
+        """
+        if start is not None:
+            start.mark()
+        if not public_id:
+            public_id = f"{folder}/{uuid.uuid4()}"
+        for attempt in range(self.upload_retries + 1):
+            if hasattr(file_data, 'seek'):
+                file_data.seek(0)
+            result = self.upload_from_memory(file_data, folder=folder, public_id=public_id)
+            if result['success'] or attempt == self.upload_retries:
+                return result
+            time.sleep(self.retry_backoff * (2 ** attempt))
+    
     def delete_file(self, public_id):
         """Delete a file from Cloudinary"""
         try:
-            result = cloudinary.uploader.destroy(public_id)
+            result = self.cloudinary.uploader.destroy(public_id)
             return {
                 'success': True,
                 'result': result
@@ -140,9 +292,9 @@ class CloudinaryService:
         """Get the URL for a file with optional transformations"""
         try:
             if transformation:
-                url = cloudinary.CloudinaryImage(public_id).build_url(transformation=transformation)
+                url = self.cloudinary.CloudinaryImage(public_id).build_url(transformation=transformation)
             else:
-                url = cloudinary.CloudinaryImage(public_id).build_url()
+                url = self.cloudinary.CloudinaryImage(public_id).build_url()
             
             return {
                 'success': True,
@@ -159,7 +311,7 @@ class CloudinaryService:
     def list_files(self, folder="brain_tumor_scans", max_results=100):
         """List files in a folder"""
         try:
-            result = cloudinary.api.resources(
+            result = self.cloudinary.api.resources(
                 type="upload",
                 prefix=folder,
                 max_results=max_results
@@ -1,6 +1,14 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.pool
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import RealDictCursor, Json, execute_values
+from contextlib import contextmanager
 import os
+import threading
+import time
+import base64
+import datetime
+from migrations import run_migrations
 from dotenv import load_dotenv
 import uuid
 import hashlib
@@ -9,131 +17,190 @@ import string
 
 load_dotenv('config.env')
 
+DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', 50))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 200))
+# Uploaded files of a scan job read from the database per query
+SCAN_JOB_FILE_BATCH_SIZE = int(os.getenv('SCAN_JOB_FILE_BATCH_SIZE', 16))
+
+# Columns shipped by the admin list views; password hashes and storage paths stay server-side
+PATIENT_LIST_COLUMNS = "p.id, p.patient_id, p.name, p.email, p.age, p.gender, p.phone, p.created_at"
+SCAN_LIST_COLUMNS = ("s.id, s.scan_id, s.patient_id, s.original_filename, s.prediction, s.confidence, "
+                     "s.probability, s.created_at, p.name as patient_name, p.patient_id as patient_identifier")
+REPORT_LIST_COLUMNS = ("r.id, r.report_id, r.patient_id, r.scan_count, r.tumor_count, r.no_tumor_count, "
+                       "r.status, r.created_at, p.name as patient_name, p.patient_id as patient_identifier")
+
+def encode_cursor(created_at, row_id):
+    """Encode a (created_at, id) keyset position as an opaque pagination token"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(token):
+    """Decode a pagination token back into a (created_at, id) keyset position"""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(token.encode()).decode().split('|')
+        return datetime.datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
 class Database:
-    def __init__(self):
-        self.connection = None
-        self.connect()
-        self.create_tables()
+    def __init__(self, auto_migrate=None):
+        self.pool = None
+        self.min_connections = int(os.getenv('DB_POOL_MIN', 1))
+        self.max_connections = int(os.getenv('DB_POOL_MAX', 10))
+        # Seconds a request waits for a free connection before giving up
+        self.checkout_timeout = float(os.getenv('DB_POOL_TIMEOUT', 30))
+        # Connections idle for longer than this are pinged before being handed out
+        self.health_check_interval = float(os.getenv('DB_HEALTH_CHECK_INTERVAL', 30))
+        self.statement_timeout_ms = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+        # ThreadedConnectionPool raises instead of blocking when exhausted, so a semaphore
+        # makes callers wait for a connection to be returned
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._last_used = {}
+        # In-process cache in front of the dashboard counters row
+        self.stats_cache_ttl = float(os.getenv('DASHBOARD_CACHE_TTL', 10))
+        self._stats_cache = None
+        self._stats_cache_expires = 0
+        self._stats_lock = threading.Lock()
+        # The pool is opened (and pending migrations applied) by the first query, so
+        # importing this module does not wait on the network
+        if auto_migrate is None:
+            auto_migrate = os.getenv('DB_AUTO_MIGRATE', 'true').lower() == 'true'
+        self.auto_migrate = auto_migrate
+        self._ready = False
+        self._migrating = False
+        self._init_lock = threading.RLock()
+    
+    def ensure_pool(self):
+        """Open the connection pool and apply pending migrations if that has not happened yet"""
+        with self._init_lock:
+            if self.pool is None:
+                self.connect()
+                if self.pool is None:
+                    return False
+            # Other threads wait on the lock until migrations finish; the migrations
+            # themselves borrow connections through here and must not recurse
+            # A failed migration propagates and leaves the pool not ready, so nothing is
+            # served against a partly migrated schema; the next use tries again
+            if not self._ready and not self._migrating:
+                if self.auto_migrate:
+                    self._migrating = True
+                    try:
+                        self.migrate()
+                    finally:
+                        self._migrating = False
+                self._ready = True
+            return True
     
     def connect(self):
         try:
+            connect_kwargs = {
+                'host': os.getenv('DB_HOST', 'localhost'),
+                'database': os.getenv('DB_NAME', 'brain_tumor_system'),
+                'user': os.getenv('DB_USER', 'postgres'),
+                'password': os.getenv('DB_PASSWORD', ''),
+                'port': os.getenv('DB_PORT', '5432'),
+                'options': f"-c statement_timeout={self.statement_timeout_ms}"
+            }
+            
             # Check if we're using Neon (SSL required)
             ssl_mode = os.getenv('DB_SSL_MODE')
-            
             if ssl_mode:
-                # Neon database connection with SSL and connection pooling
-                self.connection = psycopg2.connect(
-                    host=os.getenv('DB_HOST', 'localhost'),
-                    database=os.getenv('DB_NAME', 'brain_tumor_system'),
-                    user=os.getenv('DB_USER', 'postgres'),
-                    password=os.getenv('DB_PASSWORD', ''),
-                    port=os.getenv('DB_PORT', '5432'),
+                connect_kwargs.update(
                     sslmode=ssl_mode,
-                    # Connection pooling settings for Neon
                     keepalives_idle=30,
                     keepalives_interval=10,
                     keepalives_count=5
                 )
-            else:
-                # Local database connection
-                self.connection = psycopg2.connect(
-                    host=os.getenv('DB_HOST', 'localhost'),
-                    database=os.getenv('DB_NAME', 'brain_tumor_system'),
-                    user=os.getenv('DB_USER', 'postgres'),
-                    password=os.getenv('DB_PASSWORD', ''),
-                    port=os.getenv('DB_PORT', '5432')
-                )
             
+            self.pool = ThreadedConnectionPool(self.min_connections, self.max_connections, **connect_kwargs)
             print("Database connected successfully!")
         except Exception as e:
             print(f"Database connection error: {e}")
     
-    def ensure_connection(self):
-        """Ensure database connection is active, reconnect if needed"""
+    def _checkout(self):
+        """Borrow a healthy connection from the pool"""
+        if (self.pool is None or not self._ready) and not self.ensure_pool():
+            raise psycopg2.OperationalError("Database pool is not available")
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise psycopg2.pool.PoolError("Timed out waiting for a database connection")
         try:
-            if self.connection is None or self.connection.closed:
-                print("Reconnecting to database...")
-                self.connect()
-            else:
-                # Test the connection
-                cursor = self.connection.cursor()
+            # Every pooled connection may be stale; allow one replacement per slot
+            for _ in range(self.max_connections + 1):
+                conn = self.pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                self.pool.putconn(conn, close=True)
+                self._last_used.pop(id(conn), None)
+            raise psycopg2.OperationalError("Could not obtain a healthy database connection")
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
                 cursor.execute("SELECT 1")
-                cursor.close()
+            conn.rollback()
+            return True
         except Exception as e:
-            print(f"Connection test failed, reconnecting: {e}")
-            self.connect()
+            print(f"Discarding unhealthy database connection: {e}")
+            return False
     
-    def create_tables(self):
+    def _release(self, conn, broken=False):
+        """Return a connection to the pool, closing it if it is no longer usable"""
         try:
-            cursor = self.connection.cursor()
-            
-            # Create patients table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS patients (
-                    id SERIAL PRIMARY KEY,
-                    patient_id VARCHAR(50) UNIQUE NOT NULL,
-                    name VARCHAR(100) NOT NULL,
-                    email VARCHAR(100) UNIQUE NOT NULL,
-                    age INTEGER,
-                    gender VARCHAR(10),
-                    phone VARCHAR(20),
-                    address TEXT,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Create scans table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS scans (
-                    id SERIAL PRIMARY KEY,
-                    patient_id INTEGER REFERENCES patients(id),
-                    scan_id VARCHAR(50) UNIQUE NOT NULL,
-                    original_filename VARCHAR(255) NOT NULL,
-                    original_path VARCHAR(500),
-                    heatmap_path VARCHAR(500),
-                    overlay_path VARCHAR(500),
-                    prediction VARCHAR(20) NOT NULL,
-                    confidence DECIMAL(5,3),
-                    probability DECIMAL(5,3),
-                    report_path VARCHAR(500),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Create reports table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS reports (
-                    id SERIAL PRIMARY KEY,
-                    patient_id INTEGER REFERENCES patients(id),
-                    report_id VARCHAR(50) UNIQUE NOT NULL,
-                    report_path VARCHAR(500) NOT NULL,
-                    scan_count INTEGER DEFAULT 0,
-                    tumor_count INTEGER DEFAULT 0,
-                    no_tumor_count INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Create admin table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS admins (
-                    id SERIAL PRIMARY KEY,
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    email VARCHAR(100) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            self.connection.commit()
-            cursor.close()
-            print("Tables created successfully!")
-            
+            close = broken or bool(conn.closed)
+            if close:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+            self.pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+    
+    @contextmanager
+    def get_connection(self):
+        """Borrow a pooled connection, committing on success and rolling back on error"""
+        conn = self._checkout()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
         except Exception as e:
-            print(f"Error creating tables: {e}")
+            broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            raise
+        finally:
+            self._release(conn, broken)
+    
+    @contextmanager
+    def cursor(self, cursor_factory=RealDictCursor):
+        """Borrow a pooled connection and yield a cursor on it as a single transaction"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor(cursor_factory=cursor_factory)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+    
+    def migrate(self):
+        """Apply any pending schema migrations"""
+        try:
+            applied = run_migrations(self)
+            if applied:
+                print(f"Applied {len(applied)} migration(s)")
+        except Exception as e:
+            print(f"Error applying migrations: {e}")
+            raise
     
     def generate_patient_credentials(self):
         """Generate unique username and password for patient"""
@@ -153,11 +220,6 @@ class Database:
     def add_patient(self, name, email, age=None, gender=None, phone=None, address=None):
         """Add a new patient to the database"""
         try:
-            # Ensure connection is active
-            self.ensure_connection()
-            
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            
             # Generate unique patient ID
             patient_id = f"P{str(uuid.uuid4())[:8].upper()}"
             
@@ -165,15 +227,16 @@ class Database:
             username, password = self.generate_patient_credentials()
             password_hash = self.hash_password(password)
             
-            cursor.execute("""
-                INSERT INTO patients (patient_id, name, email, age, gender, phone, address, username, password_hash)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id, patient_id, name, email, age, gender, phone, address, username, password_hash, created_at
-            """, (patient_id, name, email, age, gender, phone, address, username, password_hash))
-            
-            result = cursor.fetchone()
-            self.connection.commit()
-            cursor.close()
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO patients (patient_id, name, email, age, gender, phone, address, username, password_hash)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id, patient_id, name, email, age, gender, phone, address, username, password_hash, created_at
+                """, (patient_id, name, email, age, gender, phone, address, username, password_hash))
+                
+                result = cursor.fetchone()
+                self._bump_counters(cursor, total_patients=1)
+            self.invalidate_stats_cache()
             
             return {
                 'id': result['id'],
@@ -191,27 +254,19 @@ class Database:
             
         except Exception as e:
             print(f"Error adding patient: {e}")
-            # Try to reconnect and retry once
-            try:
-                print("Attempting to reconnect and retry...")
-                self.connect()
-                return self.add_patient(name, email, age, gender, phone, address)
-            except Exception as retry_error:
-                print(f"Retry failed: {retry_error}")
-                return None
+            return None
     
     def get_patient_by_credentials(self, username, password):
         """Authenticate patient login"""
         try:
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
             password_hash = self.hash_password(password)
             
-            cursor.execute("""
-                SELECT * FROM patients WHERE username = %s AND password_hash = %s
-            """, (username, password_hash))
-            
-            patient = cursor.fetchone()
-            cursor.close()
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    SELECT * FROM patients WHERE username = %s AND password_hash = %s
+                """, (username, password_hash))
+                
+                patient = cursor.fetchone()
             
             return patient
             
@@ -222,14 +277,12 @@ class Database:
     def get_patient_by_id(self, patient_id):
         """Get patient by ID"""
         try:
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            
-            cursor.execute("""
-                SELECT * FROM patients WHERE id = %s
-            """, (patient_id,))
-            
-            patient = cursor.fetchone()
-            cursor.close()
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    SELECT * FROM patients WHERE id = %s
+                """, (patient_id,))
+                
+                patient = cursor.fetchone()
             
             return patient
             
@@ -237,85 +290,65 @@ class Database:
             print(f"Error getting patient: {e}")
             return None
     
-    def get_all_patients(self):
-        """Get all patients"""
+    def get_all_patients(self, limit=DEFAULT_PAGE_SIZE, cursor=None, search=None, created_from=None, created_to=None):
+        """Get one page of patients, newest first"""
+        after = decode_cursor(cursor) if cursor else None
         try:
-            # Ensure connection is active
-            self.ensure_connection()
-            
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            
-            cursor.execute("""
-                SELECT * FROM patients ORDER BY created_at DESC
-            """)
-            
-            patients = cursor.fetchall()
-            cursor.close()
-            
-            return patients
+            conditions, params = self._date_range_conditions('p', created_from, created_to)
+            if search:
+                conditions.append("(p.name ILIKE %s OR p.email ILIKE %s OR p.patient_id ILIKE %s)")
+                params.extend([f"%{search}%"] * 3)
+            query = f"SELECT {PATIENT_LIST_COLUMNS} FROM patients p"
+            return self._fetch_page(query, conditions, params, 'p', limit, after)
             
         except Exception as e:
             print(f"Error getting patients: {e}")
-            # Try to reconnect and retry once
-            try:
-                print("Attempting to reconnect and retry get patients...")
-                self.connect()
-                return self.get_all_patients()
-            except Exception as retry_error:
-                print(f"Retry failed: {retry_error}")
-                return []
+            return {'items': [], 'next_cursor': None}
     
     def add_scan(self, patient_id, original_filename, original_path, heatmap_path, overlay_path, 
                  prediction, confidence, probability, report_path=None, original_public_id=None, 
-                 heatmap_public_id=None, overlay_public_id=None):
-        """Add a new scan record"""
+                 heatmap_public_id=None, overlay_public_id=None, content_hash=None, model_version=None,
+                 study_pk=None, slice_index=None):
+        """Add a new scan record; key slices of a study also get its row id and their position in the series"""
         try:
-            # Ensure connection is active
-            self.ensure_connection()
-            
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            
             # Generate unique scan ID
             scan_id = f"S{str(uuid.uuid4())[:8].upper()}"
             
-            cursor.execute("""
-                INSERT INTO scans (patient_id, scan_id, original_filename, original_path, 
-                                 heatmap_path, overlay_path, prediction, confidence, probability, report_path)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id, scan_id
-            """, (patient_id, scan_id, original_filename, original_path, heatmap_path, 
-                  overlay_path, prediction, confidence, probability, report_path))
-            
-            result = cursor.fetchone()
-            self.connection.commit()
-            cursor.close()
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO scans (patient_id, scan_id, original_filename, original_path, 
+                                     heatmap_path, overlay_path, prediction, confidence, probability, report_path,
+                                     content_hash, model_version, study_id, slice_index)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id, scan_id
+                """, (patient_id, scan_id, original_filename, original_path, heatmap_path, 
+                      overlay_path, prediction, confidence, probability, report_path, content_hash, model_version,
+                      study_pk, slice_index))
+                
+                result = cursor.fetchone()
+                self._bump_counters(
+                    cursor,
+                    total_scans=1,
+                    tumor_count=1 if prediction == 'Tumor' else 0,
+                    no_tumor_count=1 if prediction == 'No Tumor' else 0
+                )
+            self.invalidate_stats_cache()
             
             return result
             
         except Exception as e:
             print(f"Error adding scan: {e}")
-            # Try to reconnect and retry once
-            try:
-                print("Attempting to reconnect and retry add scan...")
-                self.connect()
-                return self.add_scan(patient_id, original_filename, original_path, heatmap_path, 
-                                   overlay_path, prediction, confidence, probability, report_path,
-                                   original_public_id, heatmap_public_id, overlay_public_id)
-            except Exception as retry_error:
-                print(f"Retry failed: {retry_error}")
-                return None
+            return None
     
     def get_patient_scans(self, patient_id):
         """Get all scans for a patient"""
         try:
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            
-            cursor.execute("""
-                SELECT * FROM scans WHERE patient_id = %s ORDER BY created_at DESC
-            """, (patient_id,))
-            
-            scans = cursor.fetchall()
-            cursor.close()
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    SELECT * FROM scans WHERE patient_id = %s ORDER BY created_at DESC
+                """, (patient_id,))
+                
+                scans = cursor.fetchall()
             
             return scans
             
@@ -326,48 +359,122 @@ class Database:
     def add_report(self, patient_id, report_path, scan_count, tumor_count, no_tumor_count):
         """Add a new report record"""
         try:
-            # Ensure connection is active
-            self.ensure_connection()
-            
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            
             # Generate unique report ID
             report_id = f"R{str(uuid.uuid4())[:8].upper()}"
             
-            cursor.execute("""
-                INSERT INTO reports (patient_id, report_id, report_path, scan_count, tumor_count, no_tumor_count)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                RETURNING id, report_id
-            """, (patient_id, report_id, report_path, scan_count, tumor_count, no_tumor_count))
-            
-            result = cursor.fetchone()
-            self.connection.commit()
-            cursor.close()
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO reports (patient_id, report_id, report_path, report_filename, scan_count, tumor_count,
+                                         no_tumor_count, status, completed_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, 'ready', CURRENT_TIMESTAMP)
+                    RETURNING id, report_id
+                """, (patient_id, report_id, report_path, os.path.basename(report_path), scan_count, tumor_count, no_tumor_count))
+                
+                result = cursor.fetchone()
+                self._bump_counters(cursor, total_reports=1)
+            self.invalidate_stats_cache()
             
             return result
             
         except Exception as e:
             print(f"Error adding report: {e}")
-            # Try to reconnect and retry once
-            try:
-                print("Attempting to reconnect and retry add report...")
-                self.connect()
-                return self.add_report(patient_id, report_path, scan_count, tumor_count, no_tumor_count)
-            except Exception as retry_error:
-                print(f"Retry failed: {retry_error}")
-                return None
+            return None
     
-    def get_patient_reports(self, patient_id):
-        """Get all reports for a patient"""
+    def add_pending_report(self, patient_id, scan_ids, scan_count, tumor_count, no_tumor_count):
+        """Add a report record whose PDF will be generated in the background"""
         try:
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+            report_id = f"R{str(uuid.uuid4())[:8].upper()}"
             
-            cursor.execute("""
-                SELECT * FROM reports WHERE patient_id = %s ORDER BY created_at DESC
-            """, (patient_id,))
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO reports (patient_id, report_id, scan_ids, scan_count, tumor_count, no_tumor_count, status)
+                    VALUES (%s, %s, %s, %s, %s, %s, 'pending')
+                    RETURNING id, report_id, status
+                """, (patient_id, report_id, Json(list(scan_ids)), scan_count, tumor_count, no_tumor_count))
+                
+                result = cursor.fetchone()
+                self._bump_counters(cursor, total_reports=1)
+            self.invalidate_stats_cache()
+            
+            return result
+            
+        except Exception as e:
+            print(f"Error adding pending report: {e}")
+            return None
+    
+    def claim_report(self, report_id=None, stale_after=300, max_attempts=3):
+        """Claim a pending report for generation; the given one, or else the oldest claimable one"""
+        try:
+            with self.cursor() as cursor:
+                # Reports whose generator died too many times are given up on
+                cursor.execute("""
+                    UPDATE reports
+                    SET status = 'failed', error = 'Report generation abandoned too many times',
+                        completed_at = CURRENT_TIMESTAMP
+                    WHERE status = 'pending' AND attempts >= %s
+                      AND started_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                """, (max_attempts, stale_after))
+                cursor.execute("""
+                    UPDATE reports
+                    SET attempts = attempts + 1, started_at = CURRENT_TIMESTAMP
+                    WHERE id = (
+                        SELECT id FROM reports
+                        WHERE status = 'pending'
+                          AND (started_at IS NULL OR started_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+                          AND (%s IS NULL OR report_id = %s)
+                        ORDER BY created_at
+                        FOR UPDATE SKIP LOCKED
+                        LIMIT 1
+                    )
+                    RETURNING *
+                """, (stale_after, report_id, report_id))
+                report = cursor.fetchone()
+            
+            return report
             
-            reports = cursor.fetchall()
-            cursor.close()
+        except Exception as e:
+            print(f"Error claiming report: {e}")
+            return None
+    
+    def finish_report(self, report_pk, status, report_path=None, error=None):
+        """Mark a claimed report as ready (with its stored path) or failed"""
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE reports
+                    SET status = %s, report_path = COALESCE(%s, report_path), report_filename = COALESCE(%s, report_filename),
+                        error = %s, completed_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (status, report_path, os.path.basename(report_path) if report_path else None, error, report_pk))
+            return True
+        except Exception as e:
+            print(f"Error finishing report: {e}")
+            return False
+    
+    def get_report(self, report_id):
+        """Get a report's generation status and storage path"""
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    SELECT report_id, patient_id, status, report_path, scan_count, tumor_count, no_tumor_count,
+                           error, created_at, completed_at
+                    FROM reports WHERE report_id = %s
+                """, (report_id,))
+                report = cursor.fetchone()
+            return report
+        except Exception as e:
+            print(f"Error getting report: {e}")
+            return None
+    
+    def get_patient_reports(self, patient_id):
+        """Get all reports for a patient"""
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    SELECT * FROM reports WHERE patient_id = %s ORDER BY created_at DESC
+                """, (patient_id,))
+                
+                reports = cursor.fetchall()
             
             return reports
             
@@ -376,78 +483,88 @@ class Database:
             return []
     
     def get_dashboard_stats(self):
-        """Get dashboard statistics"""
+        """Get dashboard statistics from the incrementally maintained counters"""
+        with self._stats_lock:
+            if self._stats_cache is not None and time.monotonic() < self._stats_cache_expires:
+                return self._stats_cache
         try:
-            # Ensure connection is active
-            self.ensure_connection()
-            
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            
-            # Total patients
-            cursor.execute("SELECT COUNT(*) as total_patients FROM patients")
-            total_patients = cursor.fetchone()['total_patients']
-            
-            # Total scans
-            cursor.execute("SELECT COUNT(*) as total_scans FROM scans")
-            total_scans = cursor.fetchone()['total_scans']
-            
-            # Total reports
-            cursor.execute("SELECT COUNT(*) as total_reports FROM reports")
-            total_reports = cursor.fetchone()['total_reports']
-            
-            # Tumor detection stats
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_scans,
-                    COALESCE(SUM(CASE WHEN prediction = 'Tumor' THEN 1 ELSE 0 END), 0) as tumor_count,
-                    COALESCE(SUM(CASE WHEN prediction = 'No Tumor' THEN 1 ELSE 0 END), 0) as no_tumor_count
-                FROM scans
-            """)
-            scan_stats = cursor.fetchone()
-            
-            cursor.close()
-            
-            return {
-                'total_patients': total_patients or 0,
-                'total_scans': total_scans or 0,
-                'total_reports': total_reports or 0,
-                'scan_stats': scan_stats or {
-                    'total_scans': 0,
-                    'tumor_count': 0,
-                    'no_tumor_count': 0
+            with self.cursor() as cursor:
+                cursor.execute("SELECT * FROM dashboard_counters WHERE id = 1")
+                counters = cursor.fetchone()
+            
+            if counters is None:
+                counters = self.reconcile_dashboard_counters()
+            
+            stats = {
+                'total_patients': counters['total_patients'] or 0,
+                'total_scans': counters['total_scans'] or 0,
+                'total_reports': counters['total_reports'] or 0,
+                'scan_stats': {
+                    'total_scans': counters['total_scans'] or 0,
+                    'tumor_count': counters['tumor_count'] or 0,
+                    'no_tumor_count': counters['no_tumor_count'] or 0
                 }
             }
+            with self._stats_lock:
+                self._stats_cache = stats
+                self._stats_cache_expires = time.monotonic() + self.stats_cache_ttl
+            return stats
             
         except Exception as e:
             print(f"Error getting dashboard stats: {e}")
-            # Try to reconnect and retry once
-            try:
-                print("Attempting to reconnect and retry dashboard stats...")
-                self.connect()
-                return self.get_dashboard_stats()
-            except Exception as retry_error:
-                print(f"Retry failed: {retry_error}")
-                return {}
+            return {}
+    
+    def invalidate_stats_cache(self):
+        with self._stats_lock:
+            self._stats_cache = None
+    
+    def _bump_counters(self, cursor, **deltas):
+        """Apply counter deltas inside the caller's transaction"""
+        assignments = ', '.join(f"{column} = {column} + %s" for column in deltas)
+        cursor.execute(
+            f"UPDATE dashboard_counters SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = 1",
+            tuple(deltas.values())
+        )
+    
+    def reconcile_dashboard_counters(self):
+        """Recompute the dashboard counters from the base tables and return them"""
+        with self.cursor() as cursor:
+            # Locking the counters row makes concurrent writers wait to apply their deltas
+            # until the recount has committed, so none of them are lost or double counted
+            cursor.execute("""
+                INSERT INTO dashboard_counters (id) VALUES (1) ON CONFLICT (id) DO NOTHING
+            """)
+            cursor.execute("SELECT id FROM dashboard_counters WHERE id = 1 FOR UPDATE")
+            cursor.execute("""
+                UPDATE dashboard_counters SET
+                    total_patients = (SELECT COUNT(*) FROM patients),
+                    total_scans = (SELECT COUNT(*) FROM scans),
+                    total_reports = (SELECT COUNT(*) FROM reports),
+                    tumor_count = (SELECT COUNT(*) FROM scans WHERE prediction = 'Tumor'),
+                    no_tumor_count = (SELECT COUNT(*) FROM scans WHERE prediction = 'No Tumor'),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = 1
+                RETURNING *
+            """)
+            counters = cursor.fetchone()
+        self.invalidate_stats_cache()
+        return counters
 
     def get_admin_by_credentials(self, username, password):
         """Authenticate admin login"""
         try:
-            # Ensure connection is active
-            self.ensure_connection()
-            
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
             password_hash = self.hash_password(password)
             
             print(f"🔍 Database: Checking admin credentials")
             print(f"   Username: {username}")
             print(f"   Password hash: {password_hash}")
             
-            cursor.execute("""
-                SELECT * FROM admins WHERE username = %s AND password_hash = %s
-            """, (username, password_hash))
-            
-            admin = cursor.fetchone()
-            cursor.close()
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    SELECT * FROM admins WHERE username = %s AND password_hash = %s
+                """, (username, password_hash))
+                
+                admin = cursor.fetchone()
             
             print(f"🔍 Database: Admin found: {admin is not None}")
             if admin:
@@ -457,76 +574,312 @@ class Database:
             
         except Exception as e:
             print(f"Error authenticating admin: {e}")
-            # Try to reconnect and retry once
-            try:
-                print("Attempting to reconnect and retry admin auth...")
-                self.connect()
-                return self.get_admin_by_credentials(username, password)
-            except Exception as retry_error:
-                print(f"Retry failed: {retry_error}")
-                return None
+            return None
 
-    def get_all_scans(self):
-        """Get all scans with patient information"""
+    def get_all_scans(self, limit=DEFAULT_PAGE_SIZE, cursor=None, prediction=None, patient_id=None,
+                      created_from=None, created_to=None):
+        """Get one page of scans with patient information, newest first"""
+        after = decode_cursor(cursor) if cursor else None
         try:
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            
-            cursor.execute("""
-                SELECT s.*, p.name as patient_name, p.patient_id as patient_identifier
-                FROM scans s
-                JOIN patients p ON s.patient_id = p.id
-                ORDER BY s.created_at DESC
-            """)
-            
-            scans = cursor.fetchall()
-            cursor.close()
-            
-            return scans
+            conditions, params = self._date_range_conditions('s', created_from, created_to)
+            if prediction:
+                conditions.append("s.prediction = %s")
+                params.append(prediction)
+            if patient_id:
+                conditions.append("s.patient_id = %s")
+                params.append(patient_id)
+            query = f"SELECT {SCAN_LIST_COLUMNS} FROM scans s JOIN patients p ON s.patient_id = p.id"
+            return self._fetch_page(query, conditions, params, 's', limit, after)
             
         except Exception as e:
             print(f"Error getting all scans: {e}")
-            return []
+            return {'items': [], 'next_cursor': None}
 
-    def get_all_reports(self):
-        """Get all reports with patient information"""
+    def get_all_reports(self, limit=DEFAULT_PAGE_SIZE, cursor=None, patient_id=None,
+                        created_from=None, created_to=None):
+        """Get one page of reports with patient information, newest first"""
+        after = decode_cursor(cursor) if cursor else None
         try:
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            
-            cursor.execute("""
-                SELECT r.*, p.name as patient_name, p.patient_id as patient_identifier
-                FROM reports r
-                JOIN patients p ON r.patient_id = p.id
-                ORDER BY r.created_at DESC
-            """)
-            
-            reports = cursor.fetchall()
-            cursor.close()
-            
-            return reports
+            conditions, params = self._date_range_conditions('r', created_from, created_to)
+            if patient_id:
+                conditions.append("r.patient_id = %s")
+                params.append(patient_id)
+            query = f"SELECT {REPORT_LIST_COLUMNS} FROM reports r JOIN patients p ON r.patient_id = p.id"
+            return self._fetch_page(query, conditions, params, 'r', limit, after)
             
         except Exception as e:
             print(f"Error getting all reports: {e}")
-            return []
+            return {'items': [], 'next_cursor': None}
+    
+    def _date_range_conditions(self, alias, created_from, created_to):
+        conditions, params = [], []
+        if created_from:
+            conditions.append(f"{alias}.created_at >= %s")
+            params.append(created_from)
+        if created_to:
+            conditions.append(f"{alias}.created_at < %s")
+            params.append(created_to)
+        return conditions, params
+    
+    def _fetch_page(self, query, conditions, params, alias, limit, after):
+        """Run a list query with keyset pagination on (created_at, id) descending"""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        if after:
+            conditions = conditions + [f"({alias}.created_at, {alias}.id) < (%s, %s)"]
+            params = params + list(after)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # Fetch one extra row to know whether another page exists
+        query += f" ORDER BY {alias}.created_at DESC, {alias}.id DESC LIMIT %s"
+        with self.cursor() as cursor:
+            cursor.execute(query, params + [limit + 1])
+            rows = cursor.fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+        return {'items': rows, 'next_cursor': next_cursor}
+    
+    def find_scans_by_content_hash(self, content_hashes, model_version):
+        """Get the latest scan analysed by model_version for each content hash, keyed by hash"""
+        if not content_hashes:
+            return {}
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    SELECT DISTINCT ON (content_hash) scan_id, content_hash, original_path, heatmap_path, overlay_path,
+                           prediction, confidence, probability
+                    FROM scans
+                    WHERE content_hash = ANY(%s) AND model_version = %s
+                    ORDER BY content_hash, created_at DESC
+                """, (list(content_hashes), model_version))
+                rows = cursor.fetchall()
+            return {row['content_hash']: row for row in rows}
+        except Exception as e:
+            print(f"Error finding scans by content hash: {e}")
+            return {}
     
     def get_scans_by_ids(self, scan_ids):
         if not scan_ids:
             return []
         try:
-            self.ensure_connection()
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
             format_strings = ','.join(['%s'] * len(scan_ids))
-            cursor.execute(f"SELECT * FROM scans WHERE scan_id IN ({format_strings})", tuple(scan_ids))
-            rows = cursor.fetchall()
-            cursor.close()
+            with self.cursor() as cursor:
+                cursor.execute(f"SELECT * FROM scans WHERE scan_id IN ({format_strings})", tuple(scan_ids))
+                rows = cursor.fetchall()
             return rows
         except Exception as e:
             print(f"Error getting scans by IDs: {e}")
             return []
     
+    def add_study(self, patient_id, slice_count, aggregation, top_k, prediction, confidence, probability,
+                  slice_results, model_version=None):
+        """Add a study record for a whole series; its key slices are added as scans afterwards"""
+        try:
+            study_id = f"T{str(uuid.uuid4())[:8].upper()}"
+            
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO studies (study_id, patient_id, slice_count, aggregation, top_k, prediction,
+                                         confidence, probability, slice_results, model_version)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id, study_id, created_at
+                """, (study_id, patient_id, slice_count, aggregation, top_k, prediction, confidence, probability,
+                      Json(slice_results), model_version))
+                
+                result = cursor.fetchone()
+            
+            return result
+            
+        except Exception as e:
+            print(f"Error adding study: {e}")
+            return None
+    
+    def get_study(self, study_id):
+        """Get a study with its per-slice probabilities and its key slice scans, most suspicious first"""
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("SELECT * FROM studies WHERE study_id = %s", (study_id,))
+                study = cursor.fetchone()
+                if study is None:
+                    return None
+                cursor.execute("""
+                    SELECT * FROM scans WHERE study_id = %s ORDER BY probability DESC, slice_index
+                """, (study['id'],))
+                study['key_slices'] = cursor.fetchall()
+            
+            return study
+            
+        except Exception as e:
+            print(f"Error getting study: {e}")
+            return None
+    
+    def get_patient_studies(self, patient_id):
+        """Get all studies of a patient, without their per-slice results"""
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    SELECT id, study_id, patient_id, slice_count, aggregation, top_k, prediction, confidence,
+                           probability, model_version, created_at
+                    FROM studies WHERE patient_id = %s ORDER BY created_at DESC
+                """, (patient_id,))
+                
+                studies = cursor.fetchall()
+            
+            return studies
+            
+        except Exception as e:
+            print(f"Error getting patient studies: {e}")
+            return []
+    
+    def create_scan_job(self, patient_id, files):
+        """Queue a scan-processing job for (original_filename, file bytes) pairs and return its job ID"""
+        try:
+            job_id = f"J{str(uuid.uuid4())[:8].upper()}"
+            
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO scan_jobs (job_id, patient_id, total_files)
+                    VALUES (%s, %s, %s)
+                    RETURNING id
+                """, (job_id, patient_id, len(files)))
+                job_pk = cursor.fetchone()['id']
+                execute_values(cursor, """
+                    INSERT INTO scan_job_files (job_id, position, original_filename, content) VALUES %s
+                """, [(job_pk, position, filename, psycopg2.Binary(content))
+                      for position, (filename, content) in enumerate(files)])
+            
+            return job_id
+            
+        except Exception as e:
+            print(f"Error creating scan job: {e}")
+            return None
+    
+    def claim_scan_job(self, worker_id, stale_after=300, max_attempts=3):
+        """Atomically claim the oldest pending (or abandoned) scan job for a worker"""
+        try:
+            with self.cursor() as cursor:
+                # Jobs whose worker stopped heart-beating too many times are given up on
+                cursor.execute("""
+                    UPDATE scan_jobs
+                    SET status = 'failed', error = 'Job abandoned by workers too many times',
+                        finished_at = CURRENT_TIMESTAMP
+                    WHERE status = 'running' AND attempts >= %s
+                      AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                """, (max_attempts, stale_after))
+                cursor.execute("""
+                    UPDATE scan_jobs
+                    SET status = 'running', worker_id = %s, attempts = attempts + 1,
+                        started_at = COALESCE(started_at, CURRENT_TIMESTAMP),
+                        heartbeat_at = CURRENT_TIMESTAMP
+                    WHERE id = (
+                        SELECT id FROM scan_jobs
+                        WHERE status = 'pending'
+                           OR (status = 'running' AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+                        ORDER BY created_at
+                        FOR UPDATE SKIP LOCKED
+                        LIMIT 1
+                    )
+                    RETURNING *
+                """, (worker_id, stale_after))
+                job = cursor.fetchone()
+            
+            return job
+            
+        except Exception as e:
+            print(f"Error claiming scan job: {e}")
+            return None
+    
+    def iter_pending_scan_job_files(self, job_pk, batch_size=SCAN_JOB_FILE_BATCH_SIZE):
+        """Yield the files of a job that have not been processed yet, with their contents.
+
+        Files are read batch_size at a time in position order, each batch on a briefly
+        borrowed connection, so only one batch of uploads is in memory and no connection is
+        held while they are processed. A failed read raises, since stopping early would
+        leave the rest of the job unprocessed.
+        """
+        after = -1
+        while True:
+            try:
+                with self.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT position, original_filename, content FROM scan_job_files
+                        WHERE job_id = %s AND status = 'pending' AND position > %s
+                        ORDER BY position
+                        LIMIT %s
+                    """, (job_pk, after, batch_size))
+                    files = cursor.fetchall()
+            except Exception as e:
+                print(f"Error getting scan job files: {e}")
+                raise
+            
+            yield from files
+            if len(files) < batch_size:
+                return
+            after = files[-1]['position']
+    
+    def record_scan_job_file_result(self, job_pk, position, result):
+        """Store one file's result, drop its uploaded bytes and advance the job's progress"""
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE scan_job_files SET status = %s, result = %s, content = NULL
+                    WHERE job_id = %s AND position = %s
+                """, ('completed' if result.get('success') else 'failed', Json(result), job_pk, position))
+                cursor.execute("""
+                    UPDATE scan_jobs SET processed_files = processed_files + 1, heartbeat_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (job_pk,))
+            
+            return True
+            
+        except Exception as e:
+            print(f"Error recording scan job progress: {e}")
+            return False
+    
+    def finish_scan_job(self, job_pk, status, result=None, error=None):
+        """Mark a scan job as completed or failed"""
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE scan_jobs SET status = %s, result = %s, error = %s, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (status, Json(result) if result is not None else None, error, job_pk))
+            
+            return True
+            
+        except Exception as e:
+            print(f"Error finishing scan job: {e}")
+            return False
+    
+    def get_scan_job(self, job_id):
+        """Get a scan job with per-file progress (without file contents)"""
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("""
+                    SELECT id, job_id, patient_id, status, total_files, processed_files, attempts,
+                           result, error, created_at, started_at, finished_at
+                    FROM scan_jobs WHERE job_id = %s
+                """, (job_id,))
+                job = cursor.fetchone()
+                if job is None:
+                    return None
+                cursor.execute("""
+                    SELECT position, original_filename, status, result FROM scan_job_files
+                    WHERE job_id = %s ORDER BY position
+                """, (job['id'],))
+                job['files'] = cursor.fetchall()
+            
+            return job
+            
+        except Exception as e:
+            print(f"Error getting scan job: {e}")
+            return None
+    
     def close(self):
-        """Close database connection"""
-        if self.connection:
-            self.connection.close()
+        """Close all pooled database connections"""
+        if self.pool:
+            self.pool.closeall()
 
 # Initialize database
 db = Database() 
\ No newline at end of file
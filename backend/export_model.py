@@ -0,0 +1,63 @@
+"""Export the trained classifier to the TorchScript artifact the server loads at startup.
+
+Usage (from the backend directory):
+    python export_model.py [--output PATH]
+
+The trunk is scripted and frozen, which folds every batch norm into its convolution; the
+head is stored alongside it so Grad-CAM keeps working. The export is checked against the
+eager checkpoint before this exits, and is written to EXPORTED_MODEL_PATH by default.
+Re-run it after replacing the checkpoint; a stale artifact is ignored at startup.
+"""
+import argparse
+import os
+import sys
+import time
+
+
+def time_per_image(fn, batch, iterations):
+    fn(batch)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(batch)
+    return (time.perf_counter() - start) / (iterations * batch.shape[0]) * 1000
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='defaults to EXPORTED_MODEL_PATH')
+    parser.add_argument('--tolerance', type=float, default=1e-4, help='largest allowed probability difference')
+    args = parser.parse_args(argv[1:])
+
+    # Export from the eager checkpoint, whatever the server is configured to use
+    os.environ['INFERENCE_PRECISION'] = 'fp32'
+    os.environ['USE_EXPORTED_MODEL'] = 'false'
+    import torch
+    from models.brain_tumor_model import model, device, gradcam, checkpoint_stamp, EXPORTED_MODEL_PATH, MODEL_PATH, MODEL_VERSION
+    from models.model_export import classifier_head, export_trunk, load_exported_model, save_exported_model
+
+    # Python forward hooks cannot be scripted
+    gradcam.remove_hooks()
+    output = args.output or EXPORTED_MODEL_PATH
+    with torch.no_grad():
+        save_exported_model(export_trunk(model), classifier_head(model), output, MODEL_VERSION, checkpoint_stamp(MODEL_PATH))
+    features, head = load_exported_model(output, MODEL_VERSION, map_location=device)
+    exported = torch.nn.Sequential(features, head)
+
+    torch.manual_seed(0)
+    batch = torch.randn(8, 3, 224, 224).to(device)
+    with torch.no_grad():
+        difference = (torch.sigmoid(model(batch)) - torch.sigmoid(exported(batch))).abs().max().item()
+        eager_ms = time_per_image(model, batch, 5)
+        exported_ms = time_per_image(exported, batch, 5)
+    print(f"Exported model version {MODEL_VERSION} to {output} ({os.path.getsize(output) / 1e6:.1f} MB)")
+    print(f"max probability difference: {difference:.2e}")
+    print(f"predict ms/img: eager {eager_ms:.2f}, exported {exported_ms:.2f}")
+    if difference > args.tolerance:
+        print(f"FAILED: difference above {args.tolerance:.0e}; removing {output}")
+        os.remove(output)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
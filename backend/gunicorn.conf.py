@@ -0,0 +1,33 @@
+"""gunicorn settings for serving the API from several worker processes.
+
+Usage (from the backend directory):
+    gunicorn -c gunicorn.conf.py app:app
+
+The app and the model are loaded once in the master, and the forked workers share the
+model's memory (see serving.py). WEB_WORKERS sets the number of processes and WEB_THREADS
+the request threads in each; INFERENCE_THREADS cores are split evenly between the workers.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv('config.env')
+
+from serving import preload_model, init_worker, threads_per_worker
+
+bind = os.getenv('WEB_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 4))
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+preload_app = True
+
+
+def on_starting(server):
+    version = preload_model()
+    server.log.info(f"Loaded model {version} in the master")
+
+
+def post_fork(server, worker):
+    version = init_worker(server.cfg.workers)
+    server.log.info(f"Worker {worker.pid} ready with model {version}, "
+                    f"{threads_per_worker(server.cfg.workers)} torch thread(s)")
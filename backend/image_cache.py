@@ -0,0 +1,157 @@
+"""Disk-backed LRU cache for the scan images embedded in PDF reports.
+
+Entries are keyed by image URL (Cloudinary URLs carry the public_id and version, so a URL
+always names the same content) and stored as one file per key under a two-level
+directory. Writes go to a temporary file that is renamed into place, so a reader in
+another thread or process never sees a partial image. The least recently used files are
+deleted once the cache grows past its byte budget.
+
+Several processes may share the directory. Each keeps an index of the files in it, read
+from disk on first use and again whenever the process has written another
+1/RESCAN_FRACTION of the budget, so eviction works from what all of them have stored.
+Hits refresh a file's modification time, which orders the index across processes.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Share of the budget a process writes before it re-reads the directory; processes
+# sharing the cache can overshoot the budget by about this much each between re-reads
+RESCAN_FRACTION = 16
+
+
+class DiskImageCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # File path -> size, least recently used first; read from disk on first use
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        # Bytes this process has written since the index was last read from disk
+        self._written = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _load_index(self):
+        """Rebuild the LRU order from the files on disk, oldest access first"""
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.startswith('.tmp'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+        self._entries = OrderedDict((path, size) for _, path, size in sorted(files))
+        self._total_bytes = sum(self._entries.values())
+        self._written = 0
+        self._loaded = True
+
+    def get(self, key):
+        """Return the cached bytes for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+                # Evicted by another process
+                size = self._entries.pop(path, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+        with self._lock:
+            self.hits += 1
+            if path in self._entries:
+                self._entries.move_to_end(path)
+            elif self._loaded:
+                # Written by another process
+                self._entries[path] = len(data)
+                self._total_bytes += len(data)
+        try:
+            # The modification time doubles as the access time across restarts
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """Store bytes under key, evicting least recently used entries past the budget"""
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing image cache entry: {e}")
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load_index()
+            size = self._entries.pop(path, None)
+            if size is not None:
+                self._total_bytes -= size
+            self._entries[path] = len(data)
+            self._total_bytes += len(data)
+            self._written += len(data)
+            if self._written > self.max_bytes // RESCAN_FRACTION:
+                # Pick up what other processes have written since
+                self._load_index()
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            if self.enabled and not self._loaded:
+                self._load_index()
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+# Set REPORT_IMAGE_CACHE_MAX_BYTES=0 to disable the cache
+image_cache = DiskImageCache(
+    os.getenv('REPORT_IMAGE_CACHE_DIR', 'image_cache'),
+    int(os.getenv('REPORT_IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+)
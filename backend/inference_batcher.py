@@ -0,0 +1,110 @@
+"""Micro-batching of concurrent inference requests.
+
+Request threads hand their preprocessed image tensors to one inference thread. That
+thread combines the requests waiting for it into a single forward pass of up to
+max_batch_size images and gives each request its own slice of the results. A request
+waits at most max_wait for others to join it; requests that queued up while the previous
+batch was running join the next one without waiting. Under concurrent uploads the model
+therefore runs a few larger batches instead of many single-image passes competing for the
+same cores.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Set to false to run every request's forward pass on its own request thread
+INFERENCE_MICRO_BATCHING = os.getenv('INFERENCE_MICRO_BATCHING', 'true').lower() == 'true'
+# Longest a request waits for others to share its forward pass
+INFERENCE_BATCH_WAIT_MS = float(os.getenv('INFERENCE_BATCH_WAIT_MS', 5))
+
+
+class InferenceBatcher:
+    """Runs run_batch(list of image tensors) -> per-image results on a dedicated thread"""
+    def __init__(self, run_batch, max_batch_size, max_wait):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.images = 0
+        self.requests = 0
+
+    def _ensure_thread(self):
+        # Started on first use, and again in a forked child, which inherits no threads
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._loop, args=(self._queue,), name="inference-batcher", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def submit(self, tensors):
+        """Queue up to max_batch_size image tensors and return a Future of their results"""
+        if not tensors or len(tensors) > self.max_batch_size:
+            raise ValueError(f"A request must have between 1 and {self.max_batch_size} images")
+        if self._pid != os.getpid():
+            self._ensure_thread()
+        future = Future()
+        self._queue.put((list(tensors), future, time.monotonic()))
+        return future
+
+    def run(self, tensors):
+        """Per-image results for any number of image tensors, in order"""
+        futures = [
+            self.submit(tensors[start:start + self.max_batch_size])
+            for start in range(0, len(tensors), self.max_batch_size)
+        ]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'images': self.images,
+            'mean_batch_size': self.images / self.batches if self.batches else 0
+        }
+
+    def _loop(self, requests_queue):
+        carried = None
+        while True:
+            first = carried or requests_queue.get()
+            carried = None
+            batch = [first]
+            count = len(first[0])
+            deadline = first[2] + self.max_wait
+            while count < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    request = requests_queue.get(timeout=timeout) if timeout > 0 else requests_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if count + len(request[0]) > self.max_batch_size:
+                    # Requests are never split; this one starts the next batch
+                    carried = request
+                    break
+                batch.append(request)
+                count += len(request[0])
+            self._run(batch)
+
+    def _run(self, batch):
+        try:
+            results = self.run_batch([tensor for tensors, _, _ in batch for tensor in tensors])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.requests += len(batch)
+        self.images += len(results)
+        start = 0
+        for tensors, future, _ in batch:
+            future.set_result(results[start:start + len(tensors)])
+            start += len(tensors)
@@ -0,0 +1,258 @@
+"""Versioned schema migrations.
+
+Each migration is applied once, in order, inside its own transaction and recorded in
+the schema_migrations table. A PostgreSQL advisory lock keeps several workers starting
+at the same time from applying the same migration twice.
+
+Usage (from the backend directory):
+    python migrations.py upgrade    Apply all pending migrations
+    python migrations.py status     Show applied and pending migrations
+"""
+import os
+import sys
+
+# Arbitrary application-wide key for pg_advisory_xact_lock
+MIGRATION_LOCK_ID = 7263041
+
+MIGRATIONS = [
+    (1, "initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS patients (
+            id SERIAL PRIMARY KEY,
+            patient_id VARCHAR(50) UNIQUE NOT NULL,
+            name VARCHAR(100) NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            age INTEGER,
+            gender VARCHAR(10),
+            phone VARCHAR(20),
+            address TEXT,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS scans (
+            id SERIAL PRIMARY KEY,
+            patient_id INTEGER REFERENCES patients(id),
+            scan_id VARCHAR(50) UNIQUE NOT NULL,
+            original_filename VARCHAR(255) NOT NULL,
+            original_path VARCHAR(500),
+            heatmap_path VARCHAR(500),
+            overlay_path VARCHAR(500),
+            prediction VARCHAR(20) NOT NULL,
+            confidence DECIMAL(5,3),
+            probability DECIMAL(5,3),
+            report_path VARCHAR(500),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS reports (
+            id SERIAL PRIMARY KEY,
+            patient_id INTEGER REFERENCES patients(id),
+            report_id VARCHAR(50) UNIQUE NOT NULL,
+            report_path VARCHAR(500) NOT NULL,
+            scan_count INTEGER DEFAULT 0,
+            tumor_count INTEGER DEFAULT 0,
+            no_tumor_count INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS admins (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "indexes for hot query paths", [
+        # Per-patient scan and report listings, newest first
+        "CREATE INDEX IF NOT EXISTS idx_scans_patient_created ON scans (patient_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_reports_patient_created ON reports (patient_id, created_at DESC)",
+        # Keyset pagination of the admin list views
+        "CREATE INDEX IF NOT EXISTS idx_patients_created_id ON patients (created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_scans_created_id ON scans (created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_reports_created_id ON reports (created_at DESC, id DESC)",
+        # Prediction counts and the prediction filter
+        "CREATE INDEX IF NOT EXISTS idx_scans_prediction_created ON scans (prediction, created_at DESC, id DESC)",
+    ]),
+    (3, "stored report filename", [
+        "ALTER TABLE reports ADD COLUMN IF NOT EXISTS report_filename VARCHAR(255)",
+        "UPDATE reports SET report_filename = regexp_replace(report_path, '^.*/', '') WHERE report_filename IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_reports_report_filename ON reports (report_filename)",
+    ]),
+    (4, "dashboard counters", [
+        """
+        CREATE TABLE IF NOT EXISTS dashboard_counters (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_patients BIGINT NOT NULL DEFAULT 0,
+            total_scans BIGINT NOT NULL DEFAULT 0,
+            total_reports BIGINT NOT NULL DEFAULT 0,
+            tumor_count BIGINT NOT NULL DEFAULT 0,
+            no_tumor_count BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        INSERT INTO dashboard_counters (id, total_patients, total_scans, total_reports, tumor_count, no_tumor_count)
+        SELECT 1,
+               (SELECT COUNT(*) FROM patients),
+               (SELECT COUNT(*) FROM scans),
+               (SELECT COUNT(*) FROM reports),
+               (SELECT COUNT(*) FROM scans WHERE prediction = 'Tumor'),
+               (SELECT COUNT(*) FROM scans WHERE prediction = 'No Tumor')
+        ON CONFLICT (id) DO NOTHING
+        """,
+    ]),
+    (5, "scan processing jobs", [
+        """
+        CREATE TABLE IF NOT EXISTS scan_jobs (
+            id SERIAL PRIMARY KEY,
+            job_id VARCHAR(50) UNIQUE NOT NULL,
+            patient_id INTEGER REFERENCES patients(id),
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            total_files INTEGER NOT NULL DEFAULT 0,
+            processed_files INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker_id VARCHAR(100),
+            result JSONB,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            heartbeat_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS scan_job_files (
+            id SERIAL PRIMARY KEY,
+            job_id INTEGER NOT NULL REFERENCES scan_jobs(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            original_filename VARCHAR(255),
+            content BYTEA,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            result JSONB,
+            UNIQUE (job_id, position)
+        )
+        """,
+        # Workers pick the oldest claimable job
+        "CREATE INDEX IF NOT EXISTS idx_scan_jobs_status_created ON scan_jobs (status, created_at)",
+    ]),
+    (6, "deferred report generation", [
+        # Reports that already exist were generated synchronously
+        "ALTER TABLE reports ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'ready'",
+        "ALTER TABLE reports ALTER COLUMN status SET DEFAULT 'pending'",
+        "ALTER TABLE reports ALTER COLUMN report_path DROP NOT NULL",
+        "ALTER TABLE reports ADD COLUMN IF NOT EXISTS scan_ids JSONB",
+        "ALTER TABLE reports ADD COLUMN IF NOT EXISTS error TEXT",
+        "ALTER TABLE reports ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE reports ADD COLUMN IF NOT EXISTS started_at TIMESTAMP",
+        "ALTER TABLE reports ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP",
+        "CREATE INDEX IF NOT EXISTS idx_reports_status_created ON reports (status, created_at)",
+    ]),
+    (7, "scan content hashes", [
+        "ALTER TABLE scans ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+        "ALTER TABLE scans ADD COLUMN IF NOT EXISTS model_version VARCHAR(64)",
+        # Lookup of an identical image already analysed by the same model
+        """
+        CREATE INDEX IF NOT EXISTS idx_scans_content_hash_model
+        ON scans (content_hash, model_version, created_at DESC) WHERE content_hash IS NOT NULL
+        """,
+    ]),
+    (8, "series studies", [
+        """
+        CREATE TABLE IF NOT EXISTS studies (
+            id SERIAL PRIMARY KEY,
+            study_id VARCHAR(50) UNIQUE NOT NULL,
+            patient_id INTEGER REFERENCES patients(id),
+            slice_count INTEGER NOT NULL DEFAULT 0,
+            aggregation VARCHAR(20) NOT NULL,
+            top_k INTEGER NOT NULL,
+            prediction VARCHAR(20) NOT NULL,
+            confidence DECIMAL(5,3),
+            probability DECIMAL(5,3),
+            slice_results JSONB,
+            model_version VARCHAR(64),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_studies_patient_created ON studies (patient_id, created_at DESC)",
+        # Key slices of a study are stored as scans linked to it
+        "ALTER TABLE scans ADD COLUMN IF NOT EXISTS study_id INTEGER REFERENCES studies(id)",
+        "ALTER TABLE scans ADD COLUMN IF NOT EXISTS slice_index INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_scans_study ON scans (study_id) WHERE study_id IS NOT NULL",
+    ]),
+]
+
+
+def ensure_migrations_table(db):
+    with db.cursor(cursor_factory=None) as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(200) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+
+def get_applied_versions(db):
+    """Return the set of migration versions already recorded in the database"""
+    with db.cursor(cursor_factory=None) as cursor:
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def pending_migrations(db):
+    applied = get_applied_versions(db)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def run_migrations(db):
+    """Apply every pending migration in order and return the versions that were applied"""
+    ensure_migrations_table(db)
+    applied = []
+    for version, name, statements in pending_migrations(db):
+        with db.cursor(cursor_factory=None) as cursor:
+            # Serialize concurrent runners, then re-check under the lock
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cursor.fetchone():
+                continue
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    return applied
+
+
+def main(argv):
+    # Keep the database module from migrating on import so status reports the real state
+    os.environ['DB_AUTO_MIGRATE'] = 'false'
+    from database import db
+
+    command = argv[1] if len(argv) > 1 else "upgrade"
+    if command == "upgrade":
+        applied = run_migrations(db)
+        if not applied:
+            print("Database schema is up to date")
+    elif command == "status":
+        ensure_migrations_table(db)
+        applied = get_applied_versions(db)
+        for version, name, _ in MIGRATIONS:
+            state = "applied" if version in applied else "pending"
+            print(f"{version:>4}  {state:<8} {name}")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,16 +1,31 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torchvision.models as models
 import torchvision.transforms as transforms
 from torchvision.models import ResNet18_Weights
 import numpy as np
-import cv2
+import threading
+import hashlib
 
 # Device configuration
 import os
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# Largest number of images stacked into a single forward pass
+MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 16))
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'brain_tumor_detection_model_complete.pth')
+
+# 'int8' runs the convolutional trunk quantized on CPU; build the file with quantize_model.py
+INFERENCE_PRECISION = os.getenv('INFERENCE_PRECISION', 'fp32').lower()
+QUANTIZED_MODEL_PATH = os.getenv('QUANTIZED_MODEL_PATH', os.path.join(os.path.dirname(__file__), 'brain_tumor_model_int8.pt'))
+
+# fp32 TorchScript export of the checkpoint, built with export_model.py; used when present
+USE_EXPORTED_MODEL = os.getenv('USE_EXPORTED_MODEL', 'true').lower() == 'true'
+EXPORTED_MODEL_PATH = os.getenv('EXPORTED_MODEL_PATH', os.path.join(os.path.dirname(__file__), 'brain_tumor_model_fp32.pt'))
+
 class BrainTumorClassifier(nn.Module):
     def __init__(self, pretrained=True):
         super(BrainTumorClassifier, self).__init__()
@@ -33,63 +48,198 @@ class BrainTumorClassifier(nn.Module):
         return self.backbone(x)
 
 class GradCAM:
+    """Long-lived Grad-CAM explainer.
+
+    Hooks are registered once on the target layer. Activations are only captured while
+    the calling thread is inside generate_cams, and are kept in thread-local storage so
+    concurrent requests never see each other's tensors.
+    """
     def __init__(self, model, target_layer_name='backbone.layer4'):
         self.model = model
         self.target_layer_name = target_layer_name
-        self.gradients = None
-        self.activations = None
+        self._local = threading.local()
         self.hooks = []
         self.register_hooks()
 
     def register_hooks(self):
-        def backward_hook(module, grad_input, grad_output):
-            self.gradients = grad_output[0]
         def forward_hook(module, input, output):
-            self.activations = output
+            if getattr(self._local, 'capturing', False):
+                self._local.activations = output
         # Get the target layer
         target_layer = dict([*self.model.named_modules()])[self.target_layer_name]
-        # Register hooks
-        hook1 = target_layer.register_backward_hook(backward_hook)
-        hook2 = target_layer.register_forward_hook(forward_hook)
-        self.hooks = [hook1, hook2]
+        self.hooks = [target_layer.register_forward_hook(forward_hook)]
 
     def generate_cam(self, input_image, class_idx=None):
-        self.model.eval()
-        model_output = self.model(input_image)
-        self.model.zero_grad()
-        model_output[0][0].backward(retain_graph=True)
-        if self.gradients is None or self.activations is None:
-            return np.zeros((224, 224))
-        gradients = self.gradients[0].cpu().data.numpy()
-        activations = self.activations[0].cpu().data.numpy()
-        weights = np.mean(gradients, axis=(1, 2))
-        cam = np.zeros(activations.shape[1:], dtype=np.float32)
-        for i, w in enumerate(weights):
-            cam += w * activations[i]
-        cam = np.maximum(cam, 0)
-        cam = cv2.resize(cam, (224, 224))
-        if cam.max() > 0:
-            cam = cam / cam.max()
-        return cam
+        """Return the CAM for the first image of the input batch"""
+        _, cams = self.generate_cams(input_image[:1])
+        return cams[0]
+
+    def generate_cams(self, input_batch):
+        """Return sigmoid probabilities and CAMs for a whole batch from a single forward pass"""
+        self._local.capturing = True
+        self._local.activations = None
+        try:
+            with torch.enable_grad():
+                model_output = self.model(input_batch)
+                probabilities = torch.sigmoid(model_output.detach()).view(-1).cpu().numpy()
+                activations = self._local.activations
+                if activations is None:
+                    return probabilities, [np.zeros((224, 224)) for _ in probabilities]
+                # Samples are independent in eval mode, so the gradient of the summed logits
+                # gives every sample the gradient of its own output. Differentiating only up to
+                # the target layer skips backprop through the earlier layers and weight grads.
+                gradients = torch.autograd.grad(model_output.sum(), activations)[0]
+        finally:
+            self._local.capturing = False
+            self._local.activations = None
+        cams = self.compute_cams(gradients, activations.detach())
+        return probabilities, cams
+
+    @staticmethod
+    def compute_cams(gradients, activations):
+        """Build normalized 224x224 CAMs for a batch with tensor ops on the model device"""
+        weights = gradients.mean(dim=(2, 3))
+        cams = torch.einsum('nc,nchw->nhw', weights, activations).clamp(min=0)
+        cams = F.interpolate(cams.unsqueeze(1), size=(224, 224), mode='bilinear', align_corners=False).squeeze(1)
+        maxima = cams.amax(dim=(1, 2), keepdim=True)
+        cams = torch.where(maxima > 0, cams / maxima.clamp(min=1e-12), cams)
+        return cams.cpu().numpy()
 
     def remove_hooks(self):
         for hook in self.hooks:
             hook.remove()
 
+class FeatureGradCAM:
+    """Grad-CAM for a model loaded as a separate trunk and head (see model_export.py).
+
+    Activations are the layer4 output of the trunk (dequantized for the INT8 one);
+    gradients come from the head, which is all that lies between layer4 and the logit.
+    """
+    def __init__(self, features, head):
+        self.features = features
+        self.head = head
+
+    def generate_cam(self, input_image, class_idx=None):
+        """Return the CAM for the first image of the input batch"""
+        _, cams = self.generate_cams(input_image[:1])
+        return cams[0]
+
+    def generate_cams(self, input_batch):
+        """Return sigmoid probabilities and CAMs for a whole batch from a single forward pass"""
+        with torch.no_grad():
+            activations = self.features(input_batch)
+        activations.requires_grad_(True)
+        with torch.enable_grad():
+            model_output = self.head(activations)
+            gradients = torch.autograd.grad(model_output.sum(), activations)[0]
+        probabilities = torch.sigmoid(model_output.detach()).view(-1).cpu().numpy()
+        cams = GradCAM.compute_cams(gradients, activations.detach())
+        return probabilities, cams
+
+    def remove_hooks(self):
+        pass
+
+def checkpoint_version(path):
+    """Short content digest of a checkpoint file, used to tag the results it produced"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+def checkpoint_stamp(path):
+    """Size and modification time of a checkpoint file; cheap to compare at startup"""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+# Stored results are only reused for scans analysed by the same weights. Unless set here,
+# the version is the checkpoint digest, which a loaded artifact records; the checkpoint
+# is only hashed when it is loaded itself or when it changed after the artifact was built.
+MODEL_VERSION_OVERRIDE = os.getenv('MODEL_VERSION')
+
+def load_checkpoint_model():
+    """Build the eager classifier from the training checkpoint"""
+    # Every weight comes from the checkpoint, so torchvision's ImageNet weights are not fetched
+    model = BrainTumorClassifier(pretrained=False)
+    checkpoint = torch.load(MODEL_PATH, map_location=device)
+    if "model_state_dict" in checkpoint:
+        model.load_state_dict(checkpoint["model_state_dict"])
+    else:
+        model.load_state_dict(checkpoint)
+    model = model.to(device)
+    model.eval()
+    return model
+
+def artifact_version(path):
+    """Model version an artifact was built from, or None if it no longer matches the weights"""
+    from models.model_export import read_artifact_metadata
+    metadata = read_artifact_metadata(path)
+    version = metadata['source_version']
+    if MODEL_VERSION_OVERRIDE:
+        current = MODEL_VERSION_OVERRIDE
+    elif not os.path.exists(MODEL_PATH) or metadata['checkpoint_stamp'] == checkpoint_stamp(MODEL_PATH):
+        # Deployed without the checkpoint, or the checkpoint it was built from is untouched
+        return version
+    else:
+        current = checkpoint_version(MODEL_PATH)
+    if version != current:
+        print(f"Model artifact {path} was built from model version {version}, not {current}; rebuild it")
+        return None
+    return version
+
+def load_model_artifact():
+    """Return (features, head, version) from the artifact matching the configuration, or None to use the checkpoint"""
+    from models.model_export import load_exported_model, read_artifact_metadata, use_quantized_engine
+    if INFERENCE_PRECISION == 'int8':
+        if device.type != 'cpu':
+            print("INT8 inference is CPU-only; using the fp32 model")
+            return None
+        if not os.path.exists(QUANTIZED_MODEL_PATH):
+            print(f"No quantized model at {QUANTIZED_MODEL_PATH}; run quantize_model.py calibrate. Using the fp32 model")
+            return None
+        version = artifact_version(QUANTIZED_MODEL_PATH)
+        loaded = version and load_exported_model(QUANTIZED_MODEL_PATH)
+        if not loaded:
+            return None
+        use_quantized_engine(QUANTIZED_MODEL_PATH)
+        # INT8 results differ slightly, so they are never mixed up with fp32 ones
+        artifact_id = read_artifact_metadata(QUANTIZED_MODEL_PATH)['artifact_id'] or checkpoint_version(QUANTIZED_MODEL_PATH)
+        return (*loaded, f"{version}-int8-{artifact_id[:6]}")
+    if USE_EXPORTED_MODEL and os.path.exists(EXPORTED_MODEL_PATH):
+        version = artifact_version(EXPORTED_MODEL_PATH)
+        loaded = version and load_exported_model(EXPORTED_MODEL_PATH, map_location=device)
+        if loaded:
+            return (*loaded, version)
+    return None
+
 # Initialize model
-model = BrainTumorClassifier(pretrained=True)
-# Load your trained model weights
-checkpoint = torch.load(os.path.join(os.path.dirname(__file__), 'brain_tumor_detection_model_complete.pth'), map_location=device)
-if "model_state_dict" in checkpoint:
-    model.load_state_dict(checkpoint["model_state_dict"])
+artifact = load_model_artifact()
+if artifact is None:
+    MODEL_VERSION = MODEL_VERSION_OVERRIDE or checkpoint_version(MODEL_PATH)
+    model = load_checkpoint_model()
+    # Shared explainer; hooks stay installed for the lifetime of the process
+    gradcam = GradCAM(model, target_layer_name='backbone.layer4')
 else:
-    model.load_state_dict(checkpoint)
-model = model.to(device)
-model.eval()
+    features, head, MODEL_VERSION = artifact
+    gradcam = FeatureGradCAM(features, head)
+    model = nn.Sequential(features, head)
+# Model used for probability-only inference
+inference_model = model
 
 # Image preprocessing
 transform = transforms.Compose([
     transforms.Resize((224, 224)),
     transforms.ToTensor(),
     transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-]) 
\ No newline at end of file
+])
+
+def predict_probabilities(image_tensors, max_batch_size=None):
+    """Run batched inference and return one sigmoid probability per image tensor"""
+    max_batch_size = max_batch_size or MAX_BATCH_SIZE
+    probabilities = []
+    with torch.no_grad():
+        for start in range(0, len(image_tensors), max_batch_size):
+            batch = torch.stack(image_tensors[start:start + max_batch_size]).to(device)
+            output = inference_model(batch)
+            probabilities.extend(torch.sigmoid(output).view(-1).tolist())
+    return probabilities
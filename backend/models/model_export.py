@@ -0,0 +1,106 @@
+"""TorchScript artifacts of the classifier, split at layer4.
+
+An artifact holds the convolutional trunk (everything up to layer4) as a TorchScript
+module, plus the pooling/fc head as a second scripted module stored in the file's extra
+files. Keeping the head separate lets Grad-CAM differentiate it with respect to the layer4
+activations. Loading an artifact needs neither torchvision's ImageNet weights nor the
+training checkpoint. Both the fp32 export (export_model.py) and the INT8 trunk
+(quantize_model.py) use this format.
+
+The extra files also record the model version (checkpoint digest) the artifact was built
+from and the checkpoint's size and modification time, so the server can tell whether the
+artifact is stale without hashing the checkpoint; see read_artifact_metadata.
+"""
+import io
+import uuid
+import zipfile
+import torch
+import torch.nn as nn
+
+METADATA_FILES = ('source_version', 'checkpoint_stamp', 'artifact_id', 'quantized_engine')
+
+
+class FeatureExtractor(nn.Module):
+    """fp32 ResNet18 trunk up to layer4"""
+    def __init__(self, backbone):
+        super(FeatureExtractor, self).__init__()
+        self.backbone = backbone
+
+    def forward(self, x):
+        b = self.backbone
+        x = b.maxpool(b.relu(b.bn1(b.conv1(x))))
+        return b.layer4(b.layer3(b.layer2(b.layer1(x))))
+
+
+def classifier_head(model):
+    """Pooling and fully connected layers that follow layer4 of a BrainTumorClassifier"""
+    return nn.Sequential(model.backbone.avgpool, nn.Flatten(1), model.backbone.fc)
+
+
+def export_trunk(model):
+    """Script and freeze the fp32 trunk; freezing folds each batch norm into its convolution"""
+    return torch.jit.freeze(torch.jit.script(FeatureExtractor(model.backbone).eval()))
+
+
+def save_exported_model(features, head, path, source_version, checkpoint_stamp=''):
+    """Save a scripted trunk and head as one artifact, tagged with the model version it came from.
+
+    checkpoint_stamp is the size and modification time of the checkpoint it was built
+    from (see brain_tumor_model.checkpoint_stamp).
+    """
+    head_buffer = io.BytesIO()
+    torch.jit.save(torch.jit.script(head.eval()), head_buffer)
+    torch.jit.save(features, path, _extra_files={
+        'head.pt': head_buffer.getvalue(),
+        'source_version': source_version,
+        'checkpoint_stamp': checkpoint_stamp,
+        # Tells artifacts built from the same weights apart, e.g. two INT8 calibrations
+        'artifact_id': uuid.uuid4().hex,
+        'quantized_engine': torch.backends.quantized.engine
+    })
+
+
+def read_artifact_metadata(path):
+    """The metadata extra files of an artifact as str, read without loading its modules.
+
+    Missing entries (artifacts saved before they were added) are empty strings.
+    """
+    metadata = dict.fromkeys(METADATA_FILES, '')
+    with zipfile.ZipFile(path) as archive:
+        for name in archive.namelist():
+            directory, _, filename = name.rpartition('/')
+            if directory.endswith('extra') and filename in metadata:
+                metadata[filename] = archive.read(name).decode()
+    return metadata
+
+
+def load_exported_model(path, source_version=None, map_location='cpu'):
+    """Load (features, head) from an artifact.
+
+    Returns None if source_version is given and the artifact was built from different
+    weights. INT8 artifacts also need use_quantized_engine.
+    """
+    extra_files = {'head.pt': '', 'source_version': ''}
+    features = torch.jit.load(path, map_location=map_location, _extra_files=extra_files)
+    exported_version = extra_files['source_version'].decode()
+    if source_version is not None and exported_version != source_version:
+        print(f"Model artifact {path} was built from model version {exported_version}, "
+              f"not {source_version}; rebuild it")
+        return None
+    if not extra_files['head.pt']:
+        print(f"Model artifact {path} has no classifier head; rebuild it")
+        return None
+    head = torch.jit.load(io.BytesIO(extra_files['head.pt']), map_location=map_location)
+    return features.eval(), head.eval()
+
+
+def use_quantized_engine(path):
+    """Select the quantized engine an INT8 artifact was converted for.
+
+    Quantized kernels read torch.backends.quantized.engine each time they run, so this is
+    a process-wide setting rather than part of loading the artifact; the server calls it
+    once, when it loads the INT8 model.
+    """
+    engine = read_artifact_metadata(path)['quantized_engine']
+    if engine:
+        torch.backends.quantized.engine = engine
@@ -0,0 +1,52 @@
+"""Post-training static INT8 quantization of the classifier's convolutional trunk.
+
+The ResNet18 layers up to layer4 are rebuilt from torchvision's quantizable ResNet, fused
+(conv + bn + relu), calibrated on sample scans and converted to INT8. The pooling and
+fully connected head stay in fp32, so Grad-CAM can still differentiate the head with
+respect to the (dequantized) layer4 activations. The result is saved in the same
+trunk + head artifact format as the fp32 export (see model_export.py). Quantized kernels
+only run on CPU.
+"""
+import torch
+import torch.nn as nn
+import torch.ao.quantization as tq
+from torchvision.models.quantization import resnet18 as quantizable_resnet18
+
+
+class QuantizableFeatures(nn.Module):
+    """ResNet18 trunk up to layer4, between quantize/dequantize stubs"""
+    def __init__(self):
+        super(QuantizableFeatures, self).__init__()
+        self.backbone = quantizable_resnet18(weights=None, quantize=False)
+        self.backbone.fc = nn.Identity()
+
+    def forward(self, x):
+        b = self.backbone
+        x = b.quant(x)
+        x = b.maxpool(b.relu(b.bn1(b.conv1(x))))
+        x = b.layer4(b.layer3(b.layer2(b.layer1(x))))
+        return b.dequant(x)
+
+
+def prepare_features(model=None):
+    """Fused trunk with observers inserted, optionally initialised from a fp32 classifier"""
+    features = QuantizableFeatures()
+    if model is not None:
+        # The head stays in fp32 outside the trunk; every other weight must match, so a
+        # missing or renamed layer fails here instead of calibrating a half-random trunk
+        state = {k: v for k, v in model.backbone.state_dict().items() if not k.startswith('fc.')}
+        features.backbone.load_state_dict(state, strict=True)
+    features.eval()
+    features.backbone.fuse_model(is_qat=False)
+    features.qconfig = tq.get_default_qconfig(torch.backends.quantized.engine)
+    tq.prepare(features, inplace=True)
+    return features
+
+
+def calibrate_features(model, batches):
+    """Record activation ranges over the given input batches and return the INT8 trunk"""
+    features = prepare_features(model)
+    with torch.no_grad():
+        for batch in batches:
+            features(batch)
+    return tq.convert(features, inplace=True)
@@ -0,0 +1,207 @@
+"""Decoding and preprocessing of uploaded scans.
+
+Each image is decoded once and resized once, to the 224x224 uint8 RGB array that feeds
+both the model tensor and the original/overlay visualizations. JPEGs are decoded at a
+reduced scale (libjpeg DCT scaling) when they are at least twice as large as needed, and
+grayscale images are resized before being expanded to RGB. Normalization is a single
+in-place multiply-add on the tensor instead of the ToTensor + Normalize chain.
+
+Decoding can run in a pool of worker processes (PREPROCESS_WORKERS) so that it overlaps
+with inference on the request thread. The workers import only this module, with PIL and
+numpy: unlike other multiprocessing children they do not re-run the parent's __main__,
+which under `python app.py` would import the whole app. torch is imported by to_tensor
+in the calling process.
+"""
+import functools
+import io
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from multiprocessing import context, forkserver, popen_forkserver, reduction, spawn, util
+
+import numpy as np
+from PIL import Image
+
+MODEL_INPUT_SIZE = 224
+# ImageNet statistics the backbone was trained with
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# Processes decoding uploads per serving process (0 decodes on the request thread)
+PREPROCESS_WORKERS = int(os.getenv('PREPROCESS_WORKERS', 2))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def load_image(source, size=MODEL_INPUT_SIZE):
+    """Decode an image (path or binary stream) into a size x size uint8 RGB array"""
+    image = Image.open(source)
+    # Only JPEG supports reduced decoding; the decoded image stays at least size x size
+    image.draft('RGB', (size, size))
+    if image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    # Same filter as torchvision's Resize on PIL images (bilinear with antialiasing)
+    image = image.resize((size, size), Image.BILINEAR)
+    if image.mode == 'L':
+        image = image.convert('RGB')
+    return np.array(image)
+
+
+def decode_bytes(data, size=MODEL_INPUT_SIZE):
+    """load_image for the raw bytes of an image file; runs in the decode workers"""
+    return load_image(BytesIO(data), size)
+
+
+@functools.lru_cache(maxsize=None)
+def _normalization():
+    import torch
+    # (x / 255 - mean) / std == x * scale + offset
+    scale = torch.from_numpy(1 / (255 * STD)).view(3, 1, 1)
+    offset = torch.from_numpy(-MEAN / STD).view(3, 1, 1)
+    return scale, offset
+
+
+def to_tensor(array):
+    """Normalized float CHW tensor for a HxWx3 uint8 array"""
+    import torch
+    scale, offset = _normalization()
+    return torch.from_numpy(array).permute(2, 0, 1).float().mul_(scale).add_(offset)
+
+
+def preprocess(source, size=MODEL_INPUT_SIZE):
+    """Decode an image and return (uint8 RGB array, normalized model tensor)"""
+    array = load_image(source, size)
+    return array, to_tensor(array)
+
+
+class DecodeWorkerPopen(popen_forkserver.Popen):
+    """Starts a forkserver child without the parent's __main__ in its preparation data.
+
+    Same as the stdlib _launch except for that; the child then only unpickles the pool's
+    worker function, which imports this module.
+    """
+    def _launch(self, process_obj):
+        prep_data = spawn.get_preparation_data(process_obj._name)
+        prep_data.pop('init_main_from_path', None)
+        prep_data.pop('init_main_from_name', None)
+        buf = io.BytesIO()
+        context.set_spawning_popen(self)
+        try:
+            reduction.dump(prep_data, buf)
+            reduction.dump(process_obj, buf)
+        finally:
+            context.set_spawning_popen(None)
+
+        self.sentinel, w = forkserver.connect_to_new_process(self._fds)
+        _parent_w = os.dup(w)
+        self.finalizer = util.Finalize(self, util.close_fds, (_parent_w, self.sentinel))
+        with open(w, 'wb', closefd=True) as f:
+            f.write(buf.getbuffer())
+        self.pid = forkserver.read_signed(self.sentinel)
+
+
+class DecodeWorkerProcess(context.ForkServerProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        return DecodeWorkerPopen(process_obj)
+
+
+class DecodeWorkerContext(context.ForkServerContext):
+    Process = DecodeWorkerProcess
+
+
+def get_decode_pool():
+    """The process pool decoding uploads, or None when PREPROCESS_WORKERS is 0"""
+    global _pool, _pool_pid
+    if PREPROCESS_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        # Created on first use, and again in a forked child, which cannot use its parent's pool
+        if _pool_pid != os.getpid():
+            # Workers come from a fresh forkserver process rather than from this one,
+            # which holds the model and runs other threads. Neither the server nor the
+            # workers import the app's __main__.
+            mp_context = DecodeWorkerContext()
+            mp_context.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(PREPROCESS_WORKERS, mp_context=mp_context)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def start_decode_pool():
+    """Start the decode workers now rather than on the first upload, which would wait for them"""
+    pool = get_decode_pool()
+    if pool is not None:
+        # Workers are started as tasks arrive, one per task while none is idle
+        for future in [pool.submit(int) for _ in range(PREPROCESS_WORKERS)]:
+            future.result()
+
+
+def reset_decode_pool(pool):
+    """Drop a pool whose workers died so the next upload starts a new one"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            _pool_pid = None
+    pool.shutdown(wait=False)
+
+
+def iter_decoded(image_files, ahead):
+    """Yield (index, array, error) for image paths or streams, in order.
+
+    With a decode pool, up to `ahead` images are decoded in the background while the
+    caller works on earlier ones; only those are held in memory at any time.
+    """
+    pool = get_decode_pool()
+    if pool is None:
+        for i, image_file in enumerate(image_files):
+            try:
+                yield i, load_image(image_file), None
+            except Exception as e:
+                yield i, None, e
+        return
+
+    remaining = enumerate(image_files)
+    in_flight = deque()
+
+    def submit_next():
+        for i, image_file in remaining:
+            try:
+                if isinstance(image_file, (str, os.PathLike)):
+                    future = pool.submit(load_image, image_file)
+                else:
+                    future = pool.submit(decode_bytes, image_file.read())
+            except Exception as e:
+                future = e
+            in_flight.append((i, future))
+            return
+
+    for _ in range(max(ahead, 1)):
+        submit_next()
+    try:
+        while in_flight:
+            i, future = in_flight.popleft()
+            array, error = None, None
+            try:
+                if isinstance(future, Exception):
+                    raise future
+                array = future.result()
+            except BrokenProcessPool as e:
+                reset_decode_pool(pool)
+                error = e
+            except Exception as e:
+                error = e
+            # Keep the pool busy while the caller handles this image
+            submit_next()
+            yield i, array, error
+    finally:
+        # Abandoned early: do not decode images nobody will read
+        for _, future in in_flight:
+            if not isinstance(future, Exception):
+                future.cancel()
@@ -0,0 +1,120 @@
+"""Build and validate the INT8 model used when INFERENCE_PRECISION=int8.
+
+Usage (from the backend directory):
+    python quantize_model.py calibrate --images path/to/sample_scans
+    python quantize_model.py check --images path/to/held_out_scans
+
+calibrate runs sample scans through the fp32 trunk to record activation ranges and saves
+the converted INT8 trunk to QUANTIZED_MODEL_PATH. A few hundred representative scans are
+plenty. check compares the INT8 model with the fp32 checkpoint on a set of scans and
+exits non-zero if the predictions agree less often than --min-agreement.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff'}
+
+
+def list_images(root, limit):
+    paths = []
+    for directory, _, names in os.walk(root):
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.join(directory, name))
+    return sorted(paths)[:limit]
+
+
+def iter_batches(paths, batch_size):
+    import torch
+    # Same decoding and preprocessing as served scans
+    from preprocessing import preprocess
+    for start in range(0, len(paths), batch_size):
+        yield torch.stack([preprocess(path)[1] for path in paths[start:start + batch_size]])
+
+
+def calibrate(args):
+    import torch
+    from models.brain_tumor_model import model, checkpoint_stamp, MODEL_PATH, MODEL_VERSION, QUANTIZED_MODEL_PATH
+    from models.model_export import classifier_head, save_exported_model
+    from models.quantized_model import calibrate_features
+
+    paths = list_images(args.images, args.limit)
+    if not paths:
+        print(f"No images found under {args.images}")
+        return 1
+    features = calibrate_features(model, iter_batches(paths, args.batch_size))
+    output = args.output or QUANTIZED_MODEL_PATH
+    save_exported_model(torch.jit.script(features), classifier_head(model), output, MODEL_VERSION, checkpoint_stamp(MODEL_PATH))
+    print(f"Calibrated on {len(paths)} images; saved INT8 model for version {MODEL_VERSION} to {output}")
+    return 0
+
+
+def check(args):
+    from models.brain_tumor_model import gradcam, MODEL_VERSION, QUANTIZED_MODEL_PATH, FeatureGradCAM
+    from models.model_export import load_exported_model, use_quantized_engine
+
+    paths = list_images(args.images, args.limit)
+    if not paths:
+        print(f"No images found under {args.images}")
+        return 1
+    quantized_path = args.quantized or QUANTIZED_MODEL_PATH
+    artifact = load_exported_model(quantized_path, MODEL_VERSION)
+    if artifact is None:
+        return 1
+    use_quantized_engine(quantized_path)
+    quantized = FeatureGradCAM(*artifact)
+
+    fp32_probabilities, int8_probabilities, correlations = [], [], []
+    for batch in iter_batches(paths, args.batch_size):
+        probabilities, cams = gradcam.generate_cams(batch)
+        q_probabilities, q_cams = quantized.generate_cams(batch)
+        fp32_probabilities.extend(probabilities)
+        int8_probabilities.extend(q_probabilities)
+        for cam, q_cam in zip(cams, q_cams):
+            if cam.std() > 0 and q_cam.std() > 0:
+                correlations.append(float(np.corrcoef(cam.ravel(), q_cam.ravel())[0, 1]))
+
+    fp32_probabilities = np.array(fp32_probabilities)
+    int8_probabilities = np.array(int8_probabilities)
+    differences = np.abs(fp32_probabilities - int8_probabilities)
+    agreement = float(np.mean((fp32_probabilities >= 0.5) == (int8_probabilities >= 0.5)))
+    print(f"images:                 {len(paths)}")
+    print(f"prediction agreement:   {agreement:.2%}")
+    print(f"probability diff:       mean {differences.mean():.4f}, max {differences.max():.4f}")
+    if correlations:
+        print(f"Grad-CAM correlation:   mean {np.mean(correlations):.3f}, min {np.min(correlations):.3f}")
+    if agreement < args.min_agreement:
+        print(f"FAILED: agreement below {args.min_agreement:.2%}")
+        return 1
+    return 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    calibrate_parser = subparsers.add_parser('calibrate', help='build the INT8 model from sample scans')
+    calibrate_parser.add_argument('--images', required=True, help='directory of sample scans (searched recursively)')
+    calibrate_parser.add_argument('--limit', type=int, default=256)
+    calibrate_parser.add_argument('--batch-size', type=int, default=16)
+    calibrate_parser.add_argument('--output', help='defaults to QUANTIZED_MODEL_PATH')
+    check_parser = subparsers.add_parser('check', help='compare the INT8 model with the fp32 checkpoint')
+    check_parser.add_argument('--images', required=True, help='directory of scans (searched recursively)')
+    check_parser.add_argument('--limit', type=int, default=500)
+    check_parser.add_argument('--batch-size', type=int, default=16)
+    check_parser.add_argument('--quantized', help='defaults to QUANTIZED_MODEL_PATH')
+    check_parser.add_argument('--min-agreement', type=float, default=0.98)
+    args = parser.parse_args(argv[1:])
+
+    # Both commands start from the fp32 checkpoint, whatever the server is configured to use
+    os.environ['INFERENCE_PRECISION'] = 'fp32'
+    os.environ['USE_EXPORTED_MODEL'] = 'false'
+    if args.command == 'calibrate':
+        return calibrate(args)
+    return check(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,13 @@
+"""Recompute the dashboard counters from the patients, scans and reports tables.
+
+The counters are maintained incrementally by Database.add_patient/add_scan/add_report;
+run this after bulk imports, manual deletes or if the dashboard ever drifts:
+    python reconcile_stats.py
+"""
+from database import db
+
+if __name__ == '__main__':
+    counters = db.reconcile_dashboard_counters()
+    print("Dashboard counters reconciled:")
+    for column in ('total_patients', 'total_scans', 'total_reports', 'tumor_count', 'no_tumor_count'):
+        print(f"  {column}: {counters[column]}")
@@ -0,0 +1,74 @@
+"""Deferred PDF report generation.
+
+Requesting a report only inserts a reports row with status 'pending' and hands the work to
+a small in-process thread pool, so uploads respond as soon as the scans are stored. The
+row moves to 'ready' (with its S3 path) or 'failed' when generation finishes. Reports left
+pending by a process that stopped are picked up again by the scan_jobs.py workers.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from database import db
+from utils import generate_pdf_report
+
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', 2))
+# Seconds a claimed report may stay pending before another process retries it
+REPORT_STALE_AFTER = float(os.getenv('REPORT_STALE_AFTER', 300))
+REPORT_MAX_ATTEMPTS = int(os.getenv('REPORT_MAX_ATTEMPTS', 3))
+
+executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix='report')
+
+
+def queue_report(patient_id, scans, report_folder, scan_images=None):
+    """Record a pending report for the given scans and start generating it in the background.
+
+    scan_images optionally holds report thumbnails the caller already has, keyed by scan_id.
+    """
+    tumor_count = sum(1 for s in scans if s['prediction'] == 'Tumor')
+    no_tumor_count = sum(1 for s in scans if s['prediction'] == 'No Tumor')
+    report = db.add_pending_report(
+        patient_id=int(patient_id),
+        scan_ids=[s['scan_id'] for s in scans],
+        scan_count=len(scans),
+        tumor_count=tumor_count,
+        no_tumor_count=no_tumor_count
+    )
+    if not report:
+        return None
+    executor.submit(run_report, report['report_id'], report_folder, scan_images)
+    return {'report_id': report['report_id'], 'status': report['status'], 'report_url': None, 'scan_count': len(scans), 'tumor_count': tumor_count, 'no_tumor_count': no_tumor_count}
+
+
+def build_report(report, report_folder, scan_images=None):
+    """Generate the PDF for a claimed report row and record the outcome"""
+    try:
+        patient = db.get_patient_by_id(report['patient_id'])
+        scans = db.get_scans_by_ids(report['scan_ids'] or [])
+        if not patient or not scans:
+            db.finish_report(report['id'], 'failed', error='Patient or scans not found')
+            return
+        report_path = generate_pdf_report(patient, scans, report_folder, scan_images, report['report_id'])
+        if report_path:
+            db.finish_report(report['id'], 'ready', report_path=report_path)
+        else:
+            db.finish_report(report['id'], 'failed', error='Failed to generate PDF report')
+    except Exception as e:
+        print(f"Error generating report {report['report_id']}: {e}")
+        db.finish_report(report['id'], 'failed', error=str(e))
+
+
+def run_report(report_id, report_folder, scan_images=None):
+    """Claim and generate one report; does nothing if another process already has it"""
+    report = db.claim_report(report_id, stale_after=REPORT_STALE_AFTER, max_attempts=REPORT_MAX_ATTEMPTS)
+    if report:
+        build_report(report, report_folder, scan_images)
+
+
+def run_pending_reports(report_folder):
+    """Generate every claimable pending report, e.g. ones abandoned by a restarted server"""
+    count = 0
+    while True:
+        report = db.claim_report(stale_after=REPORT_STALE_AFTER, max_attempts=REPORT_MAX_ATTEMPTS)
+        if report is None:
+            return count
+        build_report(report, report_folder)
+        count += 1
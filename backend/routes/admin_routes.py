@@ -1,12 +1,121 @@
-from flask import Blueprint, request, jsonify
-from database import db
-from utils import send_credentials_email, allowed_file, predict_with_gradcam, generate_pdf_report
-from werkzeug.utils import secure_filename
-import uuid
-import os
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from database import db, DEFAULT_PAGE_SIZE
+from utils import send_credentials_email, inference_stats
+from scan_processing import process_scan_files, iter_scan_results, queue_batch_report
+from study_processing import process_study
+from image_cache import image_cache
+from upload_stream import open_streaming_upload
+from werkzeug.wsgi import get_input_stream
+import json
+import datetime
+from io import BytesIO
 
 admin_bp = Blueprint('admin_bp', __name__)
 
+# Response formats of uploads that stream each file's result as soon as it is done
+STREAM_MIMETYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+
+def is_truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def requested_stream_format():
+    """'ndjson' or 'sse' if the client asked for a streamed upload response, else None.
+
+    Chosen with ?stream=ndjson|sse (?stream=true means ndjson) or the Accept header.
+    """
+    value = str(request.args.get('stream', '')).lower()
+    if value in STREAM_MIMETYPES:
+        return value
+    if is_truthy(value):
+        return 'ndjson'
+    best = request.accept_mimetypes.best_match(['application/json', *STREAM_MIMETYPES.values()])
+    for stream_format, mimetype in STREAM_MIMETYPES.items():
+        if best == mimetype:
+            return stream_format
+    return None
+
+def stream_scan_results(patient_id, files, stream_format):
+    """Streamed upload response with one event per file as soon as that file is finished.
+
+    'file' events carry the file's index and result. The last event is 'complete', with
+    the scan ids and the queued report, or 'error'. If the body of a streaming upload
+    breaks off, the 'error' event also has the scan ids and report of the files stored
+    before that.
+    """
+    report_folder = current_app.config['REPORT_FOLDER']
+
+    def encode(event, payload):
+        data = json.dumps(payload, default=str)
+        if stream_format == 'sse':
+            return f"event: {event}\ndata: {data}\n\n"
+        return json.dumps(dict(payload, type=event), default=str) + "\n"
+
+    def generate():
+        try:
+            processing = iter_scan_results(patient_id, files)
+            while True:
+                try:
+                    index, file_result = next(processing)
+                except StopIteration as finished:
+                    results, scan_ids, scan_images = finished.value
+                    break
+                yield encode('file', {'index': index, 'result': file_result})
+            error = upload_error(files)
+            if not results and not error:
+                yield encode('error', {'success': False, 'error': 'No files selected'})
+                return
+            report_data = queue_batch_report(patient_id, scan_ids, report_folder, scan_images)
+            payload = {'success': not error, 'total_files': len(results), 'scan_ids': scan_ids, 'report_queued': report_data is not None, 'report_data': report_data}
+            if error:
+                yield encode('error', dict(payload, error=error))
+            else:
+                yield encode('complete', payload)
+        except Exception as e:
+            yield encode('error', {'success': False, 'error': str(e)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=STREAM_MIMETYPES[stream_format],
+        # Keep proxies from buffering the events
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def upload_error(files):
+    """Why a streaming upload broke off part way, or None if it was read to the end"""
+    error = getattr(files, 'error', None)
+    return f"Upload interrupted: {error}" if error else None
+
+def open_request_upload():
+    """(fields, files) of a multipart request body read as it arrives; see open_streaming_upload"""
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        raise ValueError('Expected a multipart/form-data upload')
+    # The raw body, without the per-request limit request.stream applies
+    stream = get_input_stream(request.environ, max_content_length=None)
+    return open_streaming_upload(stream, boundary.encode('latin-1'))
+
+def parse_date_arg(value, end_of_range=False):
+    """Parse an ISO date/datetime query value; a bare date as an upper bound covers that whole day"""
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}")
+    if end_of_range and len(value) == 10:
+        parsed += datetime.timedelta(days=1)
+    return parsed
+
+def parse_list_args():
+    """Read the pagination and date-range query parameters shared by the admin list endpoints"""
+    params = {
+        'limit': request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+        'cursor': request.args.get('cursor') or None
+    }
+    if request.args.get('created_from'):
+        params['created_from'] = parse_date_arg(request.args['created_from'])
+    if request.args.get('created_to'):
+        params['created_to'] = parse_date_arg(request.args['created_to'], end_of_range=True)
+    return params
+
 @admin_bp.route('/api/admin/dashboard', methods=['GET'])
 def admin_dashboard():
     try:
@@ -23,11 +132,27 @@ def admin_dashboard_stats():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@admin_bp.route('/api/admin/image-cache/stats', methods=['GET'])
+def image_cache_stats():
+    try:
+        # Counters are per process; report generation runs in this one
+        return jsonify({'success': True, 'data': image_cache.stats()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@admin_bp.route('/api/admin/inference/stats', methods=['GET'])
+def inference_batching_stats():
+    try:
+        # Counters are per process, like the image cache ones
+        return jsonify({'success': True, 'data': inference_stats()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @admin_bp.route('/api/admin/patients', methods=['GET'])
 def get_all_patients():
     try:
-        patients = db.get_all_patients()
-        return jsonify({'success': True, 'data': patients})
+        page = db.get_all_patients(search=request.args.get('search') or None, **parse_list_args())
+        return jsonify({'success': True, 'data': page['items'], 'next_cursor': page['next_cursor']})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -101,8 +226,12 @@ def add_patient():
 @admin_bp.route('/api/admin/scans', methods=['GET'])
 def get_all_scans():
     try:
-        scans = db.get_all_scans()
-        return jsonify({'success': True, 'data': scans})
+        page = db.get_all_scans(
+            prediction=request.args.get('prediction') or None,
+            patient_id=request.args.get('patient_id', type=int),
+            **parse_list_args()
+        )
+        return jsonify({'success': True, 'data': page['items'], 'next_cursor': page['next_cursor']})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -117,72 +246,110 @@ def upload_scan_admin():
             return jsonify({'success': False, 'error': 'Patient ID is required'})
         if not files or all(file.filename == '' for file in files):
             return jsonify({'success': False, 'error': 'No files selected'})
-        results = []
-        scan_ids = []
-        for file in files:
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                unique_filename = f"{uuid.uuid4()}_{filename}"
-                temp_dir = "temp_uploads"
-                os.makedirs(temp_dir, exist_ok=True)
-                filepath = os.path.join(temp_dir, unique_filename)
-                file.save(filepath)
-                result = predict_with_gradcam(filepath)
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
-                if result['success']:
-                    scan_result = db.add_scan(
-                        patient_id=int(patient_id),
-                        original_filename=filename,
-                        original_path=result['original_path'],
-                        heatmap_path=result['heatmap_path'],
-                        overlay_path=result['overlay_path'],
-                        prediction=result['prediction'],
-                        confidence=result['confidence'],
-                        probability=result['probability']
-                    )
-                    if scan_result:
-                        scan_ids.append(scan_result['scan_id'])
-                        results.append({'success': True, 'filename': filename, 'scan_id': scan_result['scan_id'], 'prediction': result['prediction'], 'confidence': result['confidence'], 'probability': result['probability'], 'original_image': result['original_path'], 'heatmap': result['heatmap_path'], 'overlay': result['overlay_path']})
-                    else:
-                        results.append({'success': False, 'filename': filename, 'error': 'Failed to save scan to database'})
-                else:
-                    results.append({'success': False, 'filename': filename, 'error': result['error']})
-            else:
-                results.append({'success': False, 'filename': file.filename if file else 'unknown', 'error': 'Invalid file type'})
-        report_data = None
-        if scan_ids:
-            try:
-                patient = db.get_patient_by_id(int(patient_id))
-                if patient:
-                    # Get only the current batch of scans
-                    batch_scans = db.get_scans_by_ids(scan_ids)
-                    if batch_scans:
-                        report_path = generate_pdf_report(patient, batch_scans)
-                        if report_path:
-                            tumor_count = sum(1 for s in batch_scans if s['prediction'] == 'Tumor')
-                            no_tumor_count = sum(1 for s in batch_scans if s['prediction'] == 'No Tumor')
-                            report_result = db.add_report(
-                                patient_id=int(patient_id),
-                                report_path=report_path,
-                                scan_count=len(batch_scans),
-                                tumor_count=tumor_count,
-                                no_tumor_count=no_tumor_count
-                            )
-                            if report_result:
-                                report_data = {'report_id': report_result['report_id'], 'report_url': report_path, 'scan_count': len(batch_scans), 'tumor_count': tumor_count, 'no_tumor_count': no_tumor_count}
-            except Exception as e:
-                print(f"Error generating report: {e}")
-        return jsonify({'success': True, 'scan_ids': scan_ids, 'results': results, 'report_generated': report_data is not None, 'report_data': report_data})
+        if is_truthy(request.args.get('async', request.form.get('async'))):
+            # Hand the files to the background workers and answer immediately
+            job_id = db.create_scan_job(int(patient_id), [(file.filename, file.read()) for file in files])
+            if not job_id:
+                return jsonify({'success': False, 'error': 'Failed to queue scan job'})
+            return jsonify({'success': True, 'job_id': job_id, 'status': 'pending', 'total_files': len(files)}), 202
+        stream_format = requested_stream_format()
+        if stream_format:
+            # The parsed files are closed with the request, before the response streams
+            return stream_scan_results(patient_id, [(file.filename, BytesIO(file.read())) for file in files], stream_format)
+        results, scan_ids, scan_images = process_scan_files(patient_id, [(file.filename, file.stream) for file in files])
+        # The PDF is built in the background; poll /api/report/status/<report_id> for it
+        report_data = queue_batch_report(patient_id, scan_ids, current_app.config['REPORT_FOLDER'], scan_images)
+        return jsonify({'success': True, 'scan_ids': scan_ids, 'results': results, 'report_queued': report_data is not None, 'report_data': report_data})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@admin_bp.route('/api/admin/scans/upload/stream', methods=['POST'])
+def upload_scan_admin_stream():
+    """Like upload_scan_admin, but files are analysed as their parts arrive.
+
+    Not limited by MAX_CONTENT_LENGTH: each scan is capped at UPLOAD_MAX_FILE_SIZE, and a
+    files part may be a ZIP or TAR archive of slices. patient_id goes in the query string
+    or in a form field sent before the files.
+    """
+    try:
+        fields, files = open_request_upload()
+        patient_id = request.args.get('patient_id') or fields.get('patient_id')
+        if not patient_id:
+            return jsonify({'success': False, 'error': 'Patient ID is required'})
+        stream_format = requested_stream_format()
+        if stream_format:
+            return stream_scan_results(patient_id, files, stream_format)
+        results, scan_ids, scan_images = process_scan_files(patient_id, files)
+        error = upload_error(files)
+        if not results and not error:
+            return jsonify({'success': False, 'error': 'No files selected'})
+        # The PDF is built in the background; poll /api/report/status/<report_id> for it.
+        # A broken-off upload still gets one for the scans stored before the break
+        report_data = queue_batch_report(patient_id, scan_ids, current_app.config['REPORT_FOLDER'], scan_images)
+        response = {'success': not error, 'scan_ids': scan_ids, 'results': results, 'report_queued': report_data is not None, 'report_data': report_data}
+        if error:
+            response['error'] = error
+        return jsonify(response)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@admin_bp.route('/api/admin/studies/upload', methods=['POST'])
+def upload_study_admin():
+    """Analyse a whole series as one study: every slice is classified, the slice
+    probabilities give the study score, and only the top_k most suspicious slices get
+    Grad-CAM images and scan rows.
+
+    Read like /api/admin/scans/upload/stream, so the series may be sent as files or as
+    ZIP/TAR archives. patient_id, aggregation and top_k go in the query string or in
+    form fields sent before the files.
+    """
+    try:
+        fields, files = open_request_upload()
+        options = dict(fields, **request.args.to_dict())
+        patient_id = options.get('patient_id')
+        if not patient_id:
+            return jsonify({'success': False, 'error': 'Patient ID is required'})
+        study, results, scan_ids, scan_images = process_study(patient_id, files, options.get('aggregation'), options.get('top_k'))
+        # The PDF covers the key slices
+        report_data = queue_batch_report(patient_id, scan_ids, current_app.config['REPORT_FOLDER'], scan_images)
+        return jsonify({'success': True, 'data': study, 'scan_ids': scan_ids, 'results': results, 'report_queued': report_data is not None, 'report_data': report_data})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@admin_bp.route('/api/admin/studies/<study_id>', methods=['GET'])
+def get_admin_study(study_id):
+    try:
+        study = db.get_study(study_id)
+        if not study:
+            return jsonify({'success': False, 'error': 'Study not found'})
+        study.pop('id')
+        return jsonify({'success': True, 'data': study})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@admin_bp.route('/api/admin/patients/<int:patient_id>/studies', methods=['GET'])
+def get_admin_patient_studies(patient_id):
+    try:
+        studies = db.get_patient_studies(patient_id)
+        return jsonify({'success': True, 'data': studies})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@admin_bp.route('/api/admin/scans/jobs/<job_id>', methods=['GET'])
+def get_scan_job(job_id):
+    try:
+        job = db.get_scan_job(job_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Job not found'})
+        job.pop('id')
+        return jsonify({'success': True, 'data': job})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @admin_bp.route('/api/admin/reports', methods=['GET'])
 def get_all_reports():
     try:
-        reports = db.get_all_reports()
-        return jsonify({'success': True, 'data': reports})
+        page = db.get_all_reports(patient_id=request.args.get('patient_id', type=int), **parse_list_args())
+        return jsonify({'success': True, 'data': page['items'], 'next_cursor': page['next_cursor']})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}) 
\ No newline at end of file
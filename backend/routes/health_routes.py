@@ -1,7 +1,13 @@
+import sys
 from flask import Blueprint, jsonify
 
 health_bp = Blueprint('health_bp', __name__)
 
 @health_bp.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'message': 'Brain Tumor Detection API is running'}) 
\ No newline at end of file
+    # Reports whether this process has loaded the model yet, without loading it
+    return jsonify({
+        'status': 'healthy',
+        'message': 'Brain Tumor Detection API is running',
+        'model_loaded': 'models.brain_tumor_model' in sys.modules
+    }) 
\ No newline at end of file
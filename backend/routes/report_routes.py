@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify, send_file, current_app
 from database import db
-from utils import generate_pdf_report
+from report_tasks import queue_report
 from s3_service import s3_service
 from psycopg2.extras import RealDictCursor
 import os
@@ -24,35 +24,34 @@ def generate_report():
             scans = db.get_patient_scans(patient_id)
         if not scans:
             return jsonify({'success': False, 'error': 'No scans found for report'})
-        report_path = generate_pdf_report(patient, scans, current_app.config['REPORT_FOLDER'])
-        if report_path:
-            tumor_count = sum(1 for s in scans if s['prediction'] == 'Tumor')
-            no_tumor_count = sum(1 for s in scans if s['prediction'] == 'No Tumor')
-            report_result = db.add_report(
-                patient_id=patient_id,
-                report_path=report_path,
-                scan_count=len(scans),
-                tumor_count=tumor_count,
-                no_tumor_count=no_tumor_count
-            )
-            if report_result:
-                return jsonify({'success': True, 'data': {'report_id': report_result['report_id'], 'report_path': report_path}})
-            else:
-                return jsonify({'success': False, 'error': 'Failed to save report to database'})
-        else:
-            return jsonify({'success': False, 'error': 'Failed to generate PDF report'})
+        report_data = queue_report(patient_id, scans, current_app.config['REPORT_FOLDER'])
+        if not report_data:
+            return jsonify({'success': False, 'error': 'Failed to save report to database'})
+        # The PDF is generated in the background; poll /api/report/status/<report_id>
+        return jsonify({'success': True, 'data': report_data}), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@report_bp.route('/api/report/status/<report_id>')
+def get_report_status(report_id):
+    try:
+        report = db.get_report(report_id)
+        if not report:
+            return jsonify({'success': False, 'error': 'Report not found'})
+        return jsonify({'success': True, 'data': report})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @report_bp.route('/api/report/download/<report_id>')
 def download_report(report_id):
     try:
-        cursor = db.connection.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("SELECT report_path FROM reports WHERE report_id = %s", (report_id,))
-        report = cursor.fetchone()
-        cursor.close()
+        with db.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("SELECT report_path, status FROM reports WHERE report_id = %s", (report_id,))
+            report = cursor.fetchone()
         if not report:
             return jsonify({'success': False, 'error': 'Report not found'})
+        if report['status'] != 'ready':
+            return jsonify({'success': False, 'status': report['status'], 'error': f"Report is {report['status']}, not ready for download"})
         return jsonify({'success': True, 'download_url': report['report_path']})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -60,10 +59,9 @@ def download_report(report_id):
 @report_bp.route('/api/report/download-by-filename/<filename>')
 def download_report_by_filename(filename):
     try:
-        cursor = db.connection.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("SELECT report_path FROM reports WHERE report_path LIKE %s", (f"%{filename}",))
-        report = cursor.fetchone()
-        cursor.close()
+        with db.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("SELECT report_path FROM reports WHERE report_filename = %s", (filename,))
+            report = cursor.fetchone()
         if not report:
             return jsonify({'success': False, 'error': 'Report not found'})
         report_path = report['report_path']
@@ -1,7 +1,6 @@
 import os
-import boto3
+import threading
 from dotenv import load_dotenv
-from botocore.exceptions import ClientError
 
 load_dotenv('config.env')
 
@@ -9,15 +8,27 @@ class S3Service:
     def __init__(self):
         self.bucket = os.getenv('AWS_S3_BUCKET')
         self.region = os.getenv('AWS_REGION')
-        self.s3 = boto3.client(
-            's3',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name=self.region
-        )
+        self._s3 = None
+        self._lock = threading.Lock()
+
+    @property
+    def s3(self):
+        """boto3 S3 client, created on first use so importing this module stays cheap"""
+        if self._s3 is None:
+            with self._lock:
+                if self._s3 is None:
+                    import boto3
+                    self._s3 = boto3.client(
+                        's3',
+                        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                        region_name=self.region
+                    )
+        return self._s3
 
     def upload_pdf(self, pdf_path, s3_key=None):
         """Upload a PDF to S3 and return the S3 key."""
+        from botocore.exceptions import ClientError
         if not s3_key:
             s3_key = f"reports/{os.path.basename(pdf_path)}"
         try:
@@ -35,6 +46,7 @@ class S3Service:
 
     def generate_presigned_url(self, s3_key, expires_in=3600):
         """Generate a pre-signed URL for downloading a PDF from S3."""
+        from botocore.exceptions import ClientError
         try:
             url = self.s3.generate_presigned_url(
                 'get_object',
@@ -0,0 +1,113 @@
+"""Worker processes that drain the queued scan-processing jobs.
+
+Uploads made with async=true are stored in the scan_jobs/scan_job_files tables. Each
+worker claims the oldest pending job with SELECT ... FOR UPDATE SKIP LOCKED, so any
+number of workers (on one or several machines) can share the queue without a broker.
+When idle, workers also generate PDF reports that were left pending (see report_tasks.py).
+
+Usage (from the backend directory):
+    python scan_jobs.py --workers 2
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+from io import BytesIO
+from dotenv import load_dotenv
+
+load_dotenv('config.env')
+
+
+def process_job(job, report_folder):
+    """Run every pending file of a claimed job and record the final result"""
+    from database import db
+    from scan_processing import process_scan_files, queue_batch_report
+
+    # Uploads are read from the database a batch at a time as processing reaches them;
+    # positions maps the index of each file handed out to its place in the job
+    positions = []
+
+    def pending_files():
+        for f in db.iter_pending_scan_job_files(job['id']):
+            positions.append(f['position'])
+            yield f['original_filename'], BytesIO(bytes(f['content']))
+
+    def on_file_done(index, file_result):
+        db.record_scan_job_file_result(job['id'], positions[index], file_result)
+
+    _, _, scan_images = process_scan_files(job['patient_id'], pending_files(), on_file_done=on_file_done)
+
+    # Include files finished by an earlier attempt of this job; their images are downloaded
+    results = [f['result'] for f in db.get_scan_job(job['job_id'])['files']]
+    scan_ids = [r['scan_id'] for r in results if r and r.get('success')]
+    report_data = queue_batch_report(job['patient_id'], scan_ids, report_folder, scan_images)
+    db.finish_scan_job(job['id'], 'completed', {
+        'success': True,
+        'scan_ids': scan_ids,
+        'results': results,
+        'report_queued': report_data is not None,
+        'report_data': report_data
+    })
+
+
+def run_worker(worker_id, workers, poll_interval, report_folder, stale_after, max_attempts):
+    """Claim and process jobs until interrupted"""
+    # Heavy imports happen in the worker process, never in the supervising parent
+    from database import db
+    from report_tasks import run_pending_reports
+    from serving import init_worker
+
+    os.makedirs(report_folder, exist_ok=True)
+    # Apply pending migrations before taking jobs; a failed one ends the worker
+    db.ensure_pool()
+    # Workers on this machine split the cores between them
+    model_version = init_worker(workers)
+    print(f"Scan worker {worker_id} started with model {model_version}")
+    while True:
+        job = db.claim_scan_job(worker_id, stale_after=stale_after, max_attempts=max_attempts)
+        if job is None:
+            # Pick up reports left pending by a web process that stopped before building them
+            if not run_pending_reports(report_folder):
+                time.sleep(poll_interval)
+            continue
+        print(f"Worker {worker_id} processing job {job['job_id']}")
+        try:
+            process_job(job, report_folder)
+        except Exception as e:
+            print(f"Job {job['job_id']} failed: {e}")
+            db.finish_scan_job(job['id'], 'failed', error=str(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SCAN_WORKERS', 1)))
+    parser.add_argument('--poll-interval', type=float, default=float(os.getenv('SCAN_WORKER_POLL_INTERVAL', 1.0)))
+    parser.add_argument('--stale-after', type=float, default=float(os.getenv('SCAN_JOB_STALE_AFTER', 300)),
+                        help='seconds without progress before a running job is reclaimed')
+    parser.add_argument('--max-attempts', type=int, default=int(os.getenv('SCAN_JOB_MAX_ATTEMPTS', 3)))
+    args = parser.parse_args()
+    report_folder = os.getenv('REPORT_FOLDER', 'reports')
+
+    # Spawn rather than fork so each worker gets its own torch runtime and DB pool
+    context = multiprocessing.get_context('spawn')
+    processes = []
+    for n in range(args.workers):
+        worker_id = f"{socket.gethostname()}-{os.getpid()}-{n}"
+        process = context.Process(
+            target=run_worker,
+            args=(worker_id, args.workers, args.poll_interval, report_folder, args.stale_after, args.max_attempts),
+            name=f"scan-worker-{n}"
+        )
+        process.start()
+        processes.append(process)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import hashlib
+import itertools
+from collections import deque
+from io import BytesIO
+from database import db
+from utils import allowed_file, iter_predictions_with_gradcam
+from report_tasks import queue_report
+from werkzeug.utils import secure_filename
+
+
+def read_file_chunks(files, chunk_size):
+    """Read (original_filename, binary stream) pairs chunk_size files at a time.
+
+    Yields (rejected, valid) per chunk, so only one chunk of files is held in memory.
+    rejected has (index, filename, error) for files that could not be read or are not an
+    allowed image; valid has (index, secure filename, data, sha256 hex digest).
+    """
+    entries = enumerate(files)
+    while True:
+        chunk = list(itertools.islice(entries, chunk_size))
+        if not chunk:
+            return
+        rejected, valid = [], []
+        for index, (original_filename, stream) in chunk:
+            try:
+                data = stream.read()
+            except Exception as e:
+                # Rejected while being received, e.g. too large
+                rejected.append((index, original_filename or 'unknown', str(e)))
+                continue
+            if not (original_filename and allowed_file(original_filename)):
+                rejected.append((index, original_filename or 'unknown', 'Invalid file type'))
+                continue
+            valid.append((index, secure_filename(original_filename), data, hashlib.sha256(data).hexdigest()))
+        yield rejected, valid
+
+
+def process_scan_files(patient_id, files, on_file_done=None):
+    """Run inference on uploaded files and store a scan row for each successful one.
+
+    files is an iterable of (original_filename, binary stream) pairs. It is consumed a few
+    batches at a time, so only those files are held in memory however long the upload is.
+    on_file_done, if given, is called with (index, file_result) as soon as each file has
+    been processed.
+    Returns (results, scan_ids, scan_images): results in the same order as files, and the
+    report thumbnails of each stored scan keyed by scan_id.
+    """
+    processing = iter_scan_results(patient_id, files)
+    while True:
+        try:
+            index, file_result = next(processing)
+        except StopIteration as finished:
+            return finished.value
+        if on_file_done:
+            on_file_done(index, file_result)
+
+
+def iter_scan_results(patient_id, files):
+    """Generator form of process_scan_files.
+
+    Yields (index, file_result) as soon as each file has been processed, in completion
+    order, and returns (results, scan_ids, scan_images).
+    """
+    # Loads the model on first use
+    from models.brain_tumor_model import MODEL_VERSION, MAX_BATCH_SIZE
+    results = []
+    scan_images = {}
+    # Identical images already analysed by this model, in this upload or before, reuse the
+    # stored prediction and artifacts; only the first copy of any other image is inferred
+    analysed = {}
+    failed = {}
+    finished = deque()
+
+    def finish(index, result):
+        results[index] = result
+        finished.append((index, result))
+
+    def flush():
+        while finished:
+            yield finished.popleft()
+
+    def store_scan(index, filename, analysis, content_hash, deduplicated):
+        scan_result = db.add_scan(
+            patient_id=int(patient_id),
+            original_filename=filename,
+            original_path=analysis['original_path'],
+            heatmap_path=analysis['heatmap_path'],
+            overlay_path=analysis['overlay_path'],
+            prediction=analysis['prediction'],
+            confidence=analysis['confidence'],
+            probability=analysis['probability'],
+            content_hash=content_hash,
+            model_version=MODEL_VERSION
+        )
+        if scan_result:
+            finish(index, {'success': True, 'filename': filename, 'scan_id': scan_result['scan_id'], 'prediction': analysis['prediction'], 'confidence': analysis['confidence'], 'probability': analysis['probability'], 'original_image': analysis['original_path'], 'heatmap': analysis['heatmap_path'], 'overlay': analysis['overlay_path'], 'deduplicated': deduplicated})
+        else:
+            finish(index, {'success': False, 'filename': filename, 'error': 'Failed to save scan to database'})
+        return scan_result
+
+    # Two batches per chunk keep the inference pipeline busy across its batches
+    for rejected, valid in read_file_chunks(files, 2 * MAX_BATCH_SIZE):
+        results.extend([None] * (len(rejected) + len(valid)))
+        for index, filename, error in rejected:
+            finish(index, {'success': False, 'filename': filename, 'error': error})
+        yield from flush()
+
+        unknown = {entry[3] for entry in valid} - analysed.keys() - failed.keys()
+        for content_hash, row in db.find_scans_by_content_hash(unknown, MODEL_VERSION).items():
+            analysed[content_hash] = dict(row, confidence=float(row['confidence']), probability=float(row['probability']))
+        to_infer, repeats, seen = [], [], set()
+        for entry in valid:
+            if entry[3] in analysed or entry[3] in failed or entry[3] in seen:
+                repeats.append(entry)
+            else:
+                seen.add(entry[3])
+                to_infer.append(entry)
+
+        # Prediction and GradCAM for every new image run as batched forward passes
+        for position, result in iter_predictions_with_gradcam([BytesIO(data) for _, _, data, _ in to_infer]):
+            index, filename, _, content_hash = to_infer[position]
+            if result['success']:
+                scan_result = store_scan(index, filename, result, content_hash, False)
+                if scan_result:
+                    scan_images[scan_result['scan_id']] = result['report_images']
+                    analysed[content_hash] = dict(result, scan_id=scan_result['scan_id'])
+            else:
+                failed[content_hash] = result['error']
+                finish(index, {'success': False, 'filename': filename, 'error': result['error']})
+            yield from flush()
+
+        for index, filename, _, content_hash in repeats:
+            source = analysed.get(content_hash)
+            if source is None:
+                # The first copy of this image in the upload failed
+                finish(index, {'success': False, 'filename': filename, 'error': failed.get(content_hash, 'Failed to save scan to database')})
+            else:
+                scan_result = store_scan(index, filename, source, content_hash, True)
+                if scan_result and source['scan_id'] in scan_images:
+                    scan_images[scan_result['scan_id']] = scan_images[source['scan_id']]
+            yield from flush()
+
+    scan_ids = [result['scan_id'] for result in results if result['success']]
+    return results, scan_ids, scan_images
+
+
+def queue_batch_report(patient_id, scan_ids, report_folder, scan_images=None):
+    """Queue a PDF report covering the given scans; returns the pending report info or None"""
+    if not scan_ids:
+        return None
+    try:
+        patient = db.get_patient_by_id(int(patient_id))
+        if not patient:
+            return None
+        # Get only the current batch of scans
+        batch_scans = db.get_scans_by_ids(scan_ids)
+        if not batch_scans:
+            return None
+        return queue_report(patient_id, batch_scans, report_folder, scan_images)
+    except Exception as e:
+        print(f"Error queueing report: {e}")
+    return None
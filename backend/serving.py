@@ -0,0 +1,49 @@
+"""Serving the API from several forked worker processes that share one copy of the model.
+
+gunicorn.conf.py calls preload_model() in the master before it forks and init_worker() in
+every worker. The weights are loaded once in the master and never written afterwards, so
+the workers share those pages copy-on-write instead of each loading the checkpoint. Torch
+intra-op threads are split between the workers so together they use each core once.
+"""
+import gc
+import os
+
+
+def available_cpus():
+    """Cores this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Intra-op threads shared by all worker processes (0 = every available core)
+INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', 0)) or available_cpus()
+# Inter-op threads per process; the model runs one op at a time, so one is enough
+INFERENCE_INTEROP_THREADS = int(os.getenv('INFERENCE_INTEROP_THREADS', 1))
+
+
+def threads_per_worker(workers, total=None):
+    """Intra-op threads for each of `workers` processes splitting `total` threads"""
+    return max(1, (total or INFERENCE_THREADS) // max(1, workers))
+
+
+def preload_model():
+    """Load the model in the master process, before workers are forked from it"""
+    import torch
+    # OpenMP thread pools do not survive fork, so the master never starts one: it runs
+    # single-threaded and each worker sets its own thread count after forking
+    torch.set_num_threads(1)
+    torch.set_num_interop_threads(INFERENCE_INTEROP_THREADS)
+    from models.brain_tumor_model import MODEL_VERSION
+    # Keep the collector from touching (and so copying) every object inherited from the master
+    gc.freeze()
+    return MODEL_VERSION
+
+
+def init_worker(workers):
+    """Give a worker process its share of the cores and run the model once"""
+    import torch
+    torch.set_num_threads(threads_per_worker(workers))
+    from utils import warm_up_model
+    return warm_up_model()
@@ -0,0 +1,225 @@
+"""Study-level analysis of a whole MRI series.
+
+Every slice is classified with batched, probability-only inference, which skips the
+Grad-CAM backward pass, and the slice probabilities are combined into one study score.
+Only the top-k most suspicious slices then go through Grad-CAM, visualization and
+upload, and only those are stored as scans, linked to the study. For a series of a few
+hundred slices that is an order of magnitude less Grad-CAM and upload work than
+analysing each slice as a separate scan.
+"""
+import heapq
+import math
+import os
+from io import BytesIO
+
+from database import db
+from scan_processing import read_file_chunks
+from utils import predict_batch, iter_predictions_with_gradcam
+
+# How slice probabilities are combined into the study score (see AGGREGATIONS)
+STUDY_AGGREGATION = os.getenv('STUDY_AGGREGATION', 'topk_mean').lower()
+# Slices per study that get Grad-CAM, uploaded images and a scan row
+STUDY_TOP_K = int(os.getenv('STUDY_TOP_K', 5))
+# Study score from which the study is reported as 'Tumor'
+STUDY_THRESHOLD = float(os.getenv('STUDY_THRESHOLD', 0.5))
+
+
+def aggregate_max(probabilities, top_k):
+    return max(probabilities)
+
+
+def aggregate_mean(probabilities, top_k):
+    return math.fsum(probabilities) / len(probabilities)
+
+
+def aggregate_topk_mean(probabilities, top_k):
+    top = heapq.nlargest(top_k, probabilities)
+    return math.fsum(top) / len(top)
+
+
+def aggregate_noisy_or(probabilities, top_k):
+    # Probability that at least one slice shows a tumor, if slices were independent;
+    # it approaches 1 on long series, so it suits short or pre-selected ones
+    if max(probabilities) >= 1.0:
+        # A float32 sigmoid saturates to exactly 1.0, where log1p(-p) is undefined
+        return 1.0
+    return 1 - math.exp(math.fsum(math.log1p(-max(p, 0.0)) for p in probabilities))
+
+
+AGGREGATIONS = {
+    'max': aggregate_max,
+    'mean': aggregate_mean,
+    'topk_mean': aggregate_topk_mean,
+    'noisy_or': aggregate_noisy_or,
+}
+
+
+def study_options(aggregation=None, top_k=None):
+    """Validated (aggregation, top_k), defaulting to STUDY_AGGREGATION and STUDY_TOP_K"""
+    aggregation = (aggregation or STUDY_AGGREGATION).lower()
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation '{aggregation}'; use one of {', '.join(AGGREGATIONS)}")
+    try:
+        top_k = STUDY_TOP_K if top_k in (None, '') else int(top_k)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid top_k: {top_k}")
+    if top_k < 1:
+        raise ValueError("top_k must be at least 1")
+    return aggregation, top_k
+
+
+def rank_slices(files, top_k):
+    """Classify every slice of a series and keep the top_k most suspicious ones.
+
+    files is an iterable of (original_filename, binary stream) pairs, consumed a few
+    batches at a time. Identical slices are inferred once. Stored scans are not consulted
+    here: their probabilities are rounded, which could reorder the key slices and shift
+    the study score, and probability-only inference is cheap next to Grad-CAM.
+    Returns (slices, key_slices): one entry per file in order, with its probability or
+    error, and (probability, index, filename, data, content_hash) for the key slices,
+    most suspicious first. Only the key slices' bytes are kept.
+    """
+    from models.brain_tumor_model import MAX_BATCH_SIZE
+    slices = []
+    # Min-heap, so the least suspicious key slice is the one replaced
+    key_slices = []
+    # Content hash -> probability, or the error of its first copy, within the series
+    probabilities = {}
+    failed = {}
+    for rejected, valid in read_file_chunks(files, 2 * MAX_BATCH_SIZE):
+        slices.extend({} for _ in range(len(rejected) + len(valid)))
+        for index, filename, error in rejected:
+            slices[index].update(filename=filename, error=error)
+
+        to_infer = {}
+        for entry in valid:
+            if entry[3] not in probabilities and entry[3] not in failed:
+                to_infer.setdefault(entry[3], entry)
+        predictions = predict_batch([BytesIO(data) for _, _, data, _ in to_infer.values()])
+        for content_hash, prediction in zip(to_infer, predictions):
+            if prediction['success']:
+                probabilities[content_hash] = prediction['probability']
+            else:
+                failed[content_hash] = prediction['error']
+
+        for index, filename, data, content_hash in valid:
+            slices[index]['filename'] = filename
+            if content_hash in failed:
+                slices[index]['error'] = failed[content_hash]
+                continue
+            probability = probabilities[content_hash]
+            slices[index]['probability'] = probability
+            entry = (probability, index, filename, data, content_hash)
+            if len(key_slices) < top_k:
+                heapq.heappush(key_slices, entry)
+            elif entry[0] > key_slices[0][0]:
+                heapq.heapreplace(key_slices, entry)
+
+    return slices, sorted(key_slices, reverse=True)
+
+
+def process_study(patient_id, files, aggregation=None, top_k=None):
+    """Analyse a whole series as one study and store it with its key slices.
+
+    Returns (study, results, scan_ids, scan_images): the stored study with its score,
+    the results of the key slices (shaped like process_scan_files results, plus
+    slice_index), and the scan ids and report thumbnails of the stored key slices.
+    Raises ValueError for invalid options, a series without any readable slice, or an
+    upload that broke off before the whole series was received.
+    """
+    # Loads the model on first use
+    from models.brain_tumor_model import MODEL_VERSION
+    aggregation, top_k = study_options(aggregation, top_k)
+    slices, key_slices = rank_slices(files, top_k)
+    # Nothing is stored before this point, so a series cut short leaves no orphaned scans
+    error = getattr(files, 'error', None)
+    if error:
+        raise ValueError(f"Upload interrupted: {error}")
+    probabilities = [s['probability'] for s in slices if 'probability' in s]
+    if not probabilities:
+        raise ValueError('No readable slices in the series' if slices else 'No files selected')
+
+    probability = float(AGGREGATIONS[aggregation](probabilities, top_k))
+    prediction = 'Tumor' if probability >= STUDY_THRESHOLD else 'No Tumor'
+    confidence = probability if prediction == 'Tumor' else 1 - probability
+    study = db.add_study(
+        patient_id=int(patient_id),
+        slice_count=len(slices),
+        aggregation=aggregation,
+        top_k=top_k,
+        prediction=prediction,
+        confidence=confidence,
+        probability=probability,
+        slice_results=slices,
+        model_version=MODEL_VERSION
+    )
+    if not study:
+        raise ValueError('Failed to save study to database')
+    study = dict(study, slice_count=len(slices), analysed_slices=len(probabilities), aggregation=aggregation,
+                 top_k=top_k, prediction=prediction, confidence=confidence, probability=probability)
+
+    results = []
+    scan_images = {}
+
+    def store_scan(index, filename, analysis, content_hash, deduplicated):
+        scan_result = db.add_scan(
+            patient_id=int(patient_id),
+            original_filename=filename,
+            original_path=analysis['original_path'],
+            heatmap_path=analysis['heatmap_path'],
+            overlay_path=analysis['overlay_path'],
+            prediction=analysis['prediction'],
+            confidence=analysis['confidence'],
+            probability=analysis['probability'],
+            content_hash=content_hash,
+            model_version=MODEL_VERSION,
+            study_pk=study['id'],
+            slice_index=index
+        )
+        if scan_result:
+            results.append({'success': True, 'filename': filename, 'slice_index': index, 'scan_id': scan_result['scan_id'], 'prediction': analysis['prediction'], 'confidence': analysis['confidence'], 'probability': analysis['probability'], 'original_image': analysis['original_path'], 'heatmap': analysis['heatmap_path'], 'overlay': analysis['overlay_path'], 'deduplicated': deduplicated})
+        else:
+            results.append({'success': False, 'filename': filename, 'slice_index': index, 'error': 'Failed to save scan to database'})
+        return scan_result
+
+    # Key slices already analysed by this model, in this series or before, reuse the
+    # stored images; Grad-CAM, visualizations and uploads run for the others only
+    analysed = {}
+    for content_hash, row in db.find_scans_by_content_hash({entry[4] for entry in key_slices}, MODEL_VERSION).items():
+        analysed[content_hash] = dict(row, confidence=float(row['confidence']), probability=float(row['probability']))
+    to_infer, repeats, seen = [], [], set()
+    for entry in key_slices:
+        if entry[4] in analysed or entry[4] in seen:
+            repeats.append(entry)
+        else:
+            seen.add(entry[4])
+            to_infer.append(entry)
+
+    failed = {}
+    for position, result in iter_predictions_with_gradcam([BytesIO(entry[3]) for entry in to_infer]):
+        _, index, filename, _, content_hash = to_infer[position]
+        if not result['success']:
+            failed[content_hash] = result['error']
+            results.append({'success': False, 'filename': filename, 'slice_index': index, 'error': result['error']})
+            continue
+        scan_result = store_scan(index, filename, result, content_hash, False)
+        if scan_result:
+            scan_images[scan_result['scan_id']] = result['report_images']
+            analysed[content_hash] = dict(result, scan_id=scan_result['scan_id'])
+
+    for _, index, filename, _, content_hash in repeats:
+        source = analysed.get(content_hash)
+        if source is None:
+            # The first copy of this slice failed
+            results.append({'success': False, 'filename': filename, 'slice_index': index, 'error': failed.get(content_hash, 'Failed to save scan to database')})
+            continue
+        scan_result = store_scan(index, filename, source, content_hash, True)
+        if scan_result and source['scan_id'] in scan_images:
+            scan_images[scan_result['scan_id']] = scan_images[source['scan_id']]
+
+    # Most suspicious first, as ranked by the classification pass
+    order = {index: rank for rank, (_, index, _, _, _) in enumerate(key_slices)}
+    results.sort(key=lambda result: order[result['slice_index']])
+    study.pop('id')
+    scan_ids = [result['scan_id'] for result in results if result['success']]
+    return study, results, scan_ids, scan_images
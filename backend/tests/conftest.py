@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the backend modules the way the app does, from the backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tables whose rows the database tests insert, children before parents
+TEST_TABLES = ('scans', 'reports', 'studies', 'scan_jobs', 'patients')
+
+
+@pytest.fixture(scope='session')
+def test_database():
+    """The app's database pointed at TEST_DB_NAME, never at the one DB_NAME configures"""
+    name = os.getenv('TEST_DB_NAME')
+    if not name:
+        pytest.skip('Set TEST_DB_NAME to a scratch PostgreSQL database to run the database tests')
+    from database import db
+    if db.pool is not None:
+        db.close()
+        db.pool = None
+        db._ready = False
+    # The other DB_* settings still apply; migrations run on the first connection
+    os.environ['DB_NAME'] = name
+    if not db.ensure_pool():
+        pytest.skip(f'PostgreSQL database {name} is not reachable with the DB_* settings')
+    return db
+
+
+@pytest.fixture
+def database(test_database):
+    """The test database; rows a test inserts are deleted and the counters recounted afterwards"""
+    with test_database.cursor() as cursor:
+        last_ids = {}
+        for table in TEST_TABLES:
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) AS last_id FROM {table}")
+            last_ids[table] = cursor.fetchone()['last_id']
+    yield test_database
+    with test_database.cursor() as cursor:
+        for table in TEST_TABLES:
+            cursor.execute(f"DELETE FROM {table} WHERE id > %s", (last_ids[table],))
+    test_database.reconcile_dashboard_counters()
+
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
@@ -0,0 +1,47 @@
+import datetime
+import uuid
+
+from routes.admin_routes import parse_date_arg
+
+
+def test_bare_date_as_upper_bound_covers_the_day():
+    assert parse_date_arg('2026-03-14') == datetime.datetime(2026, 3, 14)
+    assert parse_date_arg('2026-03-14', end_of_range=True) == datetime.datetime(2026, 3, 15)
+    # A full timestamp is taken as given
+    assert parse_date_arg('2026-03-14T12:00:00', end_of_range=True) == datetime.datetime(2026, 3, 14, 12)
+
+
+def test_invalid_cursor_is_rejected(client):
+    response = client.get('/api/admin/patients?cursor=not-a-cursor')
+    assert response.get_json() == {'success': False, 'error': 'Invalid pagination cursor'}
+
+
+def add_patients(database, count):
+    name = f"Cursor {uuid.uuid4().hex[:8]}"
+    return name, [database.add_patient(name, f"{name.replace(' ', '.')}.{i}@example.com") for i in range(count)]
+
+
+def test_cursor_pages_cover_every_row_once(database, client):
+    name, patients = add_patients(database, 5)
+    seen, cursor = [], None
+    while True:
+        url = f'/api/admin/patients?search={name}&limit=2' + (f'&cursor={cursor}' if cursor else '')
+        page = client.get(url).get_json()
+        assert page['success'] and len(page['data']) <= 2
+        seen += [patient['patient_id'] for patient in page['data']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    # Newest first
+    assert seen == [patient['patient_id'] for patient in reversed(patients)]
+
+
+def test_created_to_bare_date_includes_the_whole_day(database, client):
+    name, (patient,) = add_patients(database, 1)
+    day = database.get_all_patients(search=name)['items'][0]['created_at'].date()
+    page = client.get(f'/api/admin/patients?search={name}&created_to={day.isoformat()}').get_json()
+    assert [p['patient_id'] for p in page['data']] == [patient['patient_id']]
+    page = client.get(f'/api/admin/patients?search={name}&created_to={(day - datetime.timedelta(days=1)).isoformat()}').get_json()
+    assert page['data'] == []
+    page = client.get(f'/api/admin/patients?search={name}&created_from={day.isoformat()}').get_json()
+    assert [p['patient_id'] for p in page['data']] == [patient['patient_id']]
@@ -0,0 +1,104 @@
+import threading
+import time
+from io import BytesIO
+
+
+import cloudinary_service as module
+from cloudinary_service import CloudinaryService, LocalStubUploader
+
+
+class FlakyUploader(LocalStubUploader):
+    """Stub uploader whose first `failures` calls fail"""
+    def __init__(self, root, failures, **kwargs):
+        super().__init__(root, **kwargs)
+        self.failures = failures
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, file, **options):
+        with self.lock:
+            self.calls += 1
+            failing = self.calls <= self.failures
+        if failing:
+            raise IOError("Simulated upload failure")
+        return super().__call__(file, **options)
+
+
+class HangingUploader(LocalStubUploader):
+    """Stub uploader that ignores its timeout"""
+    def __call__(self, file, timeout=None, **options):
+        time.sleep(self.latency)
+        return super().__call__(file, **options)
+
+
+def make_service(monkeypatch, uploader, workers=2, timeout=5, retries=2, backoff=0.01):
+    monkeypatch.setenv('CLOUDINARY_UPLOAD_WORKERS', str(workers))
+    monkeypatch.setenv('CLOUDINARY_UPLOAD_TIMEOUT', str(timeout))
+    monkeypatch.setenv('CLOUDINARY_UPLOAD_RETRIES', str(retries))
+    monkeypatch.setenv('CLOUDINARY_RETRY_BACKOFF', str(backoff))
+    return CloudinaryService(uploader=uploader)
+
+
+def test_concurrent_uploads_return_in_order(monkeypatch, tmp_path):
+    service = make_service(monkeypatch, LocalStubUploader(str(tmp_path), latency=0.05), workers=4)
+    results = service.upload_batch([(BytesIO(f"image {i}".encode()), f"folder{i}") for i in range(8)])
+    assert all(result['success'] for result in results)
+    for i, result in enumerate(results):
+        assert result['public_id'].startswith(f"folder{i}/")
+        with open(result['url'][len('file://'):], 'rb') as f:
+            assert f.read() == f"image {i}".encode()
+
+
+def test_retries_with_exponential_backoff(monkeypatch, tmp_path):
+    uploader = FlakyUploader(str(tmp_path), failures=2)
+    service = make_service(monkeypatch, uploader, retries=2, backoff=0.5)
+    sleeps = []
+    monkeypatch.setattr(module.time, 'sleep', sleeps.append)
+    result = service.wait_for_upload(service.submit_upload(BytesIO(b"data")))
+    assert result['success']
+    assert uploader.calls == 3
+    assert sleeps == [0.5, 1.0]
+
+
+def test_gives_up_after_retries(monkeypatch, tmp_path):
+    uploader = FlakyUploader(str(tmp_path), failures=10)
+    service = make_service(monkeypatch, uploader, retries=2)
+    result = service.wait_for_upload(service.submit_upload(BytesIO(b"data")))
+    assert not result['success']
+    assert 'Simulated upload failure' in result['error']
+    assert uploader.calls == 3
+
+
+def test_attempt_timeout_is_retried(monkeypatch, tmp_path):
+    service = make_service(monkeypatch, LocalStubUploader(str(tmp_path), latency=1.0), timeout=0.05, retries=1)
+    started = time.monotonic()
+    result = service.wait_for_upload(service.submit_upload(BytesIO(b"data")))
+    assert not result['success']
+    assert 'timed out' in result['error']
+    # Two attempts of 0.05 s and a backoff, not the 1 s latency
+    assert time.monotonic() - started < 0.5
+
+
+def test_queue_time_does_not_count_against_deadline(monkeypatch, tmp_path):
+    # One worker: the last upload waits behind the others for longer than its own deadline
+    service = make_service(monkeypatch, LocalStubUploader(str(tmp_path), latency=0.1), workers=1, timeout=0.2, retries=0)
+    futures = [service.submit_upload(BytesIO(f"image {i}".encode())) for i in range(5)]
+    results = [service.wait_for_upload(future) for future in reversed(futures)]
+    assert all(result['success'] for result in results)
+
+
+def test_backstop_deadline_for_hanging_uploader(monkeypatch, tmp_path):
+    service = make_service(monkeypatch, HangingUploader(str(tmp_path), latency=1.0), workers=1, timeout=0.05, retries=0)
+    started = time.monotonic()
+    result = service.wait_for_upload(service.submit_upload(BytesIO(b"hangs")))
+    assert not result['success']
+    assert 'did not finish within' in result['error']
+    assert time.monotonic() - started < 0.5
+
+
+def test_cancelled_upload(monkeypatch, tmp_path):
+    service = make_service(monkeypatch, LocalStubUploader(str(tmp_path), latency=0.2), workers=1)
+    service.submit_upload(BytesIO(b"running"))
+    queued = service.submit_upload(BytesIO(b"queued"))
+    assert queued.cancel()
+    assert service.wait_for_upload(queued) == {'success': False, 'error': 'Upload was cancelled'}
@@ -0,0 +1,103 @@
+import datetime
+import uuid
+
+import pytest
+
+import database
+
+
+def test_failed_migration_leaves_pool_not_ready(monkeypatch):
+    def failing_migrations(db):
+        raise RuntimeError('migration 8 failed')
+
+    monkeypatch.setattr(database, 'run_migrations', failing_migrations)
+    db = database.Database(auto_migrate=True)
+    db.pool = object()
+    with pytest.raises(RuntimeError, match='migration 8 failed'):
+        db.ensure_pool()
+    assert not db._ready
+    # Every later use retries the migration instead of serving the old schema
+    with pytest.raises(RuntimeError):
+        db._checkout()
+
+    monkeypatch.setattr(database, 'run_migrations', lambda db: [])
+    assert db.ensure_pool()
+    assert db._ready
+
+
+def test_cursor_round_trip():
+    created_at = datetime.datetime(2026, 3, 14, 15, 9, 26, 535897)
+    assert database.decode_cursor(database.encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+@pytest.mark.parametrize('token', ['', 'not a cursor', 'MjAyNi0wMy0xNA==', 'MjAyNi0wMy0xNHxhYmM='])
+def test_invalid_cursor(token):
+    with pytest.raises(ValueError, match='Invalid pagination cursor'):
+        database.decode_cursor(token)
+
+
+def table_counts(db):
+    with db.cursor() as cursor:
+        cursor.execute("""
+            SELECT (SELECT COUNT(*) FROM patients) AS total_patients,
+                   (SELECT COUNT(*) FROM scans) AS total_scans,
+                   (SELECT COUNT(*) FROM reports) AS total_reports,
+                   (SELECT COUNT(*) FROM scans WHERE prediction = 'Tumor') AS tumor_count,
+                   (SELECT COUNT(*) FROM scans WHERE prediction = 'No Tumor') AS no_tumor_count
+        """)
+        return dict(cursor.fetchone())
+
+
+def stored_counters(db):
+    with db.cursor() as cursor:
+        cursor.execute("""
+            SELECT total_patients, total_scans, total_reports, tumor_count, no_tumor_count
+            FROM dashboard_counters WHERE id = 1
+        """)
+        return dict(cursor.fetchone())
+
+
+def add_patient(db):
+    return db.add_patient('Counters', f"counters.{uuid.uuid4().hex[:8]}@example.com")
+
+
+def add_scan(db, patient, prediction):
+    return db.add_scan(patient['id'], 'scan.png', 'original', 'heatmap', 'overlay', prediction, 0.9, 0.9)
+
+
+def test_counters_match_counts_after_inserts(database):
+    database.reconcile_dashboard_counters()
+    patient = add_patient(database)
+    add_scan(database, patient, 'Tumor')
+    add_scan(database, patient, 'No Tumor')
+    add_scan(database, patient, 'No Tumor')
+    database.add_report(patient['id'], 'report.pdf', 3, 1, 2)
+    database.add_pending_report(patient['id'], [], 0, 0, 0)
+    assert stored_counters(database) == table_counts(database)
+
+
+def test_reconcile_repairs_drifted_counters(database):
+    patient = add_patient(database)
+    scan = add_scan(database, patient, 'Tumor')
+    # A manual delete bypasses the counters
+    with database.cursor() as cursor:
+        cursor.execute("DELETE FROM scans WHERE scan_id = %s", (scan['scan_id'],))
+        cursor.execute("UPDATE dashboard_counters SET total_reports = total_reports + 5 WHERE id = 1")
+    assert stored_counters(database) != table_counts(database)
+    counters = database.reconcile_dashboard_counters()
+    assert stored_counters(database) == table_counts(database)
+    assert database.get_dashboard_stats()['total_scans'] == counters['total_scans']
+
+
+def test_pending_job_files_read_in_batches(database):
+    patient = add_patient(database)
+    job_id = database.create_scan_job(patient['id'], [(f'slice{n}.png', bytes([n])) for n in range(7)])
+    job = database.get_scan_job(job_id)
+    database.record_scan_job_file_result(job['id'], 1, {'success': True})
+    read = []
+    for f in database.iter_pending_scan_job_files(job['id'], batch_size=2):
+        read.append((f['position'], bytes(f['content'])))
+        # Files finished while a batch is being worked through do not shift the next one
+        database.record_scan_job_file_result(job['id'], f['position'], {'success': True})
+    assert read == [(n, bytes([n])) for n in (0, 2, 3, 4, 5, 6)]
+    assert list(database.iter_pending_scan_job_files(job['id'])) == []
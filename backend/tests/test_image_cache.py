@@ -0,0 +1,43 @@
+import os
+
+from image_cache import DiskImageCache, RESCAN_FRACTION
+
+
+def disk_usage(root):
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for directory, _, names in os.walk(root) for name in names)
+
+
+def test_index_is_read_on_first_use(tmp_path):
+    DiskImageCache(str(tmp_path), 1000).put('a', b'x' * 100)
+    cache = DiskImageCache(str(tmp_path), 1000)
+    assert not cache._loaded
+    assert cache.get('a') == b'x' * 100
+    assert cache.stats()['bytes'] == 100
+
+
+def test_lru_eviction(tmp_path):
+    cache = DiskImageCache(str(tmp_path), 300)
+    for key in 'abc':
+        cache.put(key, b'x' * 100)
+    cache.get('a')
+    cache.put('d', b'x' * 100)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert disk_usage(tmp_path) <= 300
+
+
+def test_budget_shared_between_processes(tmp_path):
+    max_bytes = 100 * RESCAN_FRACTION * 4
+    # Two processes' caches over the same directory
+    caches = [DiskImageCache(str(tmp_path), max_bytes), DiskImageCache(str(tmp_path), max_bytes)]
+    for i in range(200):
+        caches[i % 2].put(f'key{i}', b'x' * 100)
+        assert disk_usage(tmp_path) <= max_bytes + 2 * max_bytes // RESCAN_FRACTION + 200
+
+
+def test_disabled(tmp_path):
+    cache = DiskImageCache(str(tmp_path / 'cache'), 0)
+    cache.put('a', b'x')
+    assert cache.get('a') is None
+    assert not os.path.exists(tmp_path / 'cache')
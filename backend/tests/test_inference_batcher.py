@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+
+import pytest
+
+from inference_batcher import InferenceBatcher
+
+
+class StubModel:
+    """run_batch stand-in that records each batch and can hold the inference thread"""
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+        self.release = threading.Event()
+        self.release.set()
+        self.running = threading.Event()
+
+    def __call__(self, tensors):
+        self.running.set()
+        self.release.wait(5)
+        self.batches.append(list(tensors))
+        if self.fail_on in tensors:
+            raise RuntimeError(f"bad image {self.fail_on}")
+        return [tensor * 10 for tensor in tensors]
+
+    def hold(self, batcher, size):
+        """Keep the inference thread busy so that later requests queue up behind it"""
+        self.release.clear()
+        future = batcher.submit(list(range(1000, 1000 + size)))
+        assert self.running.wait(5)
+        return future
+
+
+def test_results_routed_to_their_requests():
+    model = StubModel()
+    batcher = InferenceBatcher(model, max_batch_size=8, max_wait=0.01)
+    results = {}
+
+    def request(n):
+        tensors = [n * 100 + i for i in range(1 + n % 3)]
+        results[n] = (tensors, batcher.submit(tensors).result(5))
+
+    threads = [threading.Thread(target=request, args=(n,)) for n in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for tensors, result in results.values():
+        assert result == [tensor * 10 for tensor in tensors]
+    assert batcher.stats()['requests'] == 40
+
+
+def test_queued_requests_share_capped_batches():
+    model = StubModel()
+    batcher = InferenceBatcher(model, max_batch_size=4, max_wait=0.01)
+    held = model.hold(batcher, 4)
+    futures = [batcher.submit([n]) for n in range(10)]
+    model.release.set()
+    assert [future.result(5) for future in futures] == [[n * 10] for n in range(10)]
+    held.result(5)
+    assert [len(batch) for batch in model.batches] == [4, 4, 4, 2]
+
+
+def test_requests_are_never_split():
+    model = StubModel()
+    batcher = InferenceBatcher(model, max_batch_size=4, max_wait=0.01)
+    held = model.hold(batcher, 4)
+    first = batcher.submit([1, 2, 3])
+    second = batcher.submit([4, 5])
+    third = batcher.submit([6, 7])
+    model.release.set()
+    assert first.result(5) == [10, 20, 30]
+    assert second.result(5) == [40, 50]
+    assert third.result(5) == [60, 70]
+    held.result(5)
+    assert model.batches[1:] == [[1, 2, 3], [4, 5, 6, 7]]
+
+
+def test_oversized_request_rejected():
+    batcher = InferenceBatcher(StubModel(), max_batch_size=4, max_wait=0.01)
+    with pytest.raises(ValueError):
+        batcher.submit([1, 2, 3, 4, 5])
+    with pytest.raises(ValueError):
+        batcher.submit([])
+    # run() splits any number of images into requests that fit
+    assert batcher.run(list(range(10))) == [n * 10 for n in range(10)]
+
+
+def test_error_fails_only_its_batch():
+    model = StubModel(fail_on=13)
+    batcher = InferenceBatcher(model, max_batch_size=2, max_wait=0.01)
+    held = model.hold(batcher, 2)
+    failing = [batcher.submit([12]), batcher.submit([13])]
+    later = batcher.submit([14, 15])
+    model.release.set()
+    for future in failing:
+        with pytest.raises(RuntimeError, match='bad image 13'):
+            future.result(5)
+    assert later.result(5) == [140, 150]
+    assert held.result(5) == [10000, 10010]
+    # The thread keeps serving after a failed batch
+    assert batcher.submit([16]).result(5) == [160]
+
+
+def test_lone_request_waits_at_most_max_wait():
+    model = StubModel()
+    batcher = InferenceBatcher(model, max_batch_size=8, max_wait=0.05)
+    start = time.monotonic()
+    assert batcher.submit([1]).result(5) == [10]
+    assert time.monotonic() - start < 1
+    assert model.batches == [[1]]
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_restarts_after_fork():
+    batcher = InferenceBatcher(StubModel(), max_batch_size=4, max_wait=0.01)
+    assert batcher.submit([1]).result(5) == [10]
+    pid = os.fork()
+    if pid == 0:
+        # The child inherits the batcher but not its thread
+        ok = False
+        try:
+            ok = batcher.submit([2]).result(5) == [20]
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_decode_workers_do_not_import_main(tmp_path):
+    # Stands in for `python app.py`: module-level code that must only run in the parent
+    script = tmp_path / 'main.py'
+    script.write_text(textwrap.dedent(f"""
+        import os
+        import sys
+        sys.path.insert(0, {BACKEND_DIR!r})
+        print('main executed as', __name__, os.getpid(), flush=True)
+        import numpy as np
+        from io import BytesIO
+        from PIL import Image
+        import preprocessing
+
+        if __name__ == '__main__':
+            preprocessing.start_decode_pool()
+            image = BytesIO()
+            Image.fromarray(np.zeros((300, 300), dtype=np.uint8)).save(image, 'PNG')
+            image.seek(0)
+            [(_, array, error)] = preprocessing.iter_decoded([image], ahead=1)
+            print('decoded', array.shape, error, flush=True)
+    """))
+    result = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=120,
+                            env=dict(os.environ, PREPROCESS_WORKERS='2'))
+    assert result.returncode == 0, result.stderr
+    lines = result.stdout.splitlines()
+    assert [line for line in lines if line.startswith('main executed')] == [lines[0]]
+    assert lines[0].startswith('main executed as __main__')
+    assert 'decoded (224, 224, 3) None' in lines
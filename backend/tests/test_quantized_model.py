@@ -0,0 +1,36 @@
+import pytest
+import torch
+import torch.nn as nn
+from torchvision.models import resnet18
+
+from models.quantized_model import prepare_features
+
+
+class Classifier(nn.Module):
+    """Same backbone layout as BrainTumorClassifier, without loading its checkpoint"""
+    def __init__(self):
+        super(Classifier, self).__init__()
+        self.backbone = resnet18(weights=None)
+        self.backbone.fc = nn.Sequential(nn.Linear(512, 1))
+
+
+def test_trunk_matches_classifier_before_calibration():
+    model = Classifier().eval()
+    features = prepare_features(model)
+    x = torch.randn(2, 3, 64, 64)
+    b = model.backbone
+    with torch.no_grad():
+        expected = b.layer4(b.layer3(b.layer2(b.layer1(b.maxpool(b.relu(b.bn1(b.conv1(x))))))))
+        # Observers only record ranges, so the fused fp32 trunk gives the classifier's activations
+        assert torch.allclose(features(x), expected, atol=1e-4)
+
+
+def test_mismatched_checkpoint_rejected():
+    model = Classifier()
+    model.backbone.extra = nn.Linear(2, 2)
+    with pytest.raises(RuntimeError, match='extra.weight'):
+        prepare_features(model)
+    del model.backbone.extra
+    del model.backbone.layer4
+    with pytest.raises(RuntimeError, match='layer4'):
+        prepare_features(model)
@@ -0,0 +1,39 @@
+import math
+
+import pytest
+
+from study_processing import AGGREGATIONS, aggregate_noisy_or, study_options
+
+
+def test_noisy_or_saturated_slice():
+    # A float32 sigmoid returns exactly 1.0 for large logits
+    assert aggregate_noisy_or([1.0], 5) == 1.0
+    assert aggregate_noisy_or([0.2, 1.0, 0.0], 5) == 1.0
+
+
+def test_noisy_or_zero_slices():
+    assert aggregate_noisy_or([0.0], 5) == 0.0
+    assert aggregate_noisy_or([0.0, 0.0, 0.0], 5) == 0.0
+
+
+def test_noisy_or_combines_slices():
+    assert math.isclose(aggregate_noisy_or([0.5, 0.5], 5), 0.75)
+
+
+def test_aggregations():
+    probabilities = [0.1, 0.9, 0.5, 0.3]
+    assert AGGREGATIONS['max'](probabilities, 2) == 0.9
+    assert math.isclose(AGGREGATIONS['mean'](probabilities, 2), 0.45)
+    assert math.isclose(AGGREGATIONS['topk_mean'](probabilities, 2), 0.7)
+    # top_k larger than the series
+    assert math.isclose(AGGREGATIONS['topk_mean'](probabilities, 10), 0.45)
+
+
+def test_study_options():
+    assert study_options('MAX', '3') == ('max', 3)
+    with pytest.raises(ValueError):
+        study_options('median', 3)
+    with pytest.raises(ValueError):
+        study_options('max', 0)
+    with pytest.raises(ValueError):
+        study_options('max', 'many')
@@ -0,0 +1,155 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+import upload_stream
+from upload_stream import MultipartReader, ScanFiles, open_streaming_upload
+
+BOUNDARY = b'scanboundary'
+
+
+def multipart_body(parts, close=True):
+    """parts is a list of (name, filename, data); filename None makes a form field"""
+    body = b''
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += b'--' + BOUNDARY + b'\r\nContent-Disposition: ' + disposition.encode() + b'\r\n\r\n' + data + b'\r\n'
+    if close:
+        body += b'--' + BOUNDARY + b'--\r\n'
+    return body
+
+
+def read_files(body, chunk_size=upload_stream.READ_CHUNK_SIZE):
+    files = ScanFiles(MultipartReader(io.BytesIO(body), BOUNDARY, chunk_size).parts())
+    read = []
+    for filename, stream in files:
+        try:
+            read.append((filename, stream.read()))
+        except ValueError as e:
+            read.append((filename, str(e)))
+    return read, files.error
+
+
+def tar_archive(members, mode='w'):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def zip_archive(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 64])
+def test_part_boundaries_split_across_reads(chunk_size):
+    # The delimiter and headers of each part straddle reads of the request body
+    body = multipart_body([('files', 'a.png', b'a' * 100), ('files', 'b.png', b'\r\n--scan' * 10)])
+    read, error = read_files(body, chunk_size)
+    assert read == [('a.png', b'a' * 100), ('b.png', b'\r\n--scan' * 10)]
+    assert error is None
+
+
+def test_fields_before_files():
+    body = multipart_body([('patient_id', None, b'42'), ('files', 'a.png', b'scan')])
+    fields, files = open_streaming_upload(io.BytesIO(body), BOUNDARY)
+    assert fields == {'patient_id': '42'}
+    assert [(filename, stream.read()) for filename, stream in files] == [('a.png', b'scan')]
+
+
+def test_file_size_cap(monkeypatch):
+    monkeypatch.setattr(upload_stream, 'UPLOAD_MAX_FILE_SIZE', 10)
+    body = multipart_body([('files', 'big.png', b'x' * 11), ('files', 'ok.png', b'x' * 10)])
+    read, error = read_files(body, chunk_size=4)
+    assert read[0][0] == 'big.png' and 'exceeds' in read[0][1]
+    assert read[1] == ('ok.png', b'x' * 10)
+    assert error is None
+
+
+def test_file_size_cap_inside_archive(monkeypatch):
+    monkeypatch.setattr(upload_stream, 'UPLOAD_MAX_FILE_SIZE', 10)
+    archive = tar_archive([('series/big.png', b'x' * 11), ('series/ok.png', b'y' * 5)])
+    read, error = read_files(multipart_body([('files', 'series.tar', archive)]))
+    assert read[0][0] == 'big.png' and 'exceeds' in read[0][1]
+    assert read[1] == ('ok.png', b'y' * 5)
+    assert error is None
+
+
+def test_archive_size_cap(monkeypatch):
+    monkeypatch.setattr(upload_stream, 'UPLOAD_MAX_ARCHIVE_SIZE', 1024)
+    archive = tar_archive([(f'slice{i}.png', b'x' * 600) for i in range(4)])
+    body = multipart_body([('files', 'series.tar', archive), ('files', 'after.png', b'next')])
+    read, error = read_files(body, chunk_size=256)
+    assert read[-2][0] == 'series.tar' and 'exceeds' in read[-2][1]
+    # The rest of the oversized archive is skipped and later parts are still read
+    assert read[-1] == ('after.png', b'next')
+    assert error is None
+
+
+def test_tar_members_streamed_and_filtered():
+    archive = tar_archive([
+        ('series/slice1.png', b'one'),
+        ('series/.DS_Store', b'meta'),
+        ('__MACOSX/series/._slice1.png', b'meta'),
+        ('series/slice2.png', b'two'),
+    ], mode='w:gz')
+    read, error = read_files(multipart_body([('files', 'series.tar.gz', archive)]), chunk_size=16)
+    assert read == [('slice1.png', b'one'), ('slice2.png', b'two')]
+    assert error is None
+
+
+@pytest.mark.parametrize('spool_size', [0, 1024 * 1024])
+def test_zip_spooled(monkeypatch, spool_size):
+    # 0 rolls the spooled archive over to a temporary file straight away
+    monkeypatch.setattr(upload_stream, 'UPLOAD_ZIP_SPOOL_SIZE', spool_size)
+    archive = zip_archive([('series/slice1.png', b'one' * 100), ('series/', b''), ('series/slice2.png', b'two')])
+    body = multipart_body([('files', 'series.zip', archive), ('files', 'after.png', b'next')])
+    read, error = read_files(body, chunk_size=64)
+    assert read == [('slice1.png', b'one' * 100), ('slice2.png', b'two'), ('after.png', b'next')]
+    assert error is None
+
+
+def test_broken_archive_is_one_rejected_entry():
+    body = multipart_body([('files', 'series.zip', b'not a zip'), ('files', 'after.png', b'next')])
+    read, error = read_files(body)
+    assert read[0][0] == 'series.zip' and 'Could not read archive' in read[0][1]
+    assert read[1] == ('after.png', b'next')
+    assert error is None
+
+
+def test_truncated_body_keeps_earlier_files():
+    body = multipart_body([('files', 'a.png', b'first'), ('files', 'b.png', b'second' * 50)], close=False)
+    # Cut off in the middle of the second file
+    read, error = read_files(body[:-200], chunk_size=32)
+    assert read[0] == ('a.png', b'first')
+    assert read[1][0] == 'b.png' and 'multipart body' in read[1][1]
+    assert 'truncated' in error
+
+
+def test_truncated_body_inside_archive():
+    archive = tar_archive([(f'slice{i}.png', b'x' * 600) for i in range(4)])
+    body = multipart_body([('files', 'a.png', b'first'), ('files', 'series.tar', archive)])
+    read, error = read_files(body[:len(body) // 2], chunk_size=128)
+    assert read[0] == ('a.png', b'first')
+    assert read[-1][0] == 'series.tar' and 'Could not read archive' in read[-1][1]
+    assert error is not None
+
+
+def test_body_without_closing_boundary():
+    # Without the delimiter after it, the last file may have been cut short
+    body = multipart_body([('files', 'a.png', b'first'), ('files', 'b.png', b'second')], close=False)
+    read, error = read_files(body)
+    assert read[0] == ('a.png', b'first')
+    assert read[1][0] == 'b.png' and 'multipart body' in read[1][1]
+    assert 'truncated' in error
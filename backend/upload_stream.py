@@ -0,0 +1,227 @@
+"""Streaming ingestion of multipart scan uploads.
+
+The request body is parsed as it arrives instead of being buffered by werkzeug, so an
+upload is limited per file (UPLOAD_MAX_FILE_SIZE) rather than per request. A part may
+also be a ZIP or TAR archive of slices, whose members are read one at a time and never
+extracted to disk. TAR archives (optionally compressed) are read straight off the
+request; ZIP archives keep their directory at the end, so the archive itself is spooled
+first (in memory up to UPLOAD_ZIP_SPOOL_SIZE, then in a temporary file).
+"""
+import itertools
+import os
+import shutil
+import tarfile
+import zipfile
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from werkzeug.sansio.multipart import MultipartDecoder, Data, Epilogue, Field, File, NeedData
+
+# Largest single scan, whether uploaded directly or inside an archive
+UPLOAD_MAX_FILE_SIZE = int(os.getenv('UPLOAD_MAX_FILE_SIZE', 16 * 1024 * 1024))
+UPLOAD_MAX_ARCHIVE_SIZE = int(os.getenv('UPLOAD_MAX_ARCHIVE_SIZE', 2 * 1024 ** 3))
+UPLOAD_ZIP_SPOOL_SIZE = int(os.getenv('UPLOAD_ZIP_SPOOL_SIZE', 64 * 1024 * 1024))
+# Form fields other than files (patient_id, ...) are small
+MAX_FIELD_SIZE = 64 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+class MalformedUpload(ValueError):
+    """The request body ended early or is not valid multipart data"""
+
+
+class RejectedFile:
+    """Stands in for the stream of a file that was not accepted; reading it raises why"""
+    def __init__(self, reason):
+        self.reason = reason
+
+    def read(self, *args):
+        raise ValueError(self.reason)
+
+
+class PartStream:
+    """Readable body of the current multipart part, pulled from the request on demand"""
+    def __init__(self, reader, limit=None):
+        self.reader = reader
+        self.limit = limit
+        self.size = 0
+        self.done = False
+        self.buffer = bytearray()
+
+    def _fill(self):
+        event = self.reader.next_event()
+        if not isinstance(event, Data):
+            raise MalformedUpload("Malformed multipart body")
+        self.size += len(event.data)
+        if self.limit is not None and self.size > self.limit:
+            raise ValueError(f"File exceeds the {format_size(self.limit)} limit")
+        self.buffer += event.data
+        self.done = not event.more_data
+
+    def read(self, size=-1):
+        while not self.done and (size is None or size < 0 or len(self.buffer) < size):
+            self._fill()
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def drain(self):
+        """Skip the rest of the part"""
+        self.limit = None
+        self.buffer.clear()
+        while not self.done:
+            self._fill()
+            self.buffer.clear()
+
+
+class MultipartReader:
+    """Pull-based parser of a multipart/form-data request body"""
+    def __init__(self, stream, boundary, chunk_size=READ_CHUNK_SIZE):
+        self.stream = stream
+        self.decoder = MultipartDecoder(boundary)
+        self.chunk_size = chunk_size
+
+    def next_event(self):
+        while True:
+            try:
+                event = self.decoder.next_event()
+            except ValueError:
+                # Also how a body that ends before its closing boundary shows up
+                raise MalformedUpload("Malformed or truncated multipart body")
+            if not isinstance(event, NeedData):
+                return event
+            self.decoder.receive_data(self.stream.read(self.chunk_size) or None)
+
+    def parts(self):
+        """Yield (name, filename, value) per part, in order.
+
+        Form fields have filename None and a str value. Files have a PartStream value that
+        is only valid until the next part is requested; whatever is left unread is skipped.
+        """
+        while True:
+            event = self.next_event()
+            if isinstance(event, Epilogue):
+                return
+            if isinstance(event, Field):
+                yield event.name, None, PartStream(self, MAX_FIELD_SIZE).read().decode('utf-8')
+            elif isinstance(event, File):
+                part = PartStream(self)
+                yield event.name, event.filename, part
+                part.drain()
+
+
+def format_size(size):
+    return f"{size / (1024 * 1024):g} MB"
+
+
+def is_archive(filename):
+    name = filename.lower()
+    return name.endswith('.zip') or name.endswith(TAR_EXTENSIONS)
+
+
+def read_capped(stream, filename):
+    """(filename, stream) for a scan, rejected if it is larger than UPLOAD_MAX_FILE_SIZE"""
+    data = stream.read(UPLOAD_MAX_FILE_SIZE + 1)
+    if len(data) > UPLOAD_MAX_FILE_SIZE:
+        return filename, RejectedFile(f"File exceeds the {format_size(UPLOAD_MAX_FILE_SIZE)} limit")
+    return filename, BytesIO(data)
+
+
+def is_member_skipped(name):
+    """Directories and OS metadata (__MACOSX/, .DS_Store, ._*) are not scans"""
+    parts = name.replace('\\', '/').split('/')
+    return name.endswith('/') or '__MACOSX' in parts or os.path.basename(name).startswith('.')
+
+
+def iter_tar_members(part):
+    with tarfile.open(fileobj=part, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile() or is_member_skipped(member.name):
+                continue
+            filename = os.path.basename(member.name)
+            if member.size > UPLOAD_MAX_FILE_SIZE:
+                yield filename, RejectedFile(f"File exceeds the {format_size(UPLOAD_MAX_FILE_SIZE)} limit")
+            else:
+                yield read_capped(archive.extractfile(member), filename)
+
+
+def iter_zip_members(part):
+    with SpooledTemporaryFile(max_size=UPLOAD_ZIP_SPOOL_SIZE) as spool:
+        shutil.copyfileobj(part, spool, READ_CHUNK_SIZE)
+        with zipfile.ZipFile(spool) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or is_member_skipped(info.filename):
+                    continue
+                filename = os.path.basename(info.filename)
+                if info.file_size > UPLOAD_MAX_FILE_SIZE:
+                    yield filename, RejectedFile(f"File exceeds the {format_size(UPLOAD_MAX_FILE_SIZE)} limit")
+                    continue
+                with archive.open(info) as member:
+                    yield read_capped(member, filename)
+
+
+def iter_archive(filename, part):
+    """(filename, stream) for every file in an archive part; a broken archive is one rejected entry"""
+    part.limit = UPLOAD_MAX_ARCHIVE_SIZE
+    members = iter_zip_members(part) if filename.lower().endswith('.zip') else iter_tar_members(part)
+    try:
+        yield from members
+    except Exception as e:
+        yield filename, RejectedFile(f"Could not read archive: {e}")
+
+
+def iter_scan_files(parts, field='files'):
+    """(filename, stream) for every uploaded scan, expanding archives"""
+    for name, filename, part in parts:
+        if name != field or filename is None:
+            continue
+        if is_archive(filename):
+            yield from iter_archive(filename, part)
+        else:
+            try:
+                yield read_capped(part, filename)
+            except ValueError as e:
+                yield filename, RejectedFile(str(e))
+
+
+class ScanFiles:
+    """Iterator over iter_scan_files that ends, rather than raises, at a malformed body.
+
+    The scans received before the body broke off are still processed and stored, so the
+    caller reports them along with error, which is set once the iteration has stopped.
+    """
+    def __init__(self, parts, field='files'):
+        self.files = iter_scan_files(parts, field)
+        self.error = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.files)
+        except MalformedUpload as e:
+            self.error = str(e)
+            raise StopIteration
+
+
+def open_streaming_upload(stream, boundary, field='files'):
+    """Read the form fields sent before the first file of a multipart upload.
+
+    Returns (fields, files): a dict of those fields and a lazy ScanFiles iterator of
+    (filename, stream) pairs for the scans, which reads the rest of the body as it is
+    consumed.
+    """
+    parts = MultipartReader(stream, boundary).parts()
+    fields = {}
+    for name, filename, value in parts:
+        if filename is None:
+            fields[name] = value
+        elif name == field:
+            parts = itertools.chain([(name, filename, value)], parts)
+            break
+    return fields, ScanFiles(parts, field)
@@ -3,23 +3,37 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import datetime
+import uuid
 from PIL import Image
-import numpy as np
-import matplotlib.cm as cm
-import os
-from models.brain_tumor_model import model, GradCAM, transform, device
 from cloudinary_service import cloudinary_service
-import cv2
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
+from visualization import colorize_cam, encode_png, encode_thumbnail, THUMBNAIL_SIZE, THUMBNAIL_QUALITY
+from image_cache import image_cache
 from s3_service import s3_service
-import torch
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, Future
+from inference_batcher import InferenceBatcher, INFERENCE_MICRO_BATCHING, INFERENCE_BATCH_WAIT_MS
+import requests
+from requests.adapters import HTTPAdapter
+
+# torch, the model, cv2 and reportlab are imported by the functions that use them, so
+# importing this module (and every route blueprint) stays fast; see warm_up_model
+
+# Concurrency and timeout for downloading images of older scans into reports
+REPORT_FETCH_WORKERS = int(os.getenv('REPORT_FETCH_WORKERS', 8))
+REPORT_FETCH_TIMEOUT = float(os.getenv('REPORT_FETCH_TIMEOUT', 10))
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+# Threads rendering and encoding the visualizations of analysed scans
+POSTPROCESS_WORKERS = int(os.getenv('POSTPROCESS_WORKERS', 2))
+
+_gradcam_batcher = None
+_gradcam_batcher_lock = threading.Lock()
+
+_postprocess_executor = None
+_postprocess_executor_lock = threading.Lock()
 
 
 def send_credentials_email(email, username, password, patient_name):
@@ -72,60 +86,212 @@ def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'pdf'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS 
 
-def predict_with_gradcam(image_path):
+def warm_up_model():
+    """Load the model and run one batch through it so the first real request does not pay for it.
+
+    Called at startup by inference workers; other processes load the model on first use.
+    """
+    import torch
+    import cv2
+    from models.brain_tumor_model import MODEL_VERSION
+    # Also starts the micro-batching thread
+    _, cams = generate_cams([torch.zeros(3, 224, 224)])
+    # Builds the heatmap colour table
+    colorize_cam(cams[0])
+    from preprocessing import start_decode_pool
+    start_decode_pool()
+    return MODEL_VERSION
+
+def get_gradcam_batcher():
+    """Shared micro-batcher that runs Grad-CAM for concurrent requests together"""
+    global _gradcam_batcher
+    with _gradcam_batcher_lock:
+        if _gradcam_batcher is None:
+            from models.brain_tumor_model import MAX_BATCH_SIZE
+            _gradcam_batcher = InferenceBatcher(run_gradcam_batch, MAX_BATCH_SIZE, INFERENCE_BATCH_WAIT_MS / 1000)
+        return _gradcam_batcher
+
+def inference_stats():
+    """Micro-batching counters of this process, without loading the model"""
+    batcher = _gradcam_batcher
+    stats = batcher.stats() if batcher else {'batches': 0, 'requests': 0, 'images': 0, 'mean_batch_size': 0}
+    stats.update(enabled=INFERENCE_MICRO_BATCHING, max_wait_ms=INFERENCE_BATCH_WAIT_MS)
+    return stats
+
+def run_gradcam_batch(tensors):
+    """(probability, cam) for each image tensor from one forward pass"""
+    import torch
+    from models.brain_tumor_model import gradcam, device
+    probabilities, cams = gradcam.generate_cams(torch.stack(tensors).to(device))
+    return list(zip(probabilities, cams))
+
+def generate_cams(tensors):
+    """Probabilities and CAMs for a list of image tensors, batched with concurrent requests"""
+    if INFERENCE_MICRO_BATCHING:
+        results = get_gradcam_batcher().run(tensors)
+    else:
+        results = run_gradcam_batch(tensors)
+    return [probability for probability, _ in results], [cam for _, cam in results]
+
+def submit_cams(tensors):
+    """Future of the (probability, cam) pairs for a list of image tensors.
+
+    With micro-batching the forward pass runs on the inference thread, so the caller can
+    carry on meanwhile; otherwise it runs before this returns.
+    """
+    if INFERENCE_MICRO_BATCHING:
+        batcher = get_gradcam_batcher()
+        if len(tensors) <= batcher.max_batch_size:
+            return batcher.submit(tensors)
+    future = Future()
+    try:
+        probabilities, cams = generate_cams(tensors)
+        future.set_result(list(zip(probabilities, cams)))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def predict_batch(image_files, max_batch_size=None):
+    """Predict tumor probabilities for several images (paths or streams) using batched forward passes"""
+    from models.brain_tumor_model import predict_probabilities, MAX_BATCH_SIZE
+    from preprocessing import iter_decoded, to_tensor
+    results = [None] * len(image_files)
+    indices = []
+    tensors = []
+    for i, image, error in iter_decoded(image_files, max_batch_size or MAX_BATCH_SIZE):
+        if error is not None:
+            results[i] = {'success': False, 'error': str(error)}
+            continue
+        tensors.append(to_tensor(image))
+        indices.append(i)
+    if tensors:
+        try:
+            probabilities = predict_probabilities(tensors, max_batch_size)
+            for i, probability in zip(indices, probabilities):
+                results[i] = {'success': True, 'probability': float(probability)}
+        except Exception as e:
+            for i in indices:
+                results[i] = {'success': False, 'error': str(e)}
+    return results
+
+def predict_with_gradcam(image_file):
     """Make prediction and generate GradCAM visualization"""
+    return predict_batch_with_gradcam([image_file])[0]
+
+def predict_batch_with_gradcam(image_files, max_batch_size=None):
+    """Make predictions and GradCAM visualizations for several images, one forward pass per batch.
+
+    Each entry may be a path or a readable binary stream such as an uploaded file's stream.
+    """
+    results = [None] * len(image_files)
+    for i, result in iter_predictions_with_gradcam(image_files, max_batch_size):
+        results[i] = result
+    return results
+
+def iter_predictions_with_gradcam(image_files, max_batch_size=None):
+    """Yield (index, result) pairs for several images as soon as each one is finished.
+
+    Images flow through a pipeline with bounded queues: decode workers prepare the next
+    batch while the current one is inferred, and the visualizations and uploads of a batch
+    run while the next one is inferred. Results trail inference by at most one batch, and
+    only about three batches of images are held in memory whatever the number of files.
+    """
+    from models.brain_tumor_model import MAX_BATCH_SIZE
+    from preprocessing import iter_decoded
+    max_batch_size = max_batch_size or MAX_BATCH_SIZE
+    pending = []
+    chunk = []
+    # The 224x224 arrays feed both the model and the visualizations
+    for i, image, error in iter_decoded(image_files, max_batch_size):
+        if error is not None:
+            yield i, {'success': False, 'error': str(error)}
+            continue
+        chunk.append((i, image))
+        if len(chunk) == max_batch_size:
+            pending = yield from infer_batch(chunk, pending)
+            chunk = []
+    if chunk:
+        pending = yield from infer_batch(chunk, pending)
+    for i, probability, visualization in pending:
+        yield i, finish_prediction(probability, visualization)
+
+def infer_batch(chunk, pending):
+    """Infer one batch of (index, array) pairs and queue its visualizations.
+
+    Yields the results of the previously queued batch while this one is inferred, and
+    returns the new queue.
+    """
+    from preprocessing import to_tensor
     try:
-        # Preprocess image
-        image = Image.open(image_path).convert('RGB')
-        image_tensor = transform(image).unsqueeze(0)
-        image_tensor = image_tensor.to(device)
-        
-        # Make prediction
-        with torch.no_grad():
-            output = model(image_tensor)
-            probability = torch.sigmoid(output).item()
-            prediction = 1 if probability >= 0.5 else 0
-            confidence = probability if prediction == 1 else 1 - probability
-        
-        # Generate GradCAM
-        gradcam = GradCAM(model, target_layer_name='backbone.layer4')
-        cam = gradcam.generate_cam(image_tensor)
-        
-        # Create visualizations
-        original_array = np.array(image.resize((224, 224)))
-        
-        # Create heatmap overlay
-        heatmap = cm.jet(cam)[:, :, :3]
-        heatmap = (heatmap * 255).astype(np.uint8)
-        
-        # Create overlay
-        overlay = original_array.copy()
-        overlay = cv2.addWeighted(overlay, 0.6, heatmap, 0.4, 0)
-        
-        # Save images temporarily and upload to Cloudinary
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        temp_dir = "temp_uploads"
-        os.makedirs(temp_dir, exist_ok=True)
-        temp_original_path = os.path.join(temp_dir, f"temp_original_{timestamp}.png")
-        temp_heatmap_path = os.path.join(temp_dir, f"temp_heatmap_{timestamp}.png")
-        temp_overlay_path = os.path.join(temp_dir, f"temp_overlay_{timestamp}.png")
-        
-        Image.fromarray(original_array.astype(np.uint8)).save(temp_original_path)
-        Image.fromarray(heatmap.astype(np.uint8)).save(temp_heatmap_path)
-        Image.fromarray(overlay.astype(np.uint8)).save(temp_overlay_path)
-        
-        # Upload to Cloudinary
-        original_upload = cloudinary_service.upload_image(temp_original_path, folder="brain_tumor_scans/original")
-        heatmap_upload = cloudinary_service.upload_image(temp_heatmap_path, folder="brain_tumor_scans/heatmap")
-        overlay_upload = cloudinary_service.upload_image(temp_overlay_path, folder="brain_tumor_scans/overlay")
-        
-        # Clean up temporary files
-        os.remove(temp_original_path)
-        os.remove(temp_heatmap_path)
-        os.remove(temp_overlay_path)
+        # Prediction and GradCAM share the same forward pass, which may include
+        # images of other requests
+        inference = submit_cams([to_tensor(image) for _, image in chunk])
+    except Exception as e:
+        inference = Future()
+        inference.set_exception(e)
+    # Hand out the previous batch's results while this one is inferred
+    for i, probability, visualization in pending:
+        yield i, finish_prediction(probability, visualization)
+    try:
+        results = inference.result()
+    except Exception as e:
+        for i, _ in chunk:
+            yield i, {'success': False, 'error': str(e)}
+        return []
+    executor = get_postprocess_executor()
+    return [
+        (i, float(probability), executor.submit(submit_visualization_uploads, image, cam))
+        for (i, image), (probability, cam) in zip(chunk, results)
+    ]
+
+def get_postprocess_executor():
+    """Threads that render, encode and queue the uploads of finished scans"""
+    global _postprocess_executor
+    with _postprocess_executor_lock:
+        if _postprocess_executor is None:
+            _postprocess_executor = ThreadPoolExecutor(max_workers=POSTPROCESS_WORKERS, thread_name_prefix="scan-postprocess")
+        return _postprocess_executor
+
+def finish_prediction(probability, visualization):
+    """Wait for a scan's queued visualization and uploads and build its prediction result"""
+    try:
+        upload_futures, thumbnails = visualization.result()
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+    return collect_prediction_result(probability, upload_futures, thumbnails)
+
+def submit_visualization_uploads(original_array, cam):
+    """Render heatmap/overlay images for a 224x224 RGB scan and queue the uploads to Cloudinary.
+
+    Returns the upload futures and JPEG thumbnails of the three images for the PDF report.
+    """
+    import cv2
+    # Create heatmap overlay
+    heatmap = colorize_cam(cam)
+    
+    # Create overlay
+    overlay = original_array.copy()
+    overlay = cv2.addWeighted(overlay, 0.6, heatmap, 0.4, 0)
+    
+    # Encode in memory and hand off to the upload pool
+    upload_futures = [
+        cloudinary_service.submit_upload(encode_png(original_array), folder="brain_tumor_scans/original"),
+        cloudinary_service.submit_upload(encode_png(heatmap), folder="brain_tumor_scans/heatmap"),
+        cloudinary_service.submit_upload(encode_png(overlay), folder="brain_tumor_scans/overlay")
+    ]
+    # Keep small copies so the report does not download what was just uploaded
+    thumbnails = tuple(encode_thumbnail(array) for array in (original_array, heatmap, overlay))
+    return upload_futures, thumbnails
+
+def collect_prediction_result(probability, upload_futures, thumbnails=None):
+    """Wait for a scan's queued uploads and build its prediction result"""
+    try:
+        prediction = 1 if probability >= 0.5 else 0
+        confidence = probability if prediction == 1 else 1 - probability
         
-        # Clean up GradCAM
-        gradcam.remove_hooks()
+        original_upload, heatmap_upload, overlay_upload = [
+            cloudinary_service.wait_for_upload(future) for future in upload_futures
+        ]
         
         if not all([original_upload['success'], heatmap_upload['success'], overlay_upload['success']]):
             return {
@@ -143,7 +309,8 @@ def predict_with_gradcam(image_path):
             'overlay_path': overlay_upload['url'],
             'original_public_id': original_upload['public_id'],
             'heatmap_public_id': heatmap_upload['public_id'],
-            'overlay_public_id': overlay_upload['public_id']
+            'overlay_public_id': overlay_upload['public_id'],
+            'report_images': thumbnails
         }
         
     except Exception as e:
@@ -152,12 +319,67 @@ def predict_with_gradcam(image_path):
             'error': str(e)
         }
 
-def generate_pdf_report(patient_info, scans_data, report_folder):
-    """Generate a PDF report with all results and patient information"""
+def get_http_session():
+    """Shared keep-alive session for image downloads, sized for the fetch pool"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=REPORT_FETCH_WORKERS, pool_maxsize=REPORT_FETCH_WORKERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _http_session = session
+        return _http_session
+
+def thumbnail_cache_key(url):
+    """Image cache key for the report thumbnail of the image at url"""
+    return f"{url}#thumbnail-{THUMBNAIL_SIZE}-q{THUMBNAIL_QUALITY}"
+
+def fetch_image_thumbnail(url):
+    """Return the report thumbnail of an image, from the local cache or else downloaded"""
+    cache_key = thumbnail_cache_key(url)
+    thumbnail = image_cache.get(cache_key)
+    if thumbnail is None:
+        response = get_http_session().get(url, timeout=REPORT_FETCH_TIMEOUT)
+        response.raise_for_status()
+        thumbnail = encode_thumbnail(Image.open(BytesIO(response.content)))
+        image_cache.put(cache_key, thumbnail)
+    return thumbnail
+
+def fetch_scan_images(scans):
+    """Download the original/heatmap/overlay images of several scans concurrently.
+
+    Returns {scan_id: (original, heatmap, overlay)} thumbnails; scans that fail are left out.
+    """
+    images = {}
+    with ThreadPoolExecutor(max_workers=REPORT_FETCH_WORKERS) as pool:
+        futures = {
+            scan['scan_id']: [pool.submit(fetch_image_thumbnail, scan[key]) for key in ('original_path', 'heatmap_path', 'overlay_path')]
+            for scan in scans
+        }
+        for scan_id, scan_futures in futures.items():
+            try:
+                images[scan_id] = tuple(future.result() for future in scan_futures)
+            except Exception as e:
+                print(f"Error fetching images for scan {scan_id}: {e}")
+    return images
+
+def generate_pdf_report(patient_info, scans_data, report_folder, scan_images=None, report_id=None):
+    """Generate a PDF report with all results and patient information.
+
+    scan_images maps scan_id to (original, heatmap, overlay) thumbnail bytes already held in
+    memory; images of any other scan are downloaded. report_id, if given, names the file.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib import colors
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, Table, TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
     try:
-        # Create a unique filename for the report
+        # Unique even for reports generated in the same second by different processes,
+        # as the file name is also the S3 key and the download lookup key
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        report_filename = f"brain_scan_report_{timestamp}.pdf"
+        report_filename = f"brain_scan_report_{timestamp}_{report_id or uuid.uuid4().hex[:8].upper()}.pdf"
         report_path = os.path.join(report_folder, report_filename)
         
         # Create the PDF document
@@ -249,6 +471,22 @@ def generate_pdf_report(patient_info, scans_data, report_folder):
         elements.append(Paragraph(explanation, styles['Normal']))
         elements.append(Spacer(1, 0.25*inch))
         
+        # Reuse the images the scan pipeline kept in memory and fetch only the rest
+        scan_images = dict(scan_images or {})
+        for scan in scans_data:
+            images = scan_images.get(scan.get('scan_id'))
+            if images:
+                # Seed the cache so later reports covering these scans stay local
+                for key, data in zip(('original_path', 'heatmap_path', 'overlay_path'), images):
+                    if scan.get(key):
+                        image_cache.put(thumbnail_cache_key(scan[key]), data)
+        missing = [
+            s for s in scans_data
+            if s.get('scan_id') not in scan_images and all(s.get(key) for key in ('original_path', 'heatmap_path', 'overlay_path'))
+        ]
+        if missing:
+            scan_images.update(fetch_scan_images(missing))
+        
         # Add detailed results for each scan
         elements.append(Paragraph("Detailed Analysis:", styles['Heading2']))
         elements.append(Spacer(1, 0.1*inch))
@@ -277,20 +515,15 @@ def generate_pdf_report(patient_info, scans_data, report_folder):
             ]))
             elements.append(scan_table)
             elements.append(Spacer(1, 0.1*inch))
-            # Add images if available (now using Cloudinary URLs)
+            # Add images if available
             if scan.get('original_path'):
                 img_width = 2*inch
                 img_height = 2*inch
-                try:
-                    import requests
-                    from io import BytesIO
-                    original_response = requests.get(scan['original_path'])
-                    heatmap_response = requests.get(scan['heatmap_path'])
-                    overlay_response = requests.get(scan['overlay_path'])
-                    if original_response.status_code == 200 and heatmap_response.status_code == 200 and overlay_response.status_code == 200:
-                        original_img = RLImage(BytesIO(original_response.content), width=img_width, height=img_height)
-                        heatmap_img = RLImage(BytesIO(heatmap_response.content), width=img_width, height=img_height)
-                        overlay_img = RLImage(BytesIO(overlay_response.content), width=img_width, height=img_height)
+                images = scan_images.get(scan.get('scan_id'))
+                if images:
+                    original_img, heatmap_img, overlay_img = [
+                        RLImage(BytesIO(data), width=img_width, height=img_height) for data in images
+                    ]
                     image_data = [
                         ["Original Scan", "GradCAM Heatmap", "Overlay Visualization"],
                         [original_img, heatmap_img, overlay_img]
@@ -305,8 +538,8 @@ def generate_pdf_report(patient_info, scans_data, report_folder):
                         ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
                     ]))
                     elements.append(image_table)
-                except Exception as e:
-                    elements.append(Paragraph(f"Error loading images: {str(e)}", styles['Normal']))
+                else:
+                    elements.append(Paragraph("Error loading images for this scan", styles['Normal']))
             elements.append(Spacer(1, 0.25*inch))
         # Add disclaimer
         elements.append(Spacer(1, 0.25*inch))
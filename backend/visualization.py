@@ -0,0 +1,45 @@
+import os
+import functools
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+# Longest side and JPEG quality of the scan images embedded in PDF reports
+THUMBNAIL_SIZE = int(os.getenv('REPORT_THUMBNAIL_SIZE', 160))
+THUMBNAIL_QUALITY = int(os.getenv('REPORT_THUMBNAIL_QUALITY', 85))
+
+@functools.lru_cache(maxsize=None)
+def jet_lut():
+    """256-entry uint8 jet lookup table, identical to (cm.jet(x)[:, :, :3] * 255).astype(np.uint8)"""
+    # matplotlib is only needed to build the table, so it is imported on first use
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.cm as cm
+    return (cm.jet(np.arange(256))[:, :3] * 255).astype(np.uint8)
+
+
+def colorize_cam(cam):
+    """Map a [0, 1] CAM to a uint8 RGB jet heatmap via integer LUT indexing"""
+    # Same binning matplotlib uses for float input: floor(x * N), clipped to N - 1.
+    # CAMs are non-negative, so only the upper bound needs clipping.
+    indices = np.minimum(cam * 256, 255).astype(np.uint8)
+    return np.take(jet_lut(), indices, axis=0)
+
+
+def encode_png(array):
+    """Encode a uint8 image array as PNG into an in-memory buffer"""
+    buffer = BytesIO()
+    Image.fromarray(array.astype(np.uint8)).save(buffer, format='PNG')
+    buffer.seek(0)
+    return buffer
+
+
+def encode_thumbnail(image, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """Downscale an image array or PIL image and encode it as JPEG bytes for a report"""
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(np.asarray(image).astype(np.uint8))
+    image = image.convert('RGB')
+    image.thumbnail((size, size))
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()